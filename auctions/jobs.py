@@ -0,0 +1,31 @@
+"""
+Background jobs for auctions, run by the run_jobs worker.
+"""
+from codesy.base import jobs
+from codesy.base.models import Job
+
+from .models import Claim
+
+
+class PayoutIncomplete(Exception):
+    pass
+
+
+def payout_job_key(claim):
+    return 'payout-%s' % claim.id
+
+
+def queue_payout(claim):
+    return jobs.enqueue('payout', payout_job_key(claim), claim_id=claim.id)
+
+
+def payout_job(claim):
+    return Job.objects.filter(key=payout_job_key(claim)).first()
+
+
+@jobs.handler('payout')
+def payout(job, claim_id):
+    claim = Claim.objects.get(id=claim_id)
+    if not claim.payout(progress=job.set_progress):
+        raise PayoutIncomplete(
+            "Not every offer for claim %s was paid" % claim_id)
@@ -0,0 +1,189 @@
+"""
+Bulk loaders that gather everything a page needs in a fixed number of
+queries, instead of letting the template query per row.
+"""
+import calendar
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import (ACTIVITY_CACHE_KEY, Bid, Claim, Offer,
+                     active_issue_cache_key)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class BidRow(object):
+    """
+    A bid with its latest offer and the claims on its issue.
+    """
+    def __init__(self, bid, last_offer=None, own_claim=None,
+                 other_claims=None):
+        self.bid = bid
+        self.last_offer = last_offer
+        self.own_claim = own_claim
+        self.other_claims = other_claims or []
+
+    @property
+    def offer_fees(self):
+        if self.last_offer:
+            return self.last_offer.fees_sum
+
+
+def load_bid_rows(user):
+    """
+    Rows for all of user's bids, newest first, in three queries.
+    """
+    bids = list(
+        Bid.objects.filter(user=user)
+                   .select_related('issue')
+                   .order_by('-created')
+    )
+    if not bids:
+        return []
+
+    last_offers = {}
+    offers = (
+        Offer.objects.filter(bid__in=bids)
+                     .annotate(fees_sum=Sum('offer_fees__amount'))
+                     .order_by('modified', 'id')
+    )
+    for offer in offers:
+        last_offers[offer.bid_id] = offer
+
+    own_claims = {}
+    other_claims = defaultdict(list)
+    issue_ids = set(bid.issue_id for bid in bids if bid.issue_id)
+    for claim in Claim.objects.filter(issue__in=issue_ids).order_by('id'):
+        if claim.user_id == user.id:
+            own_claims[claim.issue_id] = claim
+        else:
+            other_claims[claim.issue_id].append(claim)
+
+    return [
+        BidRow(
+            bid,
+            last_offer=last_offers.get(bid.id),
+            own_claim=own_claims.get(bid.issue_id),
+            other_claims=other_claims.get(bid.issue_id),
+        )
+        for bid in bids
+    ]
+
+
+def encode_cursor(bid):
+    modified = bid.modified.astimezone(timezone.utc)
+    micros = (calendar.timegm(modified.utctimetuple()) * 10 ** 6 +
+              modified.microsecond)
+    return '%s.%s' % (micros, bid.id)
+
+
+def decode_cursor(cursor):
+    """
+    Returns (modified, id) from a cursor; raises ValueError if it's garbled
+    or OverflowError if its time is out of range.
+    """
+    micros, bid_id = cursor.split('.')
+    return EPOCH + timedelta(microseconds=int(micros)), int(bid_id)
+
+
+def load_activity_page(cursor=None, page_size=50):
+    """
+    One page of all bids, most recently modified first, and the cursor for
+    the next page (None on the last page).
+
+    Pages are keyed on (modified, id) rather than offsets, so every page
+    costs the same no matter how deep it is. The first page is cached
+    until a bid is saved.
+    """
+    if cursor is None:
+        cached = cache.get(ACTIVITY_CACHE_KEY)
+        if cached is not None and cached[0] == page_size:
+            return cached[1]
+
+    bids = Bid.objects.select_related('issue').order_by('-modified', '-id')
+    if cursor is not None:
+        modified, bid_id = decode_cursor(cursor)
+        bids = bids.filter(
+            Q(modified__lt=modified) | Q(modified=modified, id__lt=bid_id)
+        )
+    bids = list(bids[:page_size + 1])
+
+    next_cursor = None
+    if len(bids) > page_size:
+        bids = bids[:page_size]
+        next_cursor = encode_cursor(bids[-1])
+
+    page = (bids, next_cursor)
+    if cursor is None:
+        cache.set(ACTIVITY_CACHE_KEY, (page_size, page),
+                  settings.ACTIVITY_CACHE_TIMEOUT)
+    return page
+
+
+class BidStatus(object):
+    """
+    Everything the add-on widget shows for one user on one url.
+    """
+    def __init__(self, url, bid=None, ask_met=False, active_issue=False,
+                 own_claim=None, claims=None):
+        self.url = url
+        self.bid = bid
+        self.ask_met = ask_met
+        self.active_issue = active_issue
+        self.own_claim = own_claim
+        self.claims = claims or []
+
+
+def any_bids_exist(url):
+    """
+    Whether anyone has bid on url, cached for ACTIVE_ISSUE_CACHE_TIMEOUT or
+    until the first bid on it is saved.
+    """
+    key = active_issue_cache_key(url)
+    exists = cache.get(key)
+    if exists is None:
+        exists = Bid.objects.filter(url=url).exists()
+        cache.set(key, exists, settings.ACTIVE_ISSUE_CACHE_TIMEOUT)
+    return exists
+
+
+def load_bid_status(user, url):
+    """
+    The widget state for user on url in at most two queries: the user's bid
+    with the url's offer total and bid count, then the open claims on its
+    issue. Users without a bid only need the cached "any bids" bit.
+    """
+    bid = (
+        Bid.objects.with_url_totals()
+                   .select_related('issue')
+                   .filter(user=user, url=url)
+                   .first()
+    )
+    if bid is None:
+        return BidStatus(url, active_issue=any_bids_exist(url))
+
+    other_offers = (bid.url_offer_total or 0) - bid.offer
+    status = BidStatus(
+        url,
+        bid=bid,
+        ask_met=bool(bid.ask) and other_offers >= bid.ask,
+        active_issue=bid.url_bid_count > 1,
+    )
+    if bid.issue_id is None:
+        return status
+
+    # rejected claims should be ignored so new claims can be made
+    status.claims = list(
+        Claim.objects.filter(issue_id=bid.issue_id)
+                     .exclude(status='Rejected')
+                     .order_by('modified', 'id')
+    )
+    own_claims = [c for c in status.claims if c.user_id == user.id]
+    if own_claims:
+        status.own_claim = own_claims[0]
+    return status
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from auctions.models import Bid, Claim, Issue
+from auctions.titles import get_pool, pooled_store_title
+
+
+class Command(BaseCommand):
+    help = "Fetch titles for bids, issues and claims that don't have one"
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model, url_field in ((Bid, 'url'),
+                                 (Issue, 'url'),
+                                 (Claim, 'evidence')):
+            missing = model.objects.filter(title__isnull=True)
+            for pk, url in missing.values_list('id', url_field):
+                jobs.append((model, pk, url))
+
+        get_pool().map(lambda job: pooled_store_title(*job), jobs)
+        self.stdout.write('Checked titles for %s rows' % len(jobs))
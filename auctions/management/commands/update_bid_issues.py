@@ -5,5 +5,7 @@ from auctions.utils import update_bid_issues, update_issue_states
 
 class Command(BaseCommand):
     def handle(self, *args, **options):
-        update_bid_issues()
-        update_issue_states()
+        stats = update_bid_issues()
+        update_issue_states(stats=stats)
+        self.stdout.write("update_bid_issues: %(api_calls)s API calls" %
+                          stats)
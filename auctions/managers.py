@@ -1,4 +1,62 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import (Count, DecimalField, Exists, F, IntegerField,
+                              OuterRef, Q, Subquery, Sum)
+from django.utils import timezone
+
+
+class BidManager(models.Manager):
+    def with_url_totals(self):
+        """
+        Annotate each bid with the number of bids and the sum of all offers
+        on its url, computed in the same query.
+        """
+        on_url = (
+            self.get_queryset()
+            .filter(url=OuterRef('url'))
+            .order_by()
+            .values('url')
+        )
+        return self.get_queryset().annotate(
+            url_offer_total=Subquery(
+                on_url.annotate(total=Sum('offer')).values('total'),
+                output_field=DecimalField()
+            ),
+            url_bid_count=Subquery(
+                on_url.annotate(count=Count('id')).values('count'),
+                output_field=IntegerField()
+            ),
+        )
+
+    def unnotified_asks_met(self, url):
+        """
+        Asks on url that haven't been notified and are now covered by the
+        other bidders' offers, found in a single query.
+
+        A bid's ask is met when the offers of everyone else on the url add up
+        to it, i.e. when ask + own offer <= total offers on the url.
+        """
+        return (
+            self.with_url_totals()
+            .filter(url=url, ask_match_sent=None, ask__gt=0)
+            .filter(url_offer_total__gte=F('ask') + F('offer'))
+        )
+
+
+def _sum_by(queryset, group_by, field):
+    """
+    A Subquery of the sum of field over queryset, which must already be
+    filtered down to one group_by value with OuterRef.
+    """
+    return Subquery(
+        queryset.order_by()
+                .values(group_by)
+                .annotate(total=Sum(field))
+                .values('total'),
+        output_field=DecimalField()
+    )
 
 
 class ClaimManager(models.Manager):
@@ -6,3 +64,99 @@ class ClaimManager(models.Manager):
         return super(ClaimManager, self).get_queryset().filter(
             vote__user=user
         )
+
+    def with_financials(self):
+        """
+        Annotate each claim with the sum of its successful payouts
+        (payouts_total), the fees on them (payout_fees_total) and the
+        claimant's ask (claimant_ask), all in the same query. Claim's
+        sum_payouts, sum_fees and sum_credits use these when present.
+        """
+        Payout = self.model._meta.get_field('payouts').related_model
+        PayoutFee = Payout._meta.get_field('payout_fees').related_model
+        Issue = self.model._meta.get_field('issue').related_model
+        Bid = Issue._meta.get_field('bid').related_model
+        return self.get_queryset().annotate(
+            payouts_total=_sum_by(
+                Payout.objects.filter(claim=OuterRef('pk'),
+                                      api_success=True),
+                'claim', 'charge_amount'
+            ),
+            payout_fees_total=_sum_by(
+                PayoutFee.objects.filter(payout__claim=OuterRef('pk'),
+                                         payout__api_success=True),
+                'payout__claim', 'amount'
+            ),
+            claimant_ask=Subquery(
+                Bid.objects.filter(user=OuterRef('user'),
+                                   issue=OuterRef('issue'))
+                           .values('ask')[:1],
+                output_field=DecimalField()
+            ),
+        )
+
+
+class PayoutManager(models.Manager):
+    def with_totals(self):
+        """
+        Annotate each payout with the sum of its fees (fees_total) and
+        credits (credits_total), in the same query.
+        """
+        PayoutFee = self.model._meta.get_field('payout_fees').related_model
+        PayoutCredit = self.model._meta.get_field(
+            'payout_credit').related_model
+        return self.get_queryset().annotate(
+            fees_total=_sum_by(
+                PayoutFee.objects.filter(payout=OuterRef('pk')),
+                'payout', 'amount'
+            ),
+            credits_total=_sum_by(
+                PayoutCredit.objects.filter(payout=OuterRef('pk')),
+                'payout', 'amount'
+            ),
+        )
+
+
+class IssueManager(models.Manager):
+    def due_for_refresh(self, now=None):
+        """
+        Issues whose GitHub state should be checked again, most urgent first.
+
+        Open issues with live offers or undecided claims are checked every
+        ISSUE_REFRESH_ACTIVE_HOURS, other open issues every
+        ISSUE_REFRESH_IDLE_HOURS, and closed ones and those GitHub couldn't
+        find (still 'unknown' after a lookup) only every
+        ISSUE_REFRESH_CLOSED_HOURS. Issues that have never been looked up
+        are always due.
+        """
+        now = now or timezone.now()
+        Bid = self.model._meta.get_field('bid').related_model
+        Claim = self.model._meta.get_field('claim').related_model
+
+        def checked_before(hours):
+            return Q(last_fetched__lt=now - timedelta(hours=hours))
+
+        settled = Q(state__iexact='closed') | Q(state='unknown')
+        active = Q(has_live_offers=True) | Q(has_open_claims=True)
+        return (
+            self.get_queryset()
+            .annotate(
+                has_live_offers=Exists(
+                    Bid.objects.filter(issue=OuterRef('pk'), offer__gt=0)
+                ),
+                has_open_claims=Exists(
+                    Claim.objects.filter(issue=OuterRef('pk'),
+                                         status__in=['Submitted', 'Pending'])
+                ),
+            )
+            .filter(
+                Q(last_fetched=None) |
+                (~settled & active &
+                 checked_before(settings.ISSUE_REFRESH_ACTIVE_HOURS)) |
+                (~settled &
+                 checked_before(settings.ISSUE_REFRESH_IDLE_HOURS)) |
+                checked_before(settings.ISSUE_REFRESH_CLOSED_HOURS)
+            )
+            .order_by('-has_live_offers', '-has_open_claims',
+                      F('last_fetched').asc(nulls_first=True), 'id')
+        )
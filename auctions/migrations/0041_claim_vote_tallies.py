@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.12 on 2026-10-18 18:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def count_votes(apps, schema_editor):
+    Bid = apps.get_model('auctions', 'Bid')
+    Claim = apps.get_model('auctions', 'Claim')
+    Vote = apps.get_model('auctions', 'Vote')
+    for claim in Claim.objects.all():
+        votes = Vote.objects.filter(claim=claim).exclude(user=claim.user_id)
+        Claim.objects.filter(id=claim.id).update(
+            num_approvals=votes.filter(approved=True).count(),
+            num_rejections=votes.filter(approved=False).count(),
+            num_eligible_voters=(
+                Bid.objects.filter(issue=claim.issue_id, offer__gt=0)
+                           .exclude(user=claim.user_id)
+                           .count()
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0040_auto_20161030_2248'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claim',
+            name='num_approvals',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='claim',
+            name='num_eligible_voters',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='claim',
+            name='num_rejections',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.12 on 2026-10-18 18:55
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0041_claim_vote_tallies'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='bid',
+            index_together=set([('modified', 'id')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.12 on 2026-10-18 18:59
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0042_bid_modified_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='issue',
+            name='last_fetched',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.12 on 2026-10-18 19:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0043_issue_last_fetched_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payout',
+            name='offer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='auctions.Offer'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='payout',
+            unique_together=set([('claim', 'offer')]),
+        ),
+    ]
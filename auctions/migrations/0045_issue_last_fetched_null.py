@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.12 on 2026-10-18 20:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def unfetch_unknown_issues(apps, schema_editor):
+    # last_fetched used to be set on every save, so 'unknown' issues may
+    # never have been looked up; check each of them once more
+    Issue = apps.get_model('auctions', 'Issue')
+    Issue.objects.filter(state='unknown').update(last_fetched=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0044_payout_offer'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='issue',
+            name='last_fetched',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(unfetch_unknown_issues,
+                             migrations.RunPython.noop),
+    ]
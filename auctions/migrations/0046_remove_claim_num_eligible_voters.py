@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.12 on 2026-10-18 20:46
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0045_issue_last_fetched_null'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='claim',
+            name='num_eligible_voters',
+        ),
+    ]
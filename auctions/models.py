@@ -1,28 +1,38 @@
+import hashlib
+import logging
 import uuid
-import requests
-import re
-import HTMLParser
+from collections import defaultdict
 from decimal import Decimal
 
 from datetime import timedelta
 from django.utils import timezone
 
 from django.conf import settings
-from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import F, Sum
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.template.loader import get_template
 
+from codesy.base import outbox
 
-from mailer import send_mail
-
-from .managers import ClaimManager
+from .managers import BidManager, ClaimManager, IssueManager, PayoutManager
+from . import titles
 
 import payments.utils as payments
 
+logger = logging.getLogger(__name__)
+
+
+# cache key of the first page of ActivityList, see auctions.loaders
+ACTIVITY_CACHE_KEY = 'auctions-activity-first-page'
+
+
+def active_issue_cache_key(url):
+    return 'auctions-active-issue-%s' % hashlib.md5(
+        url.encode('utf-8')).hexdigest()
+
 
 def uuid_please():
     full_uuid = uuid.uuid4()
@@ -43,8 +53,11 @@ class Bid(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    objects = BidManager()
+
     class Meta:
         unique_together = (("user", "url"),)
+        index_together = (("modified", "id"),)
 
     def __unicode__(self):
         return u'%s bid on %s' % (self.user, self.url)
@@ -66,7 +79,7 @@ class Bid(models.Model):
     @property
     def last_offer(self):
         try:
-            return Offer.objects.filter(bid=self).order_by('modified')[:1][0]
+            return Offer.objects.filter(bid=self).order_by('-modified')[:1][0]
         except IndexError:
             return None
 
@@ -146,25 +159,36 @@ class Bid(models.Model):
 
 @receiver(post_save, sender=Bid)
 def notify_matching_askers(sender, instance, **kwargs):
-    email_template = get_template('../templates/email/ask_met.html')
-    unnotified_asks = Bid.objects.filter(
-        url=instance.url, ask_match_sent=None).exclude(ask__lte=0)
-
-    for bid in unnotified_asks:
-        if bid.ask_met():
-            email_context = {'ask': bid.ask, 'url': bid.url}
-            subject = (
-                "[codesy] There's $%(ask)d waiting for you!" % email_context
-            )
-            message = email_template.render(email_context)
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [bid.user.email]
-            )
-            # use .update to avoid recursive signal processing
-            Bid.objects.filter(id=bid.id).update(ask_match_sent=timezone.now())
+    met_asks = list(
+        Bid.objects.unnotified_asks_met(instance.url)
+        .select_related('user')
+        .order_by('id')
+    )
+    if not met_asks:
+        return
+
+    notifications = []
+    for bid in met_asks:
+        notifications.append(outbox.notification(
+            'ask-met-%s' % bid.id,
+            'email/ask_met.html',
+            "[codesy] There's $%d waiting for you!" % bid.ask,
+            bid.user.email,
+            ask=str(bid.ask),
+            url=bid.url,
+        ))
+    outbox.queue(notifications)
+    # use .update to avoid recursive signal processing
+    Bid.objects.filter(
+        id__in=[bid.id for bid in met_asks]
+    ).update(ask_match_sent=timezone.now())
+
+
+@receiver(post_save, sender=Bid)
+def expire_activity_cache(sender, instance, created, **kwargs):
+    cache.delete(ACTIVITY_CACHE_KEY)
+    if created:
+        cache.delete(active_issue_cache_key(instance.url))
 
 
 @receiver(post_save, sender=Bid)
@@ -181,7 +205,10 @@ class Issue(models.Model):
     url = models.URLField(unique=True, db_index=True)
     title = models.CharField(max_length=255, null=True, blank=True)
     state = models.CharField(max_length=255)
-    last_fetched = models.DateTimeField(auto_now=True)
+    # null until the issue's state has been looked up
+    last_fetched = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = IssueManager()
 
     def __unicode__(self):
         return u'%s (%s)' % (self.url, self.state)
@@ -205,6 +232,11 @@ class Claim(models.Model):
     status = models.CharField(max_length=255,
                               choices=STATUS_CHOICES,
                               default='Submitted')
+    # vote tallies, kept up to date by update_claim_status
+    num_approvals = models.PositiveIntegerField(default=0, editable=False)
+    num_rejections = models.PositiveIntegerField(default=0, editable=False)
+
+    TALLY_FIELDS = ('num_approvals', 'num_rejections')
 
     objects = ClaimManager()
 
@@ -222,6 +254,13 @@ class Claim(models.Model):
 
     def save(self, *args, **kwargs):
         is_new = not self.pk
+        if not is_new and 'update_fields' not in kwargs:
+            # tallies are only changed with F() updates; a full save from a
+            # stale instance must not overwrite them
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.TALLY_FIELDS
+            ]
         super(Claim, self).save(*args, **kwargs)
         if is_new:
             # refund any authorize offers by this user
@@ -234,57 +273,144 @@ class Claim(models.Model):
             for offer in users_offers:
                 payments.refund(offer)
 
-    def payout(self):
-        try:
-            # get all authorized offers for this issue
-            valid_offers = Offer.objects.filter(
-                bid__issue=self.issue,
-                charge_id__isnull=False,
-                refund_id=u'',
-            ).exclude(
-                user=self.user
+    def prepare_payouts(self):
+        """
+        One Payout for each authorized offer on the issue.
+
+        The first call works out each offer's share and writes all of the
+        Payouts, their adjusted Offers and fee rows in bulk. Later calls
+        return the same Payouts, so a retried payout pays the same offers.
+        """
+        with transaction.atomic():
+            # one payout run per claim at a time
+            Claim.objects.select_for_update().filter(id=self.id).first()
+            payouts = list(
+                self.payouts.exclude(offer=None)
+                            .select_related('offer__user', 'offer__bid')
+                            .order_by('id')
             )
+            if payouts:
+                return payouts
+
+            valid_offers = list(
+                Offer.objects.filter(bid__issue=self.issue, refund_id=u'')
+                             .exclude(charge_id=u'')
+                             .exclude(user=self.user)
+                             .select_related('user', 'bid')
+                             .order_by('id')
+            )
+            if not valid_offers:
+                return []
             # check on a surplus
-            # TODO: move this to the payments utils
-            sum_offers = valid_offers.aggregate(Sum('amount'))['amount__sum']
+            sum_offers = sum(offer.amount for offer in valid_offers)
             users_ask = self.ask
             offer_adjustment = 1
             if sum_offers > users_ask:
                 # surplus is the amount of offers over ask
                 surplus = sum_offers - users_ask
                 # the claim bonus is the claimaints share of the surplus
-                claim_bonus = (surplus / (valid_offers.count() + 1))
+                claim_bonus = (surplus / (len(valid_offers) + 1))
                 # giveback is the aount to distribute among the offerers
                 offer_giveback = surplus - claim_bonus
                 # this is the percent of the original payout to be charged
                 offer_adjustment = 1 - (offer_giveback / sum_offers)
 
+            new_offers = []
+            payouts = []
             for offer in valid_offers:
-                adjusted_offer_amount = (offer.amount * offer_adjustment)
+                # rounded now, so a retry that reloads the payout charges
+                # exactly what the first attempt did
+                adjusted_offer_amount = payments.round_penny(
+                    offer.amount * offer_adjustment)
                 discount_amount = offer.amount - adjusted_offer_amount
-                payments.refund(offer)
-                # create final adjusted offer
-                new_offer = Offer(
+                key = '%s-%s' % (self.id, offer.id)
+                # final adjusted offer
+                new_offers.append(Offer(
                     user=offer.user,
                     bid=offer.bid,
                     amount=adjusted_offer_amount,
-                    discount=discount_amount
-                )
-                new_offer.save()
-                # capture payment to this users account
-                payout = Payout(
+                    discount=discount_amount,
+                    transaction_key='payout-offer-%s' % key,
+                ))
+                payouts.append(Payout(
                     user=offer.user,
                     claim=self,
+                    offer=offer,
                     amount=adjusted_offer_amount,
-                    discount=discount_amount
-                )
-                payout.save()
+                    discount=discount_amount,
+                    transaction_key='payout-%s' % key,
+                ))
+            Offer.bulk_create_with_fees(new_offers)
+            return Payout.bulk_create_with_fees(payouts)
 
-                payments.charge(offer, payout)
-            return True
-        except Exception as e:
-            print 'payout error: %s' % e.message
+    def payout(self, progress=None):
+        """
+        Pay the claimant from every authorized offer on the issue.
+
+        Each offer's authorization is refunded and the offerer charged for
+        their share, on PAYOUT_WORKERS threads. Results are saved on each
+        Payout as they come in; calling payout again only retries the
+        offers that failed, and Stripe's idempotency keys stop a retry
+        from charging twice. Only failures like timeouts and connection
+        errors are worth retrying: Stripe replays a declined charge's
+        result for the same key for 24 hours. progress, if given, is called
+        with a short status message as offers are paid.
+
+        Returns True once every offer has been paid.
+        """
+        payouts = self.prepare_payouts()
+        pending = [payout for payout in payouts if not payout.api_success]
+        by_key = dict((payout.transaction_key, payout) for payout in pending)
+        paid = len(payouts) - len(pending)
+        if progress:
+            progress('%s of %s offers paid' % (paid, len(payouts)))
+
+        destination = self.user.account().account_id
+        jobs = [
+            payments.PayoutJob(
+                key=payout.transaction_key,
+                customer=payout.offer.user.stripe_customer,
+                destination=destination,
+                amount=payout.amount,
+                description="Payout for: " + payout.offer.bid.url,
+                metadata={'bid_id': payout.offer.bid_id},
+                authorization_id=payout.offer.charge_id,
+                refund_id=payout.offer.refund_id,
+            )
+            for payout in pending
+        ]
+        for job in payments.run_stripe_jobs(jobs):
+            payout = by_key[job.key]
+            # use .update so one offer's results are saved in one query
+            offer_results = {
+                'refund_id': job.refund_id,
+                'error_message': job.error_message[:255],
+            }
+            if job.charge_id:
+                offer_results.update(api_success=True,
+                                     charge_id=job.charge_id)
+            Offer.objects.filter(id=payout.offer_id).update(**offer_results)
+            if job.charge_id:
+                Payout.objects.filter(id=payout.id).update(
+                    api_success=True,
+                    charge_id=job.charge_id,
+                    error_message=u'',
+                )
+                paid += 1
+                if progress:
+                    progress('%s of %s offers paid' % (paid, len(payouts)))
+            else:
+                Payout.objects.filter(id=payout.id).update(
+                    error_message=job.error_message[:255])
+                logger.error("Payout %s failed: %s" %
+                             (payout.transaction_key, job.error_message))
+
+        if paid < len(payouts):
             return False
+        if self.status != 'Paid':
+            self.status = 'Paid'
+            self.save()
+        return True
 
     def payouts(self):
         return Payout.objects.filter(claim=self)
@@ -292,23 +418,40 @@ class Claim(models.Model):
     def successful_payouts(self):
         return Payout.objects.filter(claim=self, api_success=True)
 
+    FINANCIAL_FIELDS = ('payouts_total', 'payout_fees_total', 'claimant_ask')
+
+    def financials(self):
+        """
+        The claim's payout, fee and ask totals: from the with_financials()
+        annotations when this claim was loaded with them, otherwise in one
+        query.
+        """
+        if hasattr(self, 'payouts_total'):
+            return dict(
+                (field, getattr(self, field))
+                for field in self.FINANCIAL_FIELDS
+            )
+        return (
+            Claim.objects.with_financials()
+                         .filter(id=self.id)
+                         .values(*self.FINANCIAL_FIELDS)
+                         .get()
+        )
+
     @property
     def sum_payouts(self):
-        return (
-            self.successful_payouts()
-            .aggregate(Sum('charge_amount'))['charge_amount__sum'])
+        return self.financials()['payouts_total']
 
     @property
     def sum_fees(self):
-        sum_of = 0
-        for payout in self.successful_payouts():
-            sum_of += payout.sum_fees
-        return sum_of
+        return self.financials()['payout_fees_total'] or 0
 
     @property
     def sum_credits(self):
         # these are the claim credits not payout credits!
-        return self.sum_payouts - self.ask + self.sum_fees
+        financials = self.financials()
+        return (financials['payouts_total'] - financials['claimant_ask'] +
+                (financials['payout_fees_total'] or 0))
 
     def votes_by_approval(self, approved):
         return (Vote.objects
@@ -328,17 +471,25 @@ class Claim(models.Model):
                 return True
         return False
 
-    @property
-    def num_approvals(self):
-        return self.votes_by_approval(True).count()
-
-    @property
-    def num_rejections(self):
-        return self.votes_by_approval(False).count()
-
     @property
     def num_votes(self):
-        return Vote.objects.filter(claim=self).exclude(user=self.user)
+        return self.num_approvals + self.num_rejections
+
+    def resolve_status(self, eligible_voters):
+        """
+        The status the current vote tallies call for, given the number of
+        offerers who can vote now (see offers).
+        """
+        status = self.status
+        if self.num_votes > 0:
+            status = 'Pending'
+        if self.num_approvals >= eligible_voters:
+            status = 'Approved'
+        if eligible_voters > 0:
+            rejected = self.num_rejections / float(eligible_voters)
+            if rejected >= 0.5:
+                status = 'Rejected'
+        return status
 
     @property
     def offers(self):
@@ -366,33 +517,27 @@ def notify_matching_offerers(sender, instance, created, **kwargs):
     if not created:
         return True
 
-    email_template = get_template('../templates/email/claim_notify.html')
-
-    current_site = Site.objects.get_current()
-
     self_Q = models.Q(user=instance.user)
     offered0_Q = models.Q(offer=0)
     others_bids = Bid.objects.filter(
         issue=instance.issue
     ).exclude(
         self_Q | offered0_Q
-    )
+    ).select_related('user')
 
-    for bid in others_bids:
-        email_context = ({
-            'user': instance.user,
-            'url': instance.issue.url,
-            'offer': bid.offer,
-            'site': current_site,
-            'claim_link': instance.get_absolute_url(),
-        })
-        message = email_template.render(email_context)
-        send_mail(
+    outbox.queue([
+        outbox.notification(
+            'claim-notify-%s-%s' % (instance.id, bid.user_id),
+            'email/claim_notify.html',
             "[codesy] A claim needs your vote!",
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [bid.user.email]
+            bid.user.email,
+            user=instance.user.username,
+            url=instance.issue.url,
+            offer=str(bid.offer),
+            claim_link=instance.get_absolute_url(),
         )
+        for bid in others_bids
+    ])
 
 
 @receiver(post_save, sender=Bid)
@@ -404,14 +549,8 @@ def save_title(sender, instance, **kwargs):
     else:
         url = instance.url
 
-    try:
-        r = requests.get(url)
-        title_search = re.search('(?:<title.*>)(.*)(?:<\/title>)', r.text)
-        if title_search:
-            title = HTMLParser.HTMLParser().unescape(title_search.group(1))
-            type(instance).objects.filter(id=instance.id).update(title=title)
-    except:
-        pass
+    # fetched after commit so the request never waits on the remote page
+    titles.queue_title(type(instance), instance.id, url)
 
 
 class Vote(models.Model):
@@ -430,63 +569,84 @@ class Vote(models.Model):
             self.claim, self.user, self.approved
         )
 
-
-@receiver(post_save, sender=Vote)
-def update_claim_status(sender, instance, created, **kwargs):
-    claim = instance.claim
-    offers_needed = claim.offers.count()
-
-    if claim.num_votes > 0:
-        claim.status = "Pending"
-        claim.save()
-
-    if claim.num_approvals == offers_needed:
-        claim.status = "Approved"
-        claim.save()
-
-    if offers_needed > 0:
-        if (claim.num_rejections / float(offers_needed)) >= 0.5:
-            claim.status = "Rejected"
-            claim.save()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Vote, cls).from_db(db, field_names, values)
+        if 'approved' in field_names:
+            # remembered so update_claim_status can tell how a vote changed
+            instance._loaded_approved = instance.approved
+        return instance
 
 
 @receiver(post_save, sender=Vote)
-def notify_approved_claim(sender, instance, created, **kwargs):
+def update_claim_status(sender, instance, created, **kwargs):
     claim = instance.claim
-    votes_needed = claim.offers.count()
-
-    if claim.num_rejections == votes_needed:
-        email_template = get_template('../templates/email/claim_reject.html')
-
-        current_site = Site.objects.get_current()
-        email_context = ({
-            'url': claim.issue.url,
-            'site': current_site,
-        })
-        message = email_template.render(email_context)
-        send_mail(
+    if instance.user_id == claim.user_id:
+        # the claimant's own vote isn't counted
+        return
+
+    previous = None if created else getattr(instance, '_loaded_approved', None)
+    if not created and previous is None:
+        # an updated vote that wasn't loaded from the db: recount
+        tally = {
+            'num_approvals': claim.votes_by_approval(True).count(),
+            'num_rejections': claim.votes_by_approval(False).count(),
+        }
+    elif previous == instance.approved:
+        return
+    else:
+        if instance.approved:
+            voted, unvoted = 'num_approvals', 'num_rejections'
+        else:
+            voted, unvoted = 'num_rejections', 'num_approvals'
+        tally = {voted: F(voted) + 1}
+        if previous is not None:
+            tally[unvoted] = F(unvoted) - 1
+    Claim.objects.filter(id=claim.id).update(**tally)
+    instance._loaded_approved = instance.approved
+
+    claim = Claim.objects.select_related('user', 'issue').get(id=claim.id)
+    # counted on every vote: offers can start or grow after the claim
+    eligible_voters = claim.offers.count()
+    status = claim.resolve_status(eligible_voters)
+    if status != claim.status:
+        Claim.objects.filter(id=claim.id).update(
+            status=status, modified=timezone.now())
+        claim.status = status
+    notify_approved_claim(claim, eligible_voters)
+
+
+def notify_approved_claim(claim, votes_needed):
+    notifications = []
+    if votes_needed > 0 and claim.num_rejections >= votes_needed:
+        notifications.append(outbox.notification(
+            'claim-rejected-%s' % claim.id,
+            'email/claim_reject.html',
             "[codesy] Your claim has been rejected",
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [claim.user.email]
-        )
-
-    if votes_needed == claim.num_approvals:
-        email_template = get_template('../templates/email/claim_approved.html')
+            claim.user.email,
+            url=claim.issue.url,
+        ))
+
+    if claim.num_approvals >= votes_needed:
+        notifications.append(outbox.notification(
+            'claim-approved-%s' % claim.id,
+            'email/claim_approved.html',
+            "[codesy] Your claim has been approved",
+            claim.user.email,
+            url=claim.issue.url,
+        ))
+    outbox.queue(notifications)
 
-        current_site = Site.objects.get_current()
-        email_context = ({
-            'url': claim.issue.url,
-            'site': current_site,
-        })
-        message = email_template.render(email_context)
 
-        send_mail(
-            "[codesy] Your claim has been approved",
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [claim.user.email]
-        )
+def create_fee_rows(rows):
+    """
+    Insert fee and credit rows with one bulk_create per fee model.
+    """
+    by_model = defaultdict(list)
+    for row in rows:
+        by_model[type(row)].append(row)
+    for fee_model, model_rows in by_model.items():
+        fee_model.objects.bulk_create(model_rows)
 
 
 class Payment(models.Model):
@@ -514,15 +674,54 @@ class Payment(models.Model):
         abstract = True
 
     def save(self, *args, **kwargs):
-        is_new = not self.pk
-        super(Payment, self).save(*args, **kwargs)
-        if is_new:
-            self.add_fees()
+        if self.pk:
+            return super(Payment, self).save(*args, **kwargs)
+        # new payments are inserted once, charge_amount and all, and then
+        # their fee rows are inserted together
+        fee_details = payments.fee_amounts(self.amount)
+        self.set_charge_amount(fee_details)
         super(Payment, self).save(*args, **kwargs)
+        create_fee_rows(self.fee_rows(fee_details))
+
+    def fee_rows(self, fee_details):
+        raise NotImplementedError
 
-    def add_fees():
+    def set_charge_amount(self, fee_details):
         raise NotImplementedError
 
+    @classmethod
+    def bulk_create_with_fees(cls, new_payments):
+        """
+        Insert many new payments and all of their fee rows in a fixed number
+        of queries, e.g. for a payout or reauthorize run.
+
+        bulk_create doesn't hand back ids on every database, so each payment
+        needs a unique transaction_key to find it again.
+        """
+        fee_details = {}
+        for payment in new_payments:
+            payment.transaction_key = str(payment.transaction_key)
+            fee_details[payment.transaction_key] = details = (
+                payments.fee_amounts(payment.amount))
+            payment.set_charge_amount(details)
+        cls.objects.bulk_create(new_payments)
+
+        if any(payment.pk is None for payment in new_payments):
+            ids = dict(
+                cls.objects.filter(
+                    transaction_key__in=fee_details.keys()
+                ).values_list('transaction_key', 'id')
+            )
+            for payment in new_payments:
+                payment.id = ids[payment.transaction_key]
+        rows = []
+        for payment in new_payments:
+            payment._state.adding = False
+            rows.extend(
+                payment.fee_rows(fee_details[payment.transaction_key]))
+        create_fee_rows(rows)
+        return new_payments
+
 
 class Offer(Payment):
     bid = models.ForeignKey(Bid, related_name='payments')
@@ -550,41 +749,45 @@ class Offer(Payment):
     def sum_fees(self):
         return self.fees.aggregate(Sum('amount'))['amount__sum']
 
-    def add_fees(self):
-        fee_details = payments.transaction_amounts(self.amount)
-
+    def fee_rows(self, fee_details):
+        rows = []
         if self.discount:
-            discount_fee = OfferCredit(
+            rows.append(OfferCredit(
                 offer=self,
                 fee_type='surplus',
                 amount=self.discount
-            )
-            discount_fee.save()
-
-        stripe_fee = OfferFee(
+            ))
+        rows.append(OfferFee(
             offer=self,
             fee_type='Stripe',
             amount=fee_details['offer_stripe_fee']
-        )
-        stripe_fee.save()
-
-        codesy_fee = OfferFee(
+        ))
+        rows.append(OfferFee(
             offer=self,
             fee_type='codesy',
             amount=fee_details['codesy_fee']
-        )
-        codesy_fee.save()
+        ))
+        return rows
 
+    def set_charge_amount(self, fee_details):
         self.charge_amount = fee_details['charge_amount']
 
 
 class Payout(Payment):
     claim = models.ForeignKey(Claim, related_name='payouts')
+    # the offer this payout is charged from
+    offer = models.ForeignKey(Offer, related_name='payouts', null=True,
+                              blank=True)
     provider = models.CharField(
         max_length=255,
         choices=Payment.PROVIDER_CHOICES,
         default='Stripe')
 
+    objects = PayoutManager()
+
+    class Meta:
+        unique_together = (("claim", "offer"),)
+
     def __unicode__(self):
         return u'Payout by %s for claim (%s)' % (
             self.user, self.claim.id
@@ -602,43 +805,37 @@ class Payout(Payment):
 
     @property
     def sum_fees(self):
-        sum_of = 0
-        for fee in self.fees():
-            sum_of += fee.amount
-        return sum_of
+        if hasattr(self, 'fees_total'):
+            return self.fees_total or 0
+        return self.fees().aggregate(Sum('amount'))['amount__sum'] or 0
 
     @property
     def sum_credits(self):
-        sum_of = 0
-        for credit in self.credits():
-            sum_of += credit.amount
-        return sum_of
-
-    def add_fees(self):
-        fee_details = payments.transaction_amounts(self.amount)
+        if hasattr(self, 'credits_total'):
+            return self.credits_total or 0
+        return self.credits().aggregate(Sum('amount'))['amount__sum'] or 0
 
+    def fee_rows(self, fee_details):
+        rows = []
         if self.discount:
-            discount_fee = PayoutCredit(
+            rows.append(PayoutCredit(
                 payout=self,
                 fee_type='surplus',
                 amount=self.discount
-            )
-            discount_fee.save()
-
-        stripe_fee = PayoutFee(
+            ))
+        rows.append(PayoutFee(
             payout=self,
             fee_type='Stripe',
             amount=fee_details['payout_stripe_fee']
-        )
-        stripe_fee.save()
-
-        codesy_fee = PayoutFee(
+        ))
+        rows.append(PayoutFee(
             payout=self,
             fee_type='codesy',
             amount=fee_details['codesy_fee']
-        )
-        codesy_fee.save()
+        ))
+        return rows
 
+    def set_charge_amount(self, fee_details):
         self.charge_amount = fee_details['payout_amount']
 
 
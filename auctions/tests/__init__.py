@@ -11,11 +11,14 @@ import fudge
 def setUpPackage(self):
 
     mock_get = fudge.Fake().is_callable().returns(
-        fudge.Fake().has_attr(text='<title>Howdy Dammit</title>')
+        fudge.Fake().has_attr(status_code=200, headers={}, encoding=None)
+                    .provides('iter_content')
+                    .returns(['<title>Howdy Dammit</title>'])
+                    .provides('close')
     )
 
     self.patch_request = fudge.patch_object(
-        'auctions.models.requests', 'get', mock_get
+        'auctions.titles.http', 'get', mock_get
     )
 
     mock_create = fudge.Fake().has_attr(id='dammit')
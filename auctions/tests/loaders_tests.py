@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from model_mommy import mommy
+
+from ..loaders import (decode_cursor, encode_cursor, load_activity_page,
+                       load_bid_rows, load_bid_status)
+from ..models import (ACTIVITY_CACHE_KEY, Bid, Claim, Issue,
+                      active_issue_cache_key)
+
+from . import MarketWithBidsTestCase, MarketWithClaimTestCase
+
+
+class LoadBidRowsTest(MarketWithClaimTestCase):
+
+    def test_rows_hold_own_and_other_claims(self):
+        claimant_row = load_bid_rows(self.user1)[0]
+        self.assertEqual(self.bid1, claimant_row.bid)
+        self.assertEqual(self.claim, claimant_row.own_claim)
+        self.assertEqual([], claimant_row.other_claims)
+
+        offerer_row = load_bid_rows(self.user2)[0]
+        self.assertIsNone(offerer_row.own_claim)
+        self.assertEqual([self.claim], offerer_row.other_claims)
+
+    def test_rows_hold_latest_offer_and_fees(self):
+        self.bid2.set_offer(25)
+        latest = self.bid2.set_offer(30)
+        row = load_bid_rows(self.user2)[0]
+        self.assertEqual(latest, row.last_offer)
+        self.assertEqual(latest.sum_fees, row.offer_fees)
+
+    def test_query_count_does_not_grow_with_bids(self):
+        for n in range(5):
+            url = 'http://github.com/codesy/codesy/issues/%s' % n
+            issue = mommy.make(Issue, url=url)
+            bid = mommy.make(Bid, user=self.user2, url=url, issue=issue)
+            bid.set_offer(10)
+            mommy.make(Claim, issue=issue,
+                       user=mommy.make(settings.AUTH_USER_MODEL))
+        with self.assertNumQueries(3):
+            rows = load_bid_rows(self.user2)
+            for row in rows:
+                row.bid.issue.title
+                row.offer_fees
+                [claim.status for claim in row.other_claims]
+        self.assertEqual(6, len(rows))
+
+
+class LoadActivityPageTest(MarketWithBidsTestCase):
+    def setUp(self):
+        super(LoadActivityPageTest, self).setUp()
+        cache.delete(ACTIVITY_CACHE_KEY)
+
+    def tearDown(self):
+        cache.delete(ACTIVITY_CACHE_KEY)
+
+    def test_cursor_round_trip(self):
+        bid = Bid.objects.get(id=self.bid1.id)
+        self.assertEqual((bid.modified, bid.id),
+                         decode_cursor(encode_cursor(bid)))
+
+    def test_pages_walk_all_bids_newest_first(self):
+        expected = list(Bid.objects.order_by('-modified', '-id'))
+        bids, cursor = load_activity_page(page_size=2)
+        self.assertEqual(expected[:2], bids)
+        self.assertIsNotNone(cursor)
+        bids, cursor = load_activity_page(cursor, page_size=2)
+        self.assertEqual(expected[2:], bids)
+        self.assertIsNone(cursor)
+
+    def test_first_page_is_cached_until_a_bid_is_saved(self):
+        load_activity_page(page_size=2)
+        with self.assertNumQueries(0):
+            load_activity_page(page_size=2)
+        self.bid3.ask = 10
+        self.bid3.save()
+        bids, cursor = load_activity_page(page_size=2)
+        self.assertEqual(self.bid3, bids[0])
+
+
+class LoadBidStatusTest(MarketWithClaimTestCase):
+    def setUp(self):
+        super(LoadBidStatusTest, self).setUp()
+        self.other_url = 'http://github.com/codesy/codesy/issues/38'
+        cache.delete(active_issue_cache_key(self.other_url))
+
+    def tearDown(self):
+        cache.delete(active_issue_cache_key(self.other_url))
+
+    def test_bidder_status_in_two_queries(self):
+        with self.assertNumQueries(2):
+            status = load_bid_status(self.user1, self.url)
+            status.bid.issue.url
+        self.assertEqual(self.bid1, status.bid)
+        self.assertTrue(status.ask_met)
+        self.assertTrue(status.active_issue)
+        self.assertEqual(self.claim, status.own_claim)
+        self.assertEqual([self.claim], status.claims)
+
+    def test_ask_is_not_met_by_own_offer(self):
+        user = mommy.make(settings.AUTH_USER_MODEL)
+        mommy.make(Bid, user=user, url=self.other_url, ask=50, offer=60)
+        status = load_bid_status(user, self.other_url)
+        self.assertFalse(status.ask_met)
+        self.assertFalse(status.active_issue)
+
+    def test_rejected_claims_are_ignored(self):
+        Claim.objects.filter(id=self.claim.id).update(status='Rejected')
+        status = load_bid_status(self.user2, self.url)
+        self.assertIsNone(status.own_claim)
+        self.assertEqual([], status.claims)
+
+    def test_active_issue_is_cached_for_non_bidders(self):
+        self.assertFalse(load_bid_status(self.user1, self.other_url).bid)
+        with self.assertNumQueries(1):
+            status = load_bid_status(self.user1, self.other_url)
+        self.assertFalse(status.active_issue)
+
+        mommy.make(Bid, user=self.user2, url=self.other_url, offer=5)
+        status = load_bid_status(self.user1, self.other_url)
+        self.assertTrue(status.active_issue)
@@ -1,8 +1,41 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+
 from model_mommy import mommy
 
-from ..models import Vote, Claim
+from ..models import Bid, Issue, Vote, Claim
+
+from . import MarketWithBidsTestCase, MarketWithClaimTestCase
+
+
+class BidManagerTestCase(MarketWithBidsTestCase):
+    def test_unnotified_asks_met_matches_ask_met(self):
+        user = mommy.make(settings.AUTH_USER_MODEL)
+        mommy.make(Bid, user=user, ask=0, offer=80, url=self.url)
+        Bid.objects.filter(url=self.url).update(ask_match_sent=None)
+        met = Bid.objects.unnotified_asks_met(self.url)
+        expected = [bid for bid in Bid.objects.filter(url=self.url)
+                    if bid.ask_met()]
+        self.assertEqual(set(expected), set(met))
+        self.assertEqual(set([self.bid1, self.bid2]), set(met))
 
-from . import MarketWithClaimTestCase
+    def test_unnotified_asks_met_skips_notified(self):
+        user = mommy.make(settings.AUTH_USER_MODEL)
+        mommy.make(Bid, user=user, ask=0, offer=80, url=self.url)
+        Bid.objects.filter(id=self.bid1.id).update(
+            ask_match_sent=timezone.now())
+        Bid.objects.filter(id=self.bid2.id).update(ask_match_sent=None)
+        met = Bid.objects.unnotified_asks_met(self.url)
+        self.assertEqual([self.bid2], list(met))
+
+    def test_unnotified_asks_met_excludes_own_offer(self):
+        user = mommy.make(settings.AUTH_USER_MODEL)
+        url = 'https://github.com/codesy/codesy/issues/149'
+        mommy.make(Bid, user=user, url=url, offer=100, ask=10)
+        self.assertEqual([], list(Bid.objects.unnotified_asks_met(url)))
 
 
 class ClaimManagerTestCase(MarketWithClaimTestCase):
@@ -12,3 +45,33 @@ class ClaimManagerTestCase(MarketWithClaimTestCase):
         self.assertEqual(1, len(claims))
         for claim in claims:
             self.assertEqual(self.claim, claim)
+
+
+class IssueManagerTestCase(TestCase):
+    def make_issue(self, state, hours_ago):
+        issue = mommy.make(Issue, state=state,
+                           url='https://github.com/codesy/codesy/issues/%s'
+                           % (Issue.objects.count() + 1))
+        Issue.objects.filter(id=issue.id).update(
+            last_fetched=timezone.now() - timedelta(hours=hours_ago))
+        return issue
+
+    def test_due_for_refresh_backs_off_idle_and_closed_issues(self):
+        active = self.make_issue('OPEN', 7)
+        mommy.make(Bid, url=active.url, offer=10)
+        idle = self.make_issue('OPEN', 25)
+        unknown = self.make_issue('unknown', 0)
+        Issue.objects.filter(id=unknown.id).update(last_fetched=None)
+        closed = self.make_issue('CLOSED', 24 * 8)
+        not_found = self.make_issue('unknown', 24 * 8)
+        # not due yet
+        self.make_issue('OPEN', 7)
+        self.make_issue('CLOSED', 25)
+        mommy.make(Bid, url=self.make_issue('OPEN', 1).url, offer=10)
+        # looked up, but GitHub couldn't find it
+        mommy.make(Bid, url=self.make_issue('unknown', 25).url, offer=10)
+
+        due = list(Issue.objects.due_for_refresh())
+        self.assertEqual(active, due[0])
+        self.assertEqual(set([active, idle, unknown, closed, not_found]),
+                         set(due))
@@ -9,13 +9,17 @@ from fudge.inspector import arg
 
 from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.db import IntegrityError
 from django.db.models import Sum
 
 from model_mommy import mommy
 
+from codesy.base import jobs
+from codesy.base.models import Job, Notification
+from codesy.base.outbox import send_pending
 from payments.models import StripeAccount
+from ..jobs import payout_job, queue_payout
 from ..models import Bid, Claim, Issue, Vote
 from ..models import (
     Offer, OfferFee, OfferCredit, Payout, PayoutFee, PayoutCredit
@@ -35,13 +39,20 @@ class IssueTest(MarketWithBidsTestCase):
 
 class SignalTest(TestCase):
 
-    def test_save_title(self):
+    @override_settings(TITLE_FETCH_WORKERS=0)
+    @fudge.patch('auctions.titles.transaction.on_commit')
+    def test_save_title(self, mock_on_commit):
+        mock_on_commit.is_callable().calls(lambda func: func())
         ModelsWithURL = ['Bid', 'Claim', 'Issue']
         for model_name in ModelsWithURL:
             model = mommy.make(model_name)
             retrieve_model = type(model).objects.get(pk=model.id)
             self.assertEqual(retrieve_model.title, 'Howdy Dammit')
 
+    def test_save_title_waits_for_commit(self):
+        bid = mommy.make(Bid)
+        self.assertIsNone(Bid.objects.get(pk=bid.id).title)
+
 
 class SimpleBidTest(TestCase):
 
@@ -166,7 +177,7 @@ class BidWithClaimsTest(MarketWithClaimTestCase):
 
 class NotifyMatchersReceiverTest(MarketWithBidsTestCase):
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_dont_email_self_when_offering_more_than_ask(self, mock_send_mail):
         mock_send_mail.is_callable().times_called(0)
         user = mommy.make(settings.AUTH_USER_MODEL)
@@ -175,8 +186,9 @@ class NotifyMatchersReceiverTest(MarketWithBidsTestCase):
             Bid, user=user, url=url, offer=100, ask=10
         )
         offer_bid.save()
+        send_pending()
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_send_mail_to_matching_askers(self, mock_send_mail):
         user = mommy.make(settings.AUTH_USER_MODEL)
         bid1_subject = "[codesy] There's $50 waiting for you!"
@@ -198,8 +210,9 @@ class NotifyMatchersReceiverTest(MarketWithBidsTestCase):
             Bid, offer=100, user=user, ask=1000, url=self.url
         )
         offer_bid.save()
+        send_pending()
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_only_send_mail_to_unsent_matching_askers(self, mock_send_mail):
         user = mommy.make(settings.AUTH_USER_MODEL)
         self.bid1.ask_match_sent = timezone.now()
@@ -217,8 +230,9 @@ class NotifyMatchersReceiverTest(MarketWithBidsTestCase):
             Bid, offer=100, user=user, ask=1000, url=self.url
         )
         offer_bid.save()
+        send_pending()
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_mail_contains_text_for_claiming_via_url(self, mock_send_mail):
         user = mommy.make(settings.AUTH_USER_MODEL)
         self.bid1.ask_match_sent = timezone.now()
@@ -234,6 +248,7 @@ class NotifyMatchersReceiverTest(MarketWithBidsTestCase):
         mommy.make(
             Bid, offer=100, user=user, ask=1000, url=self.url
         )
+        send_pending()
 
 
 class ClaimTest(MarketWithClaimTestCase):
@@ -274,6 +289,55 @@ class ClaimTest(MarketWithClaimTestCase):
         self.claim = Claim.objects.get(id=self.claim.id)
         self.assertEqual('Rejected', self.claim.status)
 
+    def test_approval_waits_for_offers_made_after_the_claim(self):
+        user4 = mommy.make(settings.AUTH_USER_MODEL, email='user4@test.com')
+        mommy.make(Bid, user=user4, ask=0, offer=20, url=self.url,
+                   issue=self.issue)
+        approved_key = 'claim-approved-%s' % self.claim.id
+
+        mommy.make(Vote, user=self.user2, claim=self.claim, approved=True)
+        mommy.make(Vote, user=self.user3, claim=self.claim, approved=True)
+        self.assertEqual('Pending', Claim.objects.get(id=self.claim.id).status)
+        self.assertFalse(Notification.objects.filter(key=approved_key))
+
+        mommy.make(Vote, user=user4, claim=self.claim, approved=True)
+        self.assertEqual('Approved',
+                         Claim.objects.get(id=self.claim.id).status)
+        self.assertTrue(Notification.objects.filter(key=approved_key))
+
+    def test_withdrawn_offer_does_not_block_approval(self):
+        mommy.make(Vote, user=self.user2, claim=self.claim, approved=True)
+        Bid.objects.filter(id=self.bid3.id).update(offer=0)
+        mommy.make(Vote, user=self.user3, claim=self.claim, approved=True)
+        self.assertEqual('Approved',
+                         Claim.objects.get(id=self.claim.id).status)
+
+    def test_votes_are_tallied(self):
+        mommy.make(Vote, user=self.user1, claim=self.claim, approved=True)
+        mommy.make(Vote, user=self.user2, claim=self.claim, approved=True)
+        mommy.make(Vote, user=self.user3, claim=self.claim, approved=False)
+        self.claim = Claim.objects.get(id=self.claim.id)
+        self.assertEqual(1, self.claim.num_approvals)
+        self.assertEqual(1, self.claim.num_rejections)
+
+    def test_changed_vote_moves_tally(self):
+        mommy.make(Vote, user=self.user2, claim=self.claim, approved=True)
+        vote = Vote.objects.get(user=self.user2, claim=self.claim)
+        vote.approved = False
+        vote.save()
+        self.claim = Claim.objects.get(id=self.claim.id)
+        self.assertEqual(0, self.claim.num_approvals)
+        self.assertEqual(1, self.claim.num_rejections)
+        self.assertEqual('Rejected', self.claim.status)
+
+    def test_claim_save_keeps_tallies(self):
+        stale_claim = Claim.objects.get(id=self.claim.id)
+        mommy.make(Vote, user=self.user2, claim=self.claim, approved=True)
+        stale_claim.evidence = 'https://test.com/123'
+        stale_claim.save()
+        self.claim = Claim.objects.get(id=self.claim.id)
+        self.assertEqual(1, self.claim.num_approvals)
+
     def test_expires_is_14_days_after_create(self):
         test_claim = mommy.make(Claim)
         test_claim = Claim.objects.get(pk=test_claim.pk)
@@ -341,8 +405,10 @@ class NotifyMatchingOfferersTest(MarketWithBidsTestCase):
                                ask=200, offer=10, url=self.url)
         self.evidence = ('https://github.com/codesy/codesy/commit/'
                          '4f1bcd014ec735918bebd1c386e2f99a7f83ff64')
+        # send notifications queued while setting up the market
+        send_pending()
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_send_email_to_other_offerers_when_claim_is_made(self,
                                                              mock_send_mail):
         # Should be called 3 times: for user2, user3, and user4
@@ -354,8 +420,9 @@ class NotifyMatchingOfferersTest(MarketWithBidsTestCase):
             evidence=self.evidence,
             created=timezone.now()
         )
+        send_pending()
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_dont_send_email_to_bidders_who_offered_0(self,
                                                       mock_send_mail):
         user5 = mommy.make(settings.AUTH_USER_MODEL,
@@ -371,8 +438,9 @@ class NotifyMatchingOfferersTest(MarketWithBidsTestCase):
             evidence=self.evidence,
             created=timezone.now()
         )
+        send_pending()
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_dont_send_email_on_saving_claim(self, mock_send_mail):
         mock_send_mail.is_callable().times_called(3)
         claim = mommy.make(
@@ -385,6 +453,7 @@ class NotifyMatchingOfferersTest(MarketWithBidsTestCase):
         claim.save()
         claim.status = 'Rejected'
         claim.save()
+        send_pending()
 
 
 class VoteTest(TestCase):
@@ -402,6 +471,8 @@ class VoteTest(TestCase):
         mommy.make(Bid, user=self.user2, url=url, issue=issue, offer=50)
         mommy.make(Bid, user=self.user3, url=url, issue=issue, offer=50)
         self.claim = mommy.make(Claim, issue=issue, user=self.user1)
+        # send notifications queued while setting up the market
+        send_pending()
 
     def test_unicode(self):
         vote = mommy.make(Vote, approved=True)
@@ -436,23 +507,26 @@ class VoteTest(TestCase):
         with self.assertRaises(IntegrityError):
             mommy.make(Vote, claim=self.claim, user=self.user1, approved=False)
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_notify_claim_approved(self, mock_send_mail):
         mock_send_mail.expects_call()
         mommy.make(Vote, claim=self.claim, user=self.user2, approved=True)
         mommy.make(Vote, claim=self.claim, user=self.user3, approved=True)
+        send_pending()
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_claimant_vote_not_counted(self, mock_send_mail):
         mock_send_mail.is_callable().times_called(0)
         mommy.make(Vote, claim=self.claim, user=self.user1, approved=True)
         mommy.make(Vote, claim=self.claim, user=self.user2, approved=True)
+        send_pending()
 
-    @fudge.patch('auctions.models.send_mail')
+    @fudge.patch('codesy.base.outbox.send_mail')
     def test_no_votes_not_counted(self, mock_send_mail):
         mock_send_mail.is_callable().times_called(0)
         mommy.make(Vote, claim=self.claim, user=self.user2, approved=False)
         mommy.make(Vote, claim=self.claim, user=self.user3, approved=True)
+        send_pending()
 
 
 class OfferTest(TestCase):
@@ -484,6 +558,29 @@ class OfferTest(TestCase):
         offer_with_fees = offer.amount + sum_fees
         self.assertEqual(offer_with_fees, offer.charge_amount)
 
+    def test_new_offer_inserts_fees_in_bulk(self):
+        offer = Offer(user=self.user1, bid=self.bid, amount=Decimal('20.00'))
+        # the offer with its charge_amount, then all of its fees
+        with self.assertNumQueries(2):
+            offer.save()
+        self.assertEqual(2, offer.offer_fees.count())
+        offer.refresh_from_db()
+        self.assertEqual(
+            offer.amount + offer.offer_fees.aggregate(
+                Sum('amount'))['amount__sum'],
+            offer.charge_amount
+        )
+
+    def test_bulk_create_with_fees(self):
+        offers = [Offer(user=self.user1, bid=self.bid, amount=amount)
+                  for amount in (Decimal('10.00'), Decimal('20.00'))]
+        with self.assertNumQueries(3):
+            Offer.bulk_create_with_fees(offers)
+        for offer in offers:
+            saved = Offer.objects.get(id=offer.id)
+            self.assertEqual(offer.charge_amount, saved.charge_amount)
+            self.assertEqual(2, saved.offer_fees.count())
+
     def test_new_offer_refunds_previous_offer(self):
         first_offer = self.bid.last_offer
         self.assertEqual(self.bid.offer, 50)
@@ -615,3 +712,109 @@ class PayoutTest(TestCase):
             Sum('amount'))['amount__sum']
 
         self.assertEqual(sum_payout_credits, Decimal('33.34'))
+
+    def test_claim_financials(self):
+        self.bid3.set_offer(50)
+        claim = mommy.make(Claim, user=self.user1, issue=self.issue)
+        mommy.make(StripeAccount, user=self.user1)
+        claim.payout()
+
+        payouts = Payout.objects.filter(claim=claim)
+        sum_payouts = payouts.aggregate(
+            Sum('charge_amount'))['charge_amount__sum']
+        sum_fees = PayoutFee.objects.filter(payout__in=payouts).aggregate(
+            Sum('amount'))['amount__sum']
+        self.assertEqual(sum_payouts, claim.sum_payouts)
+        self.assertEqual(sum_fees, claim.sum_fees)
+        sum_credits = sum_payouts - self.bid1.ask + sum_fees
+        self.assertEqual(sum_credits, claim.sum_credits)
+
+        with self.assertNumQueries(1):
+            annotated = Claim.objects.with_financials().get(id=claim.id)
+            self.assertEqual(sum_payouts, annotated.sum_payouts)
+            self.assertEqual(sum_fees, annotated.sum_fees)
+            self.assertEqual(sum_credits, annotated.sum_credits)
+
+        expected = dict(
+            (payout.id, (payout.sum_fees, payout.sum_credits))
+            for payout in payouts
+        )
+        with self.assertNumQueries(1):
+            for payout in Payout.objects.with_totals().filter(claim=claim):
+                self.assertEqual(expected[payout.id],
+                                 (payout.sum_fees, payout.sum_credits))
+
+    def test_payout_job(self):
+        claim = mommy.make(Claim, user=self.user1, issue=self.issue)
+        mommy.make(StripeAccount, user=self.user1, account_id='acct_1')
+        queue_payout(claim)
+        self.assertEqual(1, jobs.run_pending())
+        job = payout_job(claim)
+        self.assertEqual(Job.DONE, job.status)
+        self.assertEqual('1 of 1 offers paid', job.progress)
+        self.assertEqual('Paid', Claim.objects.get(id=claim.id).status)
+
+    @override_settings(PAYOUT_WORKERS=1)
+    def test_failed_payout_is_resumed_without_charging_twice(self):
+        self.bid3.set_offer(50)
+        claim = mommy.make(Claim, user=self.user1, issue=self.issue)
+        mommy.make(StripeAccount, user=self.user1, account_id='acct_1')
+        first_key, second_key = [
+            'charge-payout-%s-%s' % (claim.id, bid.last_offer.id)
+            for bid in (self.bid2, self.bid3)
+        ]
+        with fudge.patch('payments.utils.stripe.Charge') as mock_charge:
+            (mock_charge.expects('create')
+                        .with_matching_args(idempotency_key=first_key)
+                        .returns(fudge.Fake().has_attr(id='ch_1'))
+                        .next_call()
+                        .with_matching_args(idempotency_key=second_key)
+                        .raises(Exception('card declined'))
+                        .next_call()
+                        .with_matching_args(idempotency_key=second_key)
+                        .returns(fudge.Fake().has_attr(id='ch_2')))
+
+            self.assertFalse(claim.payout())
+            self.assertNotEqual('Paid', claim.status)
+            failed = Payout.objects.get(api_success=False)
+            self.assertEqual('card declined', failed.error_message)
+
+            self.assertTrue(claim.payout())
+        self.assertEqual('Paid', claim.status)
+        self.assertEqual(
+            ['ch_1', 'ch_2'],
+            list(claim.payouts.order_by('id').values_list('charge_id',
+                                                          flat=True))
+        )
+
+    @override_settings(PAYOUT_WORKERS=1)
+    def test_retried_payout_charges_the_same_amounts(self):
+        # two offers of 6.00 on an ask of 2.00 each pay 2.666...
+        self.bid1.ask = 2
+        self.bid1.save()
+        self.bid2.set_offer(6)
+        self.bid3.set_offer(6)
+        claim = mommy.make(Claim, user=self.user1, issue=self.issue)
+        mommy.make(StripeAccount, user=self.user1, account_id='acct_1')
+        charges = []
+
+        def charge(**kwargs):
+            charges.append(kwargs)
+            if len(charges) == 1:
+                raise Exception('connection reset')
+            return fudge.Fake().has_attr(id='ch_%s' % len(charges))
+
+        with fudge.patch('payments.utils.stripe.Charge') as mock_charge:
+            mock_charge.provides('create').calls(charge)
+            self.assertFalse(claim.payout())
+            claim = Claim.objects.get(id=claim.id)
+            self.assertTrue(claim.payout())
+
+        first, retry = charges[0], charges[-1]
+        self.assertEqual(first['idempotency_key'], retry['idempotency_key'])
+        self.assertEqual(
+            (first['amount'], first['application_fee']),
+            (retry['amount'], retry['application_fee'])
+        )
+        payout = Payout.objects.get(charge_id=u'ch_%s' % len(charges))
+        self.assertEqual(Decimal('2.67'), payout.amount)
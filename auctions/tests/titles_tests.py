@@ -0,0 +1,93 @@
+import fudge
+from fudge.inspector import arg
+
+from django.test import TestCase
+
+from .. import titles
+from ..titles import TitleCache, fetch_title, normalize_url, read_title
+
+
+def fake_response(status_code=200, headers=None, chunks=None):
+    return (fudge.Fake().has_attr(status_code=status_code,
+                                  headers=headers or {},
+                                  encoding=None)
+                        .provides('iter_content').returns(chunks or [])
+                        .provides('close'))
+
+
+class NormalizeUrlTest(TestCase):
+
+    def test_strips_fragment_case_and_trailing_slash(self):
+        self.assertEqual(
+            'https://github.com/codesy/codesy/issues/380',
+            normalize_url(
+                'HTTPS://GitHub.com/codesy/codesy/issues/380/#issue-1')
+        )
+
+
+class TitleCacheTest(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = TitleCache(max_size=2, ttl=60)
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        cache.get('a')
+        cache.set('c', 'C')
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('A', cache.get('a')['title'])
+
+    def test_entries_go_stale_after_ttl(self):
+        cache = TitleCache(max_size=2, ttl=0)
+        entry = cache.set('a', 'A')
+        self.assertFalse(cache.is_fresh(entry))
+
+
+class ReadTitleTest(TestCase):
+
+    def test_stops_reading_after_title(self):
+        response = fake_response(chunks=iter([
+            '<html><head><title>Issue &amp; fix</title>',
+            '</head><body>' + 'x' * 1000,
+        ]))
+        self.assertEqual(u'Issue & fix', read_title(response))
+
+
+class FetchTitleTest(TestCase):
+    url = 'https://github.com/codesy/codesy/issues/1'
+
+    def setUp(self):
+        titles.title_cache.clear()
+
+    def tearDown(self):
+        titles.title_cache.clear()
+
+    @fudge.patch('auctions.titles.http.get')
+    def test_fresh_url_is_fetched_once(self, mock_get):
+        mock_get.expects_call().returns(
+            fake_response(chunks=['<title>Howdy</title>'])
+        ).times_called(1)
+        self.assertEqual('Howdy', fetch_title(self.url))
+        self.assertEqual('Howdy', fetch_title(self.url + '#comment'))
+
+    @fudge.patch('auctions.titles.http.get')
+    def test_stale_url_is_revalidated(self, mock_get):
+        titles.title_cache.set(
+            normalize_url(self.url), 'Howdy', etag='"abc"')
+        titles.title_cache.get(normalize_url(self.url))['fetched'] = 0
+        mock_get.expects_call().with_args(
+            self.url,
+            headers={'If-None-Match': '"abc"'},
+            stream=True,
+            timeout=arg.any()
+        ).returns(fake_response(status_code=304))
+        self.assertEqual('Howdy', fetch_title(self.url))
+        entry = titles.title_cache.get(normalize_url(self.url))
+        self.assertTrue(titles.title_cache.is_fresh(entry))
+        self.assertEqual('"abc"', entry['etag'])
+
+    @fudge.patch('auctions.titles.http.get')
+    def test_errors_are_not_cached(self, mock_get):
+        mock_get.expects_call().returns(fake_response(status_code=500))
+        self.assertIsNone(fetch_title(self.url))
+        self.assertIsNone(titles.title_cache.get(normalize_url(self.url)))
@@ -17,7 +17,15 @@ class IssueStateTest(TestCase):
                        .returns_fake().expects('get_issue').with_args(158)
                        .returns_fake().has_attr(state='open'))
 
-        self.assertEqual('open', issue_state(url, fake_gh_client))
+        stats = {'api_calls': 0}
+        self.assertEqual('open', issue_state(url, fake_gh_client, stats))
+        self.assertEqual(2, stats['api_calls'])
+
+    def test_issue_state_of_other_urls_makes_no_calls(self):
+        stats = {'api_calls': 0}
+        self.assertEqual(None, issue_state('http://test.com/bug/123',
+                                           fudge.Fake(), stats))
+        self.assertEqual(0, stats['api_calls'])
 
     def test_issue_state_catches_UnknownObjectException(self):
         url = 'https://github.com/codesy/codesy/issues/158'
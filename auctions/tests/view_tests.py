@@ -1,3 +1,4 @@
+import json
 from decimal import Decimal
 
 import fudge
@@ -7,9 +8,11 @@ from django.test import TestCase
 
 from model_mommy import mommy
 
+from codesy.base.models import Job
+
 from ..models import Issue, Bid, Claim, Vote
 from ..views import BidStatusView, ClaimStatusView
-from ..views import BidList, ClaimList, VoteList
+from ..views import ActivityList, BidList, ClaimList, VoteList
 
 
 class BidStatusTestCase(TestCase):
@@ -29,6 +32,15 @@ class BidStatusTestCase(TestCase):
         context = self.view.get_context_data()
         self.assertEqual(self.bid1, context['bid'])
 
+    def test_get_by_url_with_claim_uses_claimaint_template(self):
+        claim = mommy.make(Claim, user=self.user1, issue=self.issue)
+        self.view.request = (fudge.Fake()
+                             .has_attr(GET={'url': self.url})
+                             .has_attr(user=self.user1))
+        context = self.view.get_context_data()
+        self.assertEqual({'claim': claim}, context)
+        self.assertEqual('addon/claimaint.html', self.view.template_name)
+
     def test_get_by_url_doesnt_create_bid(self):
         url = 'https://github.com/codesy/codesy/issues/419'
         self.view.request = (fudge.Fake()
@@ -186,12 +198,14 @@ class ClaimStatusTestCase(TestCase):
 
         self.claim = mommy.make(Claim, user=self.user1, issue=self.issue)
 
-    def payout_post(self, user):
+    def payout_post(self, user, ajax=False):
         self.view.request = (fudge.Fake()
-                             .has_attr(user=user))
+                             .has_attr(user=user)
+                             .provides('is_ajax').returns(ajax))
         self.view.kwargs = {'pk': self.claim.id}
         response = self.view.post(self.view.request)
         self.assertTrue(response)
+        return response
 
     def test_get_by_id_returns_context(self):
         self.view.request = (fudge.Fake()
@@ -225,19 +239,26 @@ class ClaimStatusTestCase(TestCase):
         response = self.view.get(self.view.request)
         self.assertEqual(404, response.status_code)
 
-    @fudge.patch('auctions.models.Claim.payout')
     @fudge.patch('auctions.views.messages')
-    def test_post_success_by_claimaint(self, mock_paypal, mock_messages):
-        mock_paypal.is_callable().returns(True)
+    def test_post_by_claimaint_queues_payout(self, mock_messages):
         mock_messages.expects('success')
         self.payout_post(self.user1)
+        job = Job.objects.get()
+        self.assertEqual('payout-%s' % self.claim.id, job.key)
+        self.assertEqual(Job.QUEUED, job.status)
+
+    def test_ajax_post_returns_status_url(self):
+        response = self.payout_post(self.user1, ajax=True)
+        self.assertEqual(202, response.status_code)
+        self.assertIn('/payout-status/%s' % self.claim.id,
+                      json.loads(response.content)['status_url'])
 
-    @fudge.patch('auctions.models.Claim.payout')
     @fudge.patch('auctions.views.messages')
-    def test_post_fail_by_claimaint(self, mock_paypal, mock_messages):
-        mock_paypal.is_callable().returns(False)
-        mock_messages.expects('error')
+    def test_post_twice_queues_one_payout(self, mock_messages):
+        mock_messages.is_a_stub()
         self.payout_post(self.user1)
+        self.payout_post(self.user1)
+        self.assertEqual(1, Job.objects.count())
 
     @fudge.patch('auctions.views.messages')
     def test_post_fail_by_other_user(self, mock_messages):
@@ -260,12 +281,12 @@ class BidListViewTest(TestCase):
         self.view.request = (fudge.Fake()
                              .has_attr(user=self.user1))
         context = self.view.get_context_data()
-        self.assertEqual(bid, context['bids'][0])
+        self.assertEqual(bid, context['rows'][0].bid)
 
         self.view.request = (fudge.Fake()
                              .has_attr(user=self.user2))
         context = self.view.get_context_data()
-        self.assertEqual(0, len(context['bids']))
+        self.assertEqual(0, len(context['rows']))
 
 
 class ClaimListViewTest(TestCase):
@@ -319,3 +340,28 @@ class VoteListViewTest(TestCase):
         self.assertEqual(1, len(context['votes']))
         self.assertEqual(vote2, context['votes'][0])
         self.assertEqual(self.user2, context['votes'][0].user)
+
+
+class ActivityListViewTest(TestCase):
+    def setUp(self):
+        self.view = ActivityList()
+        self.url = 'http://github.com/codesy/codesy/issues/37'
+        self.issue = mommy.make(Issue, url=self.url)
+        self.bid = mommy.make(Bid, url=self.url, issue=self.issue)
+
+    def test_activity_list(self):
+        self.view.request = fudge.Fake().has_attr(GET={})
+        context = self.view.get_context_data()
+        self.assertEqual([self.bid], context['bids'])
+        self.assertIsNone(context['next_cursor'])
+
+    def test_garbled_cursor_returns_first_page(self):
+        self.view.request = fudge.Fake().has_attr(GET={'cursor': 'nope'})
+        context = self.view.get_context_data()
+        self.assertEqual([self.bid], context['bids'])
+
+    def test_oversized_cursor_returns_first_page(self):
+        self.view.request = fudge.Fake().has_attr(
+            GET={'cursor': '9' * 30 + '.1'})
+        context = self.view.get_context_data()
+        self.assertEqual([self.bid], context['bids'])
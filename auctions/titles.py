@@ -0,0 +1,197 @@
+"""
+Deferred page title fetching for bids, issues and claims.
+
+Titles are fetched once the saving transaction commits, on a small pool of
+worker threads with a request timeout, so a slow page never holds up the
+request (or the database transaction) that saved the object.
+
+Fetched titles are kept in an LRU cache keyed by normalized url and shared by
+bids, issues and claim evidence, so a popular issue page is downloaded once
+per TITLE_CACHE_TTL and then only revalidated with a conditional GET.
+"""
+import HTMLParser
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from urlparse import urldefrag, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from codesy.base import http
+
+logger = logging.getLogger(__name__)
+
+TITLE_RE = re.compile('(?:<title.*>)(.*)(?:<\/title>)')
+
+# stop reading a page once its <head> is done, or after this many bytes
+HEAD_END_RE = re.compile(r'</title>|</head>', re.IGNORECASE)
+MAX_HEAD_BYTES = 64 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = set()
+
+# a fixed set of locks so concurrent fetches of one url wait on each other
+_url_locks = [threading.Lock() for _ in range(32)]
+
+
+def normalize_url(url):
+    scheme, netloc, path, query, _ = urlsplit(urldefrag(url)[0])
+    return urlunsplit(
+        (scheme.lower(), netloc.lower(), path.rstrip('/'), query, '')
+    )
+
+
+class TitleCache(object):
+    """
+    Thread-safe LRU cache of page titles and their validators.
+    """
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self._entries[url] = entry
+            return entry
+
+    def set(self, url, title, etag=None, last_modified=None):
+        entry = {
+            'title': title,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched': time.time(),
+        }
+        with self._lock:
+            self._entries.pop(url, None)
+            self._entries[url] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched'] < self.ttl
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+title_cache = TitleCache(settings.TITLE_CACHE_SIZE, settings.TITLE_CACHE_TTL)
+
+
+def read_title(response):
+    """
+    Read a streamed response up to the end of its title, not the whole page.
+    """
+    head = ''
+    for chunk in response.iter_content(chunk_size=4096):
+        head += chunk
+        if HEAD_END_RE.search(head) or len(head) >= MAX_HEAD_BYTES:
+            break
+    head = head.decode(response.encoding or 'utf-8', 'replace')
+    title_search = TITLE_RE.search(head)
+    if title_search:
+        return HTMLParser.HTMLParser().unescape(title_search.group(1))
+
+
+def fetch_title(url):
+    key = normalize_url(url)
+    with _url_locks[hash(key) % len(_url_locks)]:
+        entry = title_cache.get(key)
+        if entry and title_cache.is_fresh(entry):
+            return entry['title']
+
+        headers = {}
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        r = http.get(url, headers=headers, stream=True,
+                     timeout=settings.TITLE_FETCH_TIMEOUT)
+        try:
+            if entry and r.status_code == 304:
+                title = entry['title']
+            elif r.status_code == 200:
+                title = read_title(r)
+            else:
+                # don't cache errors, try again next time
+                return None
+        finally:
+            r.close()
+        etag = r.headers.get('ETag') or (entry and entry['etag'])
+        last_modified = (r.headers.get('Last-Modified') or
+                         (entry and entry['last_modified']))
+        title_cache.set(key, title, etag, last_modified)
+        return title
+
+
+def store_title(model, pk, url):
+    """
+    Fetch the title at url and write it to the model row with pk.
+    """
+    try:
+        title = fetch_title(url)
+    except Exception as e:
+        logger.error("Title fetch for %s failed: %s" % (url, e))
+        return
+    if title:
+        # use .update to avoid recursive signal processing
+        (model.objects.filter(id=pk)
+                      .exclude(title=title[:255])
+                      .update(title=title[:255]))
+
+
+def pooled_store_title(model, pk, url):
+    try:
+        store_title(model, pk, url)
+    finally:
+        with _pool_lock:
+            _pending.discard((model, pk, url))
+        # worker threads get their own connection; don't leave it dangling
+        connection.close()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(processes=settings.TITLE_FETCH_WORKERS or 1)
+        return _pool
+
+
+def submit(model, pk, url):
+    """
+    Fetch and store a title in the background. Identical jobs that are
+    already waiting in the pool are not queued twice.
+    """
+    if not settings.TITLE_FETCH_WORKERS:
+        return store_title(model, pk, url)
+
+    key = (model, pk, url)
+    with _pool_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    get_pool().apply_async(pooled_store_title, key)
+
+
+def queue_title(model, pk, url):
+    """
+    Queue a title fetch to run after the current transaction commits.
+    """
+    if not url:
+        return
+    transaction.on_commit(lambda: submit(model, pk, url))
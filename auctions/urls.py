@@ -7,6 +7,8 @@ urlpatterns = [
     url(r'^bid-status/', views.BidStatusView.as_view(), name='bid-status'),
     url(r'^claim-status/(?P<pk>[^/.]+)',
         views.ClaimStatusView.as_view(), name='claim-status'),
+    url(r'^payout-status/(?P<pk>[^/.]+)',
+        views.PayoutStatusView.as_view(), name='payout-status'),
     url(r'^bid-list', views.BidList.as_view()),
     url(r'^claim-list', views.ClaimList.as_view()),
     url(r'^vote-list', views.VoteList.as_view()),
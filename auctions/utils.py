@@ -1,5 +1,4 @@
 import re
-from datetime import timedelta
 from django.utils import timezone
 
 from decouple import config
@@ -16,12 +15,20 @@ def github_client():
                   client_secret=config('GITHUB_CLIENT_SECRET'))
 
 
-def issue_state(url, gh_client):
+def issue_state(url, gh_client, stats=None):
+    """
+    The state of the GitHub issue at url, or None. Each request made to
+    GitHub is counted in stats['api_calls'], if stats is given.
+    """
+    if stats is None:
+        stats = {'api_calls': 0}
     match = GITHUB_ISSUE_RE.match(url)
     if match:
         repo_name, issue_id = match.groups()
         try:
+            stats['api_calls'] += 1
             repo = gh_client.get_repo(repo_name)
+            stats['api_calls'] += 1
             issue = repo.get_issue(int(issue_id))
         except UnknownObjectException:
             # TODO: log this exception somewhere
@@ -36,21 +43,36 @@ def update(instance, **kwargs):
         using).update(**kwargs)
 
 
-def update_bid_issues():
+def update_bid_issues(stats=None):
+    """
+    Link bids without an issue to theirs, creating (and looking up) the
+    issues that don't exist yet. Returns stats with api_calls counted.
+    """
+    stats = stats if stats is not None else {'api_calls': 0}
+    gh_client = github_client()
     for bid in Bid.objects.filter(issue=None):
         try:
             update(bid, issue=Issue.objects.get(url=bid.url))
         except Issue.DoesNotExist:
-            state = issue_state(bid.url)
+            state = issue_state(bid.url, gh_client, stats)
             if state:
-                update(bid,
-                       issue=Issue.objects.create(url=bid.url, state=state))
+                update(bid, issue=Issue.objects.create(
+                    url=bid.url, state=state, last_fetched=timezone.now()))
+    return stats
 
 
-def update_issue_states(since=None):
-    since = since or timezone.now() - timedelta(days=1)
+def update_issue_states(limit=500, stats=None):
+    """
+    Check the state of up to limit issues that are due for a refresh; see
+    IssueManager.due_for_refresh. Returns stats with the API calls made
+    counted in api_calls.
+    """
+    stats = stats if stats is not None else {'api_calls': 0}
     gh_client = github_client()
-    for issue in Issue.objects.filter(last_fetched__lt=since):
-        state = issue_state(issue.url, gh_client)
-        if state:
+    for issue in Issue.objects.due_for_refresh()[:limit]:
+        state = issue_state(issue.url, gh_client, stats)
+        if state and state != issue.state:
             update(issue, last_fetched=timezone.now(), state=state)
+        else:
+            update(issue, last_fetched=timezone.now())
+    return stats
@@ -6,15 +6,20 @@ import sys
 from django.shortcuts import redirect, get_object_or_404
 from django.core.urlresolvers import reverse
 from django.contrib import messages
-from django.http import HttpResponseNotFound
+from django.http import HttpResponseNotFound, JsonResponse
 
+from auctions.jobs import payout_job, queue_payout
+from auctions.loaders import (load_activity_page, load_bid_rows,
+                              load_bid_status)
 from auctions.models import Bid, Claim, Vote
 
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 
 logger = logging.getLogger(__name__)
 
+ACTIVITY_PAGE_SIZE = 50
+
 
 class AddonLogin (TemplateView):
     template_name = 'addon/logon.html'
@@ -41,45 +46,28 @@ class BidStatusView(UserPassesTestMixin, LoginRequiredMixin, TemplateView):
             logger.error("Bid.objects.get exception: %s" % e)
             return None
 
-    def _do_any_bids_exist(self, url):
-        return (
-            Bid.objects
-            .filter(url=url)
-            .exclude(user=self.request.user)
-            .count() > 0
-        )
-
     def _url_path_only(self, url):
         return urldefrag(url)[0]
 
     def get_context_data(self, **kwargs):
-        ctx = {}
         url = self._url_path_only(self.request.GET['url'])
-        bid = self._get_bid(url)
-        any_bids_exist = self._do_any_bids_exist(url)
-        ctx.update({'url': url, 'bid': bid, 'active_issue': any_bids_exist})
-        if bid is None:
-            return dict(ctx)
-
-        # rejected claims should be ignored so new claims can be made
-        claims = (
-            Claim.objects.filter(issue=bid.issue).exclude(status='Rejected')
-        )
+        status = load_bid_status(self.request.user, url)
 
-        users_claims = claims.filter(
-            user=self.request.user).order_by('modified')
-
-        if users_claims:
+        if status.own_claim:
             self.template_name = 'addon/claimaint.html'
-            return dict({'claim': users_claims[0]})
-        if claims:
-            if bid.offer:
+            return {'claim': status.own_claim}
+        if status.claims:
+            if status.bid.offer:
                 self.template_name = 'addon/voters.html'
             else:
                 self.template_name = 'addon/bid_closed.html'
-            return dict({'claims': claims})
-        else:
-            return dict(ctx)
+            return {'claims': status.claims}
+        return {
+            'url': url,
+            'bid': status.bid,
+            'ask_met': status.ask_met,
+            'active_issue': status.active_issue,
+        }
 
     def post(self, *args, **kwargs):
         """
@@ -144,7 +132,8 @@ class ClaimStatusView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         claim = None
         vote = None
-        claim = get_object_or_404(Claim, pk=self.kwargs['pk'])
+        claim = get_object_or_404(Claim.objects.with_financials(),
+                                  pk=self.kwargs['pk'])
         try:
             vote = Vote.objects.get(claim=claim, user=self.request.user)
         except:
@@ -154,12 +143,14 @@ class ClaimStatusView(LoginRequiredMixin, TemplateView):
             'return_url': self.request.path,
             'claim': claim,
             'vote': vote,
+            'payout_job': payout_job(claim),
         })
         return context
 
     def post(self, request, *args, **kwargs):
         """
-        Users requesting payout
+        Users requesting payout; the payout itself runs in the run_jobs
+        worker, and its progress is at payout-status.
         """
 
         claim = get_object_or_404(Claim, pk=self.kwargs['pk'])
@@ -172,16 +163,44 @@ class ClaimStatusView(LoginRequiredMixin, TemplateView):
             return redirect(reverse('claim-status',
                             kwargs={'pk': claim.id}))
 
-        if claim.payout():
-            messages.success(request, 'Your payout was sent.')
-        else:
-            messages.error(
-                request, "Sorry please try this payout later")
-
+        job = queue_payout(claim)
+        if request.is_ajax():
+            return JsonResponse(
+                {
+                    'status': job.status,
+                    'status_url': reverse('payout-status',
+                                          kwargs={'pk': claim.id}),
+                },
+                status=202
+            )
+        messages.success(request, 'Your payout is on its way.')
         return redirect(reverse('claim-status',
                                 kwargs={'pk': claim.id}))
 
 
+class PayoutStatusView(LoginRequiredMixin, View):
+    """
+    Requests for /payout-status/{id} will receive the progress of the
+    claim's payout as JSON.
+
+    id -- id of claim
+    """
+    def get(self, request, *args, **kwargs):
+        claim = get_object_or_404(Claim, pk=self.kwargs['pk'],
+                                  user=request.user)
+        job = payout_job(claim)
+        if job is None:
+            return JsonResponse({'claim_status': claim.status,
+                                 'status': None})
+        return JsonResponse({
+            'claim_status': claim.status,
+            'status': job.status,
+            'progress': job.progress,
+            'attempts': job.attempts,
+            'error': job.error,
+        })
+
+
 # List Views
 class BidList(LoginRequiredMixin, TemplateView):
     """List of bids for the User
@@ -190,14 +209,13 @@ class BidList(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         try:
-            bids = (Bid.objects.filter(user=self.request.user)
-                    .order_by('-created'))
+            rows = load_bid_rows(self.request.user)
         except:
             e = sys.exc_info()[0]
-            logger.error("Bid.objects.filter exception: %s" % e)
-            bids = []
+            logger.error("load_bid_rows exception: %s" % e)
+            rows = []
 
-        return dict({'bids': bids}, )
+        return dict({'rows': rows}, )
 
 
 class ClaimList(LoginRequiredMixin, TemplateView):
@@ -207,8 +225,10 @@ class ClaimList(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         try:
-            claims = (Claim.objects.filter(user=self.request.user)
-                      .order_by('-created'))
+            claims = (Claim.objects.with_financials()
+                                   .select_related('issue')
+                                   .filter(user=self.request.user)
+                                   .order_by('-created'))
             voted_claims = (Claim.objects.voted_on_by_user(self.request.user)
                             .order_by('-created'))
         except:
@@ -244,9 +264,15 @@ class ActivityList(LoginRequiredMixin, TemplateView):
     template_name = 'activity_list.html'
 
     def get_context_data(self, **kwargs):
+        cursor = self.request.GET.get('cursor')
         try:
-            bids = (Bid.objects.order_by('-modified'))
+            bids, next_cursor = load_activity_page(cursor, ACTIVITY_PAGE_SIZE)
+        except (ValueError, OverflowError):
+            # garbled or out of range cursor, start over
+            bids, next_cursor = load_activity_page(None, ACTIVITY_PAGE_SIZE)
         except:
-            bids = []
+            e = sys.exc_info()[0]
+            logger.error("load_activity_page exception: %s" % e)
+            bids, next_cursor = [], None
 
-        return dict({'bids': bids}, )
+        return dict({'bids': bids, 'next_cursor': next_cursor}, )
@@ -7,7 +7,7 @@ from django.contrib.auth.forms import UserChangeForm
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponse
 
-from .models import User
+from .models import Job, Notification, User
 
 
 def download_user_csv(modeladmin, request, queryset):
@@ -57,4 +57,20 @@ class CodesyUserAdmin(UserAdmin):
                    'stripe_bank_account')
 
 
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('key', 'recipient', 'subject', 'created', 'sent',
+                    'attempts')
+    list_filter = ('sent',)
+    search_fields = ['key', 'recipient']
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('key', 'kind', 'status', 'attempts', 'progress',
+                    'run_after', 'finished')
+    list_filter = ('status', 'kind')
+    search_fields = ['key']
+
+
 admin.site.register(User, CodesyUserAdmin)
+admin.site.register(Notification, NotificationAdmin)
+admin.site.register(Job, JobAdmin)
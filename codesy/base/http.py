@@ -0,0 +1,112 @@
+"""
+Shared outbound HTTP.
+
+GitHub's REST and GraphQL APIs, issue pages fetched for their titles, and
+Stripe all go through one requests Session, so connections (and their TLS
+sessions) are kept alive in a pool per host instead of being set up for
+every call.
+
+request() adds a default timeout and retries connection errors, 429s and
+5xx responses with jittered exponential backoff, waiting for Retry-After
+instead when the server sends one. Only idempotent methods are retried
+unless the caller says a POST is safe to repeat (e.g. a GraphQL query).
+The rate limit headers last seen from each host are kept in rate_limits.
+"""
+import random
+import threading
+import time
+from urlparse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from stripe.http_client import RequestsClient
+
+from django.conf import settings
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+def build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=settings.HTTP_POOL_HOSTS,
+                          pool_maxsize=settings.HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+session = build_session()
+
+rate_limits = {}
+_rate_limits_lock = threading.Lock()
+
+
+def stripe_client():
+    """
+    A stripe http client that uses the shared session. Stripe calls aren't
+    retried here; they carry idempotency keys where repeating them matters.
+    """
+    return RequestsClient(timeout=settings.STRIPE_TIMEOUT, session=session)
+
+
+def record_rate_limit(response):
+    remaining = response.headers.get('X-RateLimit-Remaining')
+    if remaining is None:
+        return
+    with _rate_limits_lock:
+        rate_limits[urlsplit(response.url).netloc] = {
+            'limit': int(response.headers.get('X-RateLimit-Limit', 0)),
+            'remaining': int(remaining),
+            'reset': int(response.headers.get('X-RateLimit-Reset', 0)),
+        }
+
+
+def retry_delay(attempt, response=None):
+    """
+    Seconds to wait before retry number attempt, at most
+    HTTP_MAX_RETRY_WAIT.
+    """
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(int(retry_after), settings.HTTP_MAX_RETRY_WAIT)
+    # "full jitter", so clients that failed together don't retry together
+    return random.uniform(0, min(settings.HTTP_MAX_RETRY_WAIT,
+                                 settings.HTTP_BACKOFF * 2 ** (attempt - 1)))
+
+
+def request(method, url, retries=None, retry_post=False, **kwargs):
+    """
+    session.request with a default timeout (HTTP_TIMEOUT) and up to
+    retries (HTTP_RETRIES) retries.
+    """
+    kwargs.setdefault('timeout', settings.HTTP_TIMEOUT)
+    if retries is None:
+        retries = settings.HTTP_RETRIES
+    if method.upper() not in IDEMPOTENT_METHODS and not retry_post:
+        retries = 0
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= retries:
+                raise
+            response = None
+        else:
+            record_rate_limit(response)
+            if (response.status_code not in RETRY_STATUSES or
+                    attempt >= retries):
+                return response
+            response.close()
+        attempt += 1
+        time.sleep(retry_delay(attempt, response))
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
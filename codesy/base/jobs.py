@@ -0,0 +1,188 @@
+"""
+Database-backed background jobs.
+
+Views enqueue() a job of a registered kind and return straight away; the
+run_jobs worker claims due jobs one at a time and runs their handler
+outside of any request. A handler that raises is retried with exponential
+backoff until the job's max_attempts are used up, and a job left running
+by a worker that died is picked up again after JOB_TIMEOUT seconds, so
+handlers must be safe to run more than once. While a handler runs its
+job's lease is renewed in the background, so only jobs whose worker is
+gone are picked up.
+
+Handlers live in a jobs module in each app and register themselves with
+the @handler decorator:
+
+    @jobs.handler('payout')
+    def payout(job, claim_id):
+        ...
+"""
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+# seconds before the first retry; doubled for each attempt after that
+RETRY_DELAY = 30
+
+handlers = {}
+
+
+def handler(kind):
+    def register(fn):
+        handlers[kind] = fn
+        return fn
+    return register
+
+
+def autodiscover():
+    autodiscover_modules('jobs')
+
+
+def enqueue(kind, key, max_attempts=MAX_ATTEMPTS, **args):
+    """
+    Queue a job, unless the one with key is already queued, running or
+    done. A failed job is queued again with a fresh set of attempts.
+    """
+    job, created = Job.objects.get_or_create(
+        key=key,
+        defaults={
+            'kind': kind,
+            'args': json.dumps(args),
+            'max_attempts': max_attempts,
+        }
+    )
+    if not created and job.status == Job.FAILED:
+        Job.objects.filter(id=job.id, status=Job.FAILED).update(
+            status=Job.QUEUED,
+            attempts=0,
+            run_after=timezone.now(),
+            error='',
+        )
+        job.refresh_from_db()
+    return job
+
+
+def claim_next(now=None, key=None):
+    """
+    Mark the next due job (or the job with key, if it's due) as running
+    and return it, or None.
+    """
+    now = now or timezone.now()
+    abandoned = now - timedelta(seconds=settings.JOB_TIMEOUT)
+    jobs = Job.objects.select_for_update(skip_locked=True)
+    if key is not None:
+        jobs = jobs.filter(key=key)
+    with transaction.atomic():
+        job = (
+            jobs.filter(Q(status=Job.QUEUED, run_after__lte=now) |
+                        Q(status=Job.RUNNING, started__lt=abandoned))
+                .order_by('run_after', 'id')
+                .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.started = now
+        job.save(update_fields=['status', 'attempts', 'started'])
+        return job
+
+
+def renew_lease(job, now=None):
+    """
+    Push back the time job would be taken for abandoned. Returns False if
+    another worker has already taken it over.
+    """
+    return bool(
+        Job.objects.filter(id=job.id, status=Job.RUNNING,
+                           attempts=job.attempts)
+                   .update(started=now or timezone.now())
+    )
+
+
+class Heartbeat(threading.Thread):
+    """
+    Renews a running job's lease every JOB_TIMEOUT / 3 seconds until
+    stopped, so a long job isn't run again alongside itself.
+    """
+    def __init__(self, job):
+        super(Heartbeat, self).__init__()
+        self.daemon = True
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOB_TIMEOUT / 3.0):
+                if not renew_lease(self.job):
+                    return
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run(job):
+    """
+    Run a claimed job, then mark it done or schedule its retry. The
+    outcome is only saved while this attempt still holds the job; if it
+    ran so long that another worker took it over, that run's outcome wins.
+    """
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        handlers[job.kind](job, **json.loads(job.args))
+    except Exception as e:
+        logger.exception("Job %s failed on attempt %s" %
+                         (job.key, job.attempts))
+        job.error = u'%s' % e
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            job.finished = timezone.now()
+        else:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(
+                seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+    else:
+        job.status = Job.DONE
+        job.finished = timezone.now()
+        job.error = ''
+    finally:
+        heartbeat.stop()
+    saved = Job.objects.filter(
+        id=job.id, status=Job.RUNNING, attempts=job.attempts
+    ).update(status=job.status, run_after=job.run_after,
+             finished=job.finished, error=job.error)
+    if not saved:
+        logger.warning("Job %s attempt %s was taken over by another worker" %
+                       (job.key, job.attempts))
+    return job
+
+
+def run_pending(limit=None):
+    """
+    Run due jobs until there are none left (or limit have run).
+    """
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run(job)
+        count += 1
+    return count
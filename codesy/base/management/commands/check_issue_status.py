@@ -1,26 +1,91 @@
 import logging
-
+from collections import defaultdict
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
 
 from auctions.models import Issue
-from gh_gql import Issue as ghIssue
+from gh_gql import (
+    ISSUE_REFRESH, QuotaExhausted, get_issue_states, scheduler
+)
 
 logging.basicConfig()
 
 logger = logging.getLogger(__name__)
 
+BATCH_SIZE = 100
+LIMIT = 2000
 
-class Command(BaseCommand):
-    def handle(self, *args, **options):
 
-        issues = Issue.objects.all()
+def refresh_issue_states(issues, batch_size=BATCH_SIZE):
+    """
+    Look up the GitHub state of issues, batch_size issues per GraphQL
+    request.
 
-        try:
-            for issue in issues:
-                gh_issue = ghIssue.get(url=issue.url)
-                issue.state = gh_issue['resource']['state']
-                issue.save()
+    Only issues whose state changed are written, with one .update per new
+    state, so no signals (or title fetches) fire. Every checked issue has
+    last_fetched set, so it drops out of Issue.objects.due_for_refresh()
+    and a run that dies part way through picks up where it left off. A
+    failed batch is logged and skipped, and is still due on the next run.
+    If the GraphQL rate limit won't reset soon enough, the run stops and
+    leaves the rest of the issues due.
 
+    Returns counts of api_calls, checked, changed and failed issues.
+    """
+    stats = {'api_calls': 0, 'checked': 0, 'changed': 0, 'failed': 0}
+    rows = list(issues.values_list('id', 'url', 'state'))
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        stats['api_calls'] += 1
+        try:
+            states = get_issue_states([url for _, url, _ in batch])
+        except QuotaExhausted as e:
+            stats['api_calls'] -= 1
+            logger.warning("check_issue_status stopped: %s" % e)
+            break
         except Exception as e:
             logger.error("check_issue_status, error: %s" % e)
+            stats['failed'] += len(batch)
+            continue
+
+        new_states = defaultdict(list)
+        for issue_id, url, state in batch:
+            new_state = states.get(url)
+            if new_state and new_state != state:
+                new_states[new_state].append(issue_id)
+
+        now = timezone.now()
+        with transaction.atomic():
+            for state, ids in new_states.items():
+                Issue.objects.filter(id__in=ids).update(state=state)
+                stats['changed'] += len(ids)
+            Issue.objects.filter(
+                id__in=[issue_id for issue_id, _, _ in batch]
+            ).update(last_fetched=now)
+        stats['checked'] += len(batch)
+    return stats
+
+
+class Command(BaseCommand):
+    help = "Refresh the state of the issues most in need of it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--limit', type=int, default=LIMIT,
+            help="Check at most this many issues per run"
+        )
+
+    def handle(self, *args, **options):
+        issues = Issue.objects.due_for_refresh()[:options['limit']]
+        with scheduler.running('check_issue_status', ISSUE_REFRESH) as usage:
+            stats = refresh_issue_states(issues, options['batch_size'])
+        stats['cost'], stats['waited'] = usage['cost'], usage['waited']
+        message = (
+            "check_issue_status: %(api_calls)s API calls, %(checked)s issues "
+            "checked, %(changed)s changed state, %(failed)s failed, "
+            "%(cost)s rate limit points used, %(waited)ss waited" % stats
+        )
+        logger.info(message)
+        self.stdout.write(message)
@@ -1,64 +1,226 @@
-import requests
+import calendar
+import logging
+import Queue
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
 
+from codesy.base import http
+
+logger = logging.getLogger(__name__)
+
 GITHUB_ROOT = 'https://api.github.com/graphql'
 GITHUB_API_KEY = settings.GITHUB_API_KEY
 headers = {"Authorization": 'bearer %s' % GITHUB_API_KEY}
 
+RATE_LIMIT_FIELD = '  rateLimit { cost remaining resetAt }\n'
+
+# query priorities: issue-state refreshes may spend the whole budget, graph
+# loads leave GITHUB_GRAPH_RESERVE points of it for them
+ISSUE_REFRESH = 'issue_refresh'
+GRAPH_LOAD = 'graph_load'
+
+
+class QuotaExhausted(Exception):
+    pass
+
+
+def with_rate_limit(query_string):
+    """adds rateLimit to the top level of a query"""
+    end = query_string.rstrip().rfind('}')
+    return query_string[:end] + RATE_LIMIT_FIELD + query_string[end:]
+
+
+class QueryScheduler(object):
+    """
+    keeps GraphQL queries within GitHub's hourly rate limit budget.
+
+    Every query asks for its rateLimit, and the scheduler keeps the latest
+    remaining points and reset time. That's per process: separate commands
+    only learn the budget from their own responses, so a command's first
+    query goes unchecked, but every answer reflects all of the points
+    spent against the token.
+
+    Before a query wait() pauses until the budget resets if the query would
+    leave less than its priority's reserve, or raises QuotaExhausted if
+    that's more than GITHUB_MAX_QUOTA_WAIT seconds away. usage counts the
+    queries, points and seconds waited of each command.
+    """
+    def __init__(self):
+        # (remaining points, reset time in epoch seconds) from GitHub
+        self.state = None
+        self.command = 'other'
+        self.priority = ISSUE_REFRESH
+        self.usage = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def running(self, command, priority):
+        previous = self.command, self.priority
+        self.command, self.priority = command, priority
+        try:
+            yield self.usage[command]
+        finally:
+            self.command, self.priority = previous
+
+    def reserve(self):
+        if self.priority == ISSUE_REFRESH:
+            return 0
+        return settings.GITHUB_GRAPH_RESERVE
+
+    def wait(self, cost=1):
+        state = self.state
+        if state is None:
+            return
+        remaining, reset_at = state
+        delay = reset_at - time.time()
+        if delay <= 0 or remaining - cost >= self.reserve():
+            return
+        if delay > settings.GITHUB_MAX_QUOTA_WAIT:
+            raise QuotaExhausted(
+                "%s GraphQL points left until %s" % (
+                    remaining, time.strftime('%H:%M:%S UTC',
+                                             time.gmtime(reset_at))))
+        logger.info("%s pausing %ds for the GitHub rate limit" %
+                    (self.command, delay))
+        time.sleep(delay)
+        with self._lock:
+            self.usage[self.command]['waited'] += int(delay)
+
+    def record(self, rate_limit):
+        reset_at = calendar.timegm(
+            time.strptime(rate_limit['resetAt'], '%Y-%m-%dT%H:%M:%SZ'))
+        with self._lock:
+            self.state = rate_limit['remaining'], reset_at
+            usage = self.usage[self.command]
+            usage['queries'] += 1
+            usage['cost'] += rate_limit['cost']
+
+
+scheduler = QueryScheduler()
+
 
 class ghQuery(object):
     """generic graphql query. must supply query string"""
     def __init__(self, query_string):
         self.template = query_string
         self.response_dict = {}
+        # what the query cost last time, assumed before each run
+        self.cost = 1
 
-    def get(self, **kwargs):
+    def post(self, **kwargs):
+        """returns the whole response, including any errors"""
+        scheduler.wait(self.cost)
         query_with_arg = {
-            'query': self.template,
+            'query': with_rate_limit(self.template),
             'variables': kwargs
         }
-        request = requests.post(
-            GITHUB_ROOT, json=query_with_arg, headers=headers)
+        # queries don't change anything, so they're safe to retry
+        request = http.post(GITHUB_ROOT, json=query_with_arg,
+                            headers=headers, retry_post=True)
         if request.status_code == 200:
             response = request.json()
-            if 'errors' in response.keys():
-                for error in response['errors']:
-                    raise Exception("""
-                        Error: {} At: {}
-                    """.format(error['message'], error['locations'])
-                    )
-            else:
-                return response['data']
+            rate_limit = (response.get('data') or {}).get('rateLimit')
+            if rate_limit:
+                self.cost = rate_limit['cost']
+                scheduler.record(rate_limit)
+            return response
         else:
             raise Exception("""
                 Query failed to run by returning code of {}. {}
-            """.format(request.status_code, self.query_string))
+            """.format(request.status_code, self.template))
+
+    def get(self, **kwargs):
+        response = self.post(**kwargs)
+        if 'errors' in response.keys():
+            for error in response['errors']:
+                raise Exception("""
+                    Error: {} At: {}
+                """.format(error['message'], error['locations'])
+                )
+        else:
+            return response['data']
 
 
 class RepoList(object):
-    """returns a iterator of repos."""
+    """iterates over the repos of one type of a user, a page at a time"""
     def __init__(self, **kwargs):
-        self.type = kwargs['type']
+        self.type = kwargs.pop('type')
+        self.login = kwargs['login']
         self.gh_query = ghQuery(repo_query % self.type)
-        self.repositories = []
         self.kwargs = kwargs
-        self.request()
+
+    def page(self, after=None):
+        """returns the page's edges and the cursor of the next page, or None
+        if it's the last"""
+        response = self.gh_query.get(after=after, **self.kwargs)
+        list_info = response['user'][self.type]
+        page_info = list_info['pageInfo']
+        if not page_info['hasNextPage']:
+            return list_info['edges'], None
+        return list_info['edges'], page_info['endCursor']
 
     def __iter__(self):
-        for r in self.repositories:
-            yield r
-        if self.hasNextPage:
-            self.request()
-            for r in self.__iter__():
-                yield r
+        after = None
+        while True:
+            edges, after = self.page(after)
+            for edge in edges:
+                yield edge
+            if after is None:
+                return
+
 
-    def request(self):
-        self.response = self.gh_query.get(**self.kwargs)
-        list_info = self.response['user'][self.type]
-        self.repositories = list_info['edges']
-        self.hasNextPage = list_info['pageInfo']['hasNextPage']
-        self.kwargs['after'] = list_info['pageInfo']['endCursor']
+def _fetch_page(repo_list, after):
+    try:
+        return repo_list, repo_list.page(after), None
+    except Exception as e:
+        return repo_list, None, e
+
+
+def fetch_repo_lists(pairs, workers=None):
+    """
+    yields (login, type, repo) for the repos of many (login, type) pairs,
+    fetching pages on at most workers (GITHUB_WORKERS) threads.
+
+    Each pair has at most one page in flight, the next one asked for as soon
+    as its cursor is known, so repos come out as the pages arrive and no
+    more than workers pages are held at once. A pair that fails is logged
+    and dropped; QuotaExhausted stops the whole fetch.
+    """
+    waiting = deque((RepoList(type=repo_type, login=login), None)
+                    for login, repo_type in pairs)
+    workers = min(workers or settings.GITHUB_WORKERS, len(waiting))
+    if not waiting:
+        return
+    pool = ThreadPool(processes=workers)
+    results = Queue.Queue()
+    in_flight = 0
+    try:
+        while waiting or in_flight:
+            while waiting and in_flight < workers:
+                pool.apply_async(_fetch_page, waiting.popleft(),
+                                 callback=results.put)
+                in_flight += 1
+            repo_list, page, error = results.get()
+            in_flight -= 1
+            if isinstance(error, QuotaExhausted):
+                raise error
+            if error is not None:
+                logger.error("fetch_repo_lists, %s of %s, error: %s" %
+                             (repo_list.type, repo_list.login, error))
+                continue
+            edges, after = page
+            if after is not None:
+                waiting.append((repo_list, after))
+            for edge in edges:
+                yield repo_list.login, repo_list.type, edge['node']
+    finally:
+        pool.close()
+        pool.join()
 
 
 user_query = """
@@ -121,3 +283,32 @@ query findIssue($url: URI!) {
 """
 
 Issue = ghQuery(issue_query)
+
+
+def issue_states_query(count):
+    """one aliased resource() lookup per url: $u0 -> i0, $u1 -> i1, ..."""
+    params = ', '.join('$u%d: URI!' % n for n in range(count))
+    fields = '\n'.join(
+        '  i%d: resource(url: $u%d) { ... on Issue { state } }' % (n, n)
+        for n in range(count)
+    )
+    return 'query issueStates(%s) {\n%s\n}' % (params, fields)
+
+
+def get_issue_states(urls):
+    """
+    returns {url: state} for many issues in one request. Urls that can't be
+    found or aren't issues map to None instead of failing the whole batch.
+    """
+    query = ghQuery(issue_states_query(len(urls)))
+    response = query.post(**dict(
+        ('u%d' % n, url) for n, url in enumerate(urls)
+    ))
+    data = response.get('data')
+    if data is None:
+        raise Exception("Error: {}".format(response.get('errors')))
+    states = {}
+    for n, url in enumerate(urls):
+        resource = data.get('i%d' % n) or {}
+        states[url] = resource.get('state')
+    return states
@@ -6,57 +6,134 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 
 from ...models import User
-from gh_gql import User as ghUser, RepoList
+from gh_gql import (
+    GRAPH_LOAD, QuotaExhausted, User as ghUser, fetch_repo_lists, scheduler
+)
 
 logging.basicConfig()
 
 logger = logging.getLogger(__name__)
 
 
-def neo4j_merge_user(user, session):
-    # neo4j statement requires a name parameter; set if empty
-    user.setdefault('name', '')
-    statement = """
-        MERGE (u:User {{id:'{}'}})
-        SET u.name='{}', u.email='{}', u.login='{}'
-    """.format(user['id'], user['name'], user['email'], user['login'])
-    session.run(statement)
-    session.sync()
+BATCH_SIZE = 1000
 
+RELATIONSHIPS = ('OWNER', 'STARRED', 'CONTRIBUTED')
 
-def neo4j_merge_repo(repo, session):
-    template = """
-      MERGE (r:Repo {{id:'{}'}})
-      SET r.name='{}', r.primaryLanguage='{}', r.owner='{}'
-    """
-    if 'primaryLanguage' in repo.keys():
-        language = (
-            repo['primaryLanguage']['name'] if repo['primaryLanguage'] else ""
-        )
-    else:
-        language = u'none'
-    statement = (
-        template.format(repo['id'], repo['name'], language, repo['owner'])
-    )
-    session.run(statement)
-    session.sync()
+MERGE_USERS = """
+    UNWIND $rows AS row
+    MERGE (u:User {id: row.id})
+    SET u.name = row.name, u.email = row.email, u.login = row.login
+"""
+
+MERGE_REPOS = """
+    UNWIND $rows AS row
+    MERGE (r:Repo {id: row.id})
+    SET r.name = row.name, r.primaryLanguage = row.primaryLanguage,
+        r.owner = row.owner
+"""
+
+# relationship types can't be parameters, so there's one per type
+MERGE_RELATIONSHIPS = """
+    UNWIND $rows AS row
+    MATCH (u:User {id: row.user_id}), (r:Repo {id: row.repo_id})
+    MERGE (u)-[:%s]->(r)
+"""
 
 
-def neo4j_match_repo_relationship(user_id, repo_id, relationship, session):
-    statement = """
-       MATCH (u:User),(r:Repo) WHERE u.id ='{}' AND r.id='{}'
-       MERGE (u)-[:{}]->(r)
-    """.format(user_id, repo_id, relationship)
-    session.run(statement)
-    session.sync()
+def repo_language(repo):
+    if 'primaryLanguage' not in repo:
+        return u'none'
+    return repo['primaryLanguage']['name'] if repo['primaryLanguage'] else ''
+
+
+class GraphWriter(object):
+    """
+    Buffers users, repos and relationships and writes them batch_size rows
+    at a time, with one parameterized UNWIND statement per kind of row in a
+    single write transaction. Nodes are written before the relationships
+    between them. Call flush() once everything has been added.
+    """
+    def __init__(self, session, batch_size=BATCH_SIZE):
+        self.session = session
+        self.batch_size = batch_size
+        self.users = {}
+        self.repos = {}
+        self.relationships = dict((name, []) for name in RELATIONSHIPS)
+        self.pending = 0
+        self.transactions = 0
+
+    def _added(self):
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def add_user(self, user):
+        self.users[user['id']] = {
+            'id': user['id'],
+            # neo4j statement requires a name parameter; set if empty
+            'name': user.get('name') or '',
+            'email': user.get('email'),
+            'login': user['login'],
+        }
+        self._added()
+
+    def add_repo(self, repo):
+        self.repos[repo['id']] = {
+            'id': repo['id'],
+            'name': repo['name'],
+            'primaryLanguage': repo_language(repo),
+            'owner': repo['owner'],
+        }
+        self._added()
+
+    def add_relationship(self, user_id, repo_id, relationship):
+        self.relationships[relationship].append(
+            {'user_id': user_id, 'repo_id': repo_id})
+        self._added()
+
+    def statements(self):
+        if self.users:
+            yield MERGE_USERS, self.users.values()
+        if self.repos:
+            yield MERGE_REPOS, self.repos.values()
+        for relationship in RELATIONSHIPS:
+            if self.relationships[relationship]:
+                yield (MERGE_RELATIONSHIPS % relationship,
+                       self.relationships[relationship])
+
+    @staticmethod
+    def _write(tx, statements):
+        for statement, rows in statements:
+            tx.run(statement, {'rows': rows})
+
+    def flush(self):
+        statements = list(self.statements())
+        if statements:
+            self.session.write_transaction(self._write, statements)
+            self.transactions += 1
+        self.users = {}
+        self.repos = {}
+        self.relationships = dict((name, []) for name in RELATIONSHIPS)
+        self.pending = 0
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Threads fetching repo pages (default GITHUB_WORKERS)"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help="Nodes and relationships written per neo4j transaction"
+        )
+
     def handle(self, *args, **options):
         driver = GraphDatabase.driver(settings.NEO4J_BOLT_URL, auth=basic_auth(
             settings.NEO4J_USER, settings.NEO4J_PASSWORD)
         )
         session = driver.session()
+        writer = GraphWriter(session, options['batch_size'])
 
         # TODO: Figure out a way to not delete the whole graph db every time
         # session.run("MATCH (n) DETACH DELETE n")
@@ -75,26 +152,46 @@ class Command(BaseCommand):
             'starredRepositories': 'STARRED',
             'contributedRepositories': "CONTRIBUTED"
         }
-        for username in user_list:
-            if username == u'admin':
-                continue
-
+        # graph loads give way to issue-state refreshes, see gh_gql
+        with scheduler.running('load_user_github_graph', GRAPH_LOAD) as usage:
+            gh_ids = {}
+            for username in user_list:
+                if username == u'admin':
+                    continue
+
+                try:
+                    gh_user = ghUser.get(login=username)['user']
+                    writer.add_user(gh_user)
+                    gh_ids[username] = gh_user['id']
+                except QuotaExhausted as e:
+                    logger.warning("load_user_github_graph stopped: %s" % e)
+                    break
+                except Exception as e:
+                    logger.error("load_user_github_graph, error: %s" % e)
+
+            # every user's repo lists are paged through at once; the
+            # neo4j writes stay on this thread
+            pairs = [(username, repo_type)
+                     for username in gh_ids for repo_type in repo_types]
             try:
-                gh_user = ghUser.get(login=username)['user']
-                neo4j_merge_user(gh_user, session)
-                for repo_type in repo_types.keys():
-                    repos = RepoList(type=repo_type, login=username)
-                    for repo in repos:
-                        repo_values = repo['node']
-                        neo4j_merge_repo(repo_values, session)
-                        neo4j_match_repo_relationship(
-                            gh_user['id'], repo_values['id'],
-                            repo_types[repo_type], session
-                        )
-            except Exception as e:
-                logger.error("load_user_github_graph, error: %s" % e)
-
+                for username, repo_type, repo_values in fetch_repo_lists(
+                        pairs, options['workers']):
+                    writer.add_repo(repo_values)
+                    writer.add_relationship(
+                        gh_ids[username], repo_values['id'],
+                        repo_types[repo_type]
+                    )
+            except QuotaExhausted as e:
+                logger.warning("load_user_github_graph stopped: %s" % e)
+
+        writer.flush()
         session.close()
+        logger.info(
+            "load_user_github_graph: %s queries, %s rate limit points used, "
+            "%ss waited, %s neo4j transactions" % (
+                usage['queries'], usage['cost'], usage['waited'],
+                writer.transactions)
+        )
 
 
 '''
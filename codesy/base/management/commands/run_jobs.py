@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ... import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs, polling for new ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once there are no jobs due instead of polling"
+        )
+        parser.add_argument('--sleep', type=float, default=5,
+                            help="Seconds to wait between polls")
+
+    def handle(self, *args, **options):
+        jobs.autodiscover()
+        while True:
+            ran = jobs.run_pending()
+            if ran:
+                self.stdout.write('Ran %s jobs' % ran)
+            if options['once']:
+                return
+            # don't hold a connection open while idle
+            connection.close()
+            time.sleep(options['sleep'])
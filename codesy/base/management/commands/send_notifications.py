@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ...outbox import BATCH_SIZE, send_pending
+
+
+class Command(BaseCommand):
+    help = "Render queued notifications and hand them to the mailer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        sent = send_pending(batch_size=options['batch_size'])
+        self.stdout.write('Sent %s notifications' % sent)
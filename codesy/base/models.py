@@ -1,15 +1,17 @@
+import json
 import logging
 import sys
 
-import requests
-
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.dispatch import receiver
+from django.utils import timezone
 from allauth.account.signals import user_signed_up
 
 from payments.models import StripeAccount, get_customer_token
 
+from . import http
+
 EMAIL_URL = 'https://api.github.com/user/emails'
 
 logger = logging.getLogger(__name__)
@@ -60,11 +62,75 @@ class User(AbstractUser):
         super(User, self).save(*args, **kwargs)
 
 
+class Notification(models.Model):
+    """
+    An email waiting in the outbox. See codesy.base.outbox.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    template = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    recipient = models.EmailField()
+    context = models.TextField(default='{}', blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __unicode__(self):
+        return u'%s to %s' % (self.key, self.recipient)
+
+
+class Job(models.Model):
+    """
+    A piece of work for the run_jobs worker. See codesy.base.jobs.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    key = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=255)
+    args = models.TextField(default='{}', blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES,
+                              default=QUEUED, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    progress = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.key, self.status)
+
+    def set_progress(self, progress):
+        self.progress = progress
+        Job.objects.filter(id=self.id).update(progress=progress)
+
+    def save_args(self, **args):
+        """
+        Merge args into the ones the job is run with, so a job that dies
+        part way through can be retried from a checkpoint.
+        """
+        merged = json.loads(self.args)
+        merged.update(args)
+        self.args = json.dumps(merged)
+        Job.objects.filter(id=self.id).update(args=self.args)
+
+
 @receiver(user_signed_up)
 def add_signup_email_and_start_inactive(sender, request, user, **kwargs):
     user.is_active = True
     params = {'access_token': kwargs['sociallogin'].token}
-    email_data = requests.get(EMAIL_URL, params=params).json()
+    email_data = http.get(EMAIL_URL, params=params).json()
     if email_data:
         verified_emails = [e for e in email_data if e['verified']]
         if not verified_emails:
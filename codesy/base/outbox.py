@@ -0,0 +1,134 @@
+"""
+Transactional outbox for notification emails.
+
+Signal handlers record what should be sent with queue(), which writes all of
+the Notification rows in one insert inside the current transaction, so a
+rolled back request sends nothing. The send_notifications command renders
+pending notifications in batches and hands them to django-mailer.
+
+Every notification has a unique key, so queueing the same notification twice
+(e.g. a claim approval seen by several votes) only sends it once.
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.template.loader import get_template
+from django.utils import timezone
+
+from mailer import send_mail
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+
+# renders a notification may fail before it's given up on
+MAX_ATTEMPTS = 5
+
+_templates = {}
+
+
+def compiled_template(name):
+    if name not in _templates:
+        _templates[name] = get_template(name)
+    return _templates[name]
+
+
+def notification(key, template, subject, recipient, **context):
+    """
+    Build an unsaved Notification; context values must be JSON-serializable.
+    """
+    return Notification(
+        key=key,
+        template=template,
+        subject=subject,
+        recipient=recipient,
+        context=json.dumps(context),
+    )
+
+
+def queue(notifications):
+    """
+    Save notifications whose key hasn't been queued before.
+    """
+    if not notifications:
+        return []
+    seen = set(
+        Notification.objects.filter(key__in=[n.key for n in notifications])
+                            .values_list('key', flat=True)
+    )
+    new = []
+    for n in notifications:
+        if n.key not in seen:
+            seen.add(n.key)
+            new.append(n)
+    if not new:
+        return []
+
+    try:
+        with transaction.atomic():
+            Notification.objects.bulk_create(new)
+    except IntegrityError:
+        # another request queued one of these keys since we looked
+        for n in new:
+            try:
+                with transaction.atomic():
+                    n.save()
+            except IntegrityError:
+                pass
+    return new
+
+
+def render(notification, site):
+    context = json.loads(notification.context)
+    context['site'] = site
+    return compiled_template(notification.template).render(context)
+
+
+def send_pending(batch_size=BATCH_SIZE):
+    """
+    Render and send all pending notifications, batch_size at a time.
+
+    A notification that fails to render keeps its error and is tried again
+    on later runs, until it has failed MAX_ATTEMPTS times.
+    """
+    site = Site.objects.get_current()
+    sent = 0
+    last_id = 0
+    while True:
+        batch = list(
+            Notification.objects.filter(sent=None,
+                                        attempts__lt=MAX_ATTEMPTS,
+                                        id__gt=last_id)
+                                .order_by('id')[:batch_size]
+        )
+        if not batch:
+            return sent
+        last_id = batch[-1].id
+        sent_ids = []
+        for n in batch:
+            try:
+                message = render(n, site)
+            except Exception as e:
+                logger.error("Notification %s failed to render: %s" %
+                             (n.key, e))
+                Notification.objects.filter(id=n.id).update(
+                    attempts=F('attempts') + 1,
+                    error=u'%s' % e,
+                )
+                continue
+            send_mail(
+                n.subject,
+                message,
+                settings.DEFAULT_FROM_EMAIL,
+                [n.recipient]
+            )
+            sent_ids.append(n.id)
+        Notification.objects.filter(id__in=sent_ids).update(
+            sent=timezone.now())
+        sent += len(sent_ids)
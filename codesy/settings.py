@@ -273,3 +273,80 @@ NEO4J_BOLT_URL = config('NEO4J_BOLT_URL', default='')
 NEO4J_USER = config('NEO4J_USER', default='')
 NEO4J_PASSWORD = config('NEO4J_PASSWORD', default='')
 GITHUB_API_KEY = config('GITHUB_API_KEY', default='')
+
+# Background page title fetching (see auctions.titles)
+# 0 workers fetches titles inline at commit time
+TITLE_FETCH_WORKERS = config('TITLE_FETCH_WORKERS', default=4, cast=int)
+TITLE_FETCH_TIMEOUT = config('TITLE_FETCH_TIMEOUT', default=5, cast=float)
+TITLE_CACHE_SIZE = config('TITLE_CACHE_SIZE', default=1000, cast=int)
+# seconds before a cached title is revalidated with a conditional GET
+TITLE_CACHE_TTL = config('TITLE_CACHE_TTL', default=3600, cast=int)
+
+# seconds the first page of the activity list is cached (bid saves expire it)
+ACTIVITY_CACHE_TIMEOUT = config('ACTIVITY_CACHE_TIMEOUT', default=30,
+                                cast=int)
+
+# GraphQL rate limit points graph loads leave for issue-state refreshes,
+# and the longest a command pauses for the limit to reset before stopping
+GITHUB_GRAPH_RESERVE = config('GITHUB_GRAPH_RESERVE', default=1000, cast=int)
+GITHUB_MAX_QUOTA_WAIT = config('GITHUB_MAX_QUOTA_WAIT', default=15 * 60,
+                               cast=int)
+# threads fetching repo pages for load_user_github_graph
+GITHUB_WORKERS = config('GITHUB_WORKERS', default=8, cast=int)
+
+# outbound HTTP, see codesy.base.http: hosts to keep connection pools for,
+# connections kept per host, seconds before giving up on a request, and how
+# often and (in seconds) how long to back off retrying failed requests
+HTTP_POOL_HOSTS = config('HTTP_POOL_HOSTS', default=10, cast=int)
+HTTP_POOL_SIZE = config('HTTP_POOL_SIZE', default=10, cast=int)
+HTTP_TIMEOUT = config('HTTP_TIMEOUT', default=10, cast=float)
+HTTP_RETRIES = config('HTTP_RETRIES', default=3, cast=int)
+HTTP_BACKOFF = config('HTTP_BACKOFF', default=0.5, cast=float)
+HTTP_MAX_RETRY_WAIT = config('HTTP_MAX_RETRY_WAIT', default=30, cast=int)
+STRIPE_TIMEOUT = config('STRIPE_TIMEOUT', default=30, cast=float)
+
+# seconds before a job left running by a dead worker is run again
+JOB_TIMEOUT = config('JOB_TIMEOUT', default=15 * 60, cast=int)
+
+# threads making Stripe calls while a claim is paid out or offers are
+# reauthorized
+PAYOUT_WORKERS = config('PAYOUT_WORKERS', default=8, cast=int)
+
+# seconds the middleware trusts a user's stored identity verification for
+# (saving their StripeAccount expires it)
+IDENTITY_VERIFIED_CACHE_TIMEOUT = config('IDENTITY_VERIFIED_CACHE_TIMEOUT',
+                                         default=300, cast=int)
+
+# store Stripe webhook events zlib compressed
+STRIPE_EVENT_COMPRESS = config('STRIPE_EVENT_COMPRESS', default=True,
+                               cast=bool)
+
+# where archive_stripe_events writes old events, and how many days of
+# processed events it leaves in the database. The events are deleted once
+# they're written, so the directory must be on persistent storage (not a
+# Heroku dyno's filesystem); there's no default and the command won't run
+# without one.
+STRIPE_EVENT_ARCHIVE_DIR = config('STRIPE_EVENT_ARCHIVE_DIR', default='')
+STRIPE_EVENT_RETENTION_DAYS = config('STRIPE_EVENT_RETENTION_DAYS',
+                                     default=90, cast=int)
+
+# most Stripe requests per second made by the reauthorize command
+STRIPE_RATE_LIMIT = config('STRIPE_RATE_LIMIT', default=20, cast=float)
+
+# precomputed charge and payout for every bid amount; see build_fee_table
+FEE_TABLE_PATH = config('FEE_TABLE_PATH',
+                        default=os.path.join(BASE_DIR, 'payments',
+                                             'fee_table.bin'))
+
+# hours between GitHub state checks of open issues with live offers or
+# undecided claims, other open issues, and closed issues
+ISSUE_REFRESH_ACTIVE_HOURS = config('ISSUE_REFRESH_ACTIVE_HOURS', default=6,
+                                    cast=int)
+ISSUE_REFRESH_IDLE_HOURS = config('ISSUE_REFRESH_IDLE_HOURS', default=24,
+                                  cast=int)
+ISSUE_REFRESH_CLOSED_HOURS = config('ISSUE_REFRESH_CLOSED_HOURS',
+                                    default=24 * 7, cast=int)
+
+# seconds the add-on caches whether anyone has bid on an issue url
+ACTIVE_ISSUE_CACHE_TIMEOUT = config('ACTIVE_ISSUE_CACHE_TIMEOUT', default=60,
+                                    cast=int)
@@ -0,0 +1,80 @@
+import fudge
+
+from django.test import TestCase
+
+from ..base.management.commands import gh_gql
+
+
+def repo_page(repo_type, names, cursor=None):
+    return {'data': {'user': {repo_type: {
+        'pageInfo': {'endCursor': cursor, 'hasNextPage': bool(cursor)},
+        'edges': [{'node': {'id': name, 'name': name}} for name in names],
+    }}}}
+
+
+def fake_github(pages):
+    """answers repo queries from pages: {(login, after): response}"""
+    def post(url, json, **kwargs):
+        variables = json['variables']
+        response = pages[(variables['login'], variables['after'])]
+        return (fudge.Fake().has_attr(status_code=200)
+                            .provides('json').returns(response))
+    return post
+
+
+class RepoListTest(TestCase):
+
+    def setUp(self):
+        gh_gql.scheduler.state = None
+
+    @fudge.patch('codesy.base.management.commands.gh_gql.http.post')
+    def test_pages_are_followed_without_recursion(self, mock_post):
+        pages = dict(
+            (('codesy', 'c%s' % n if n else None),
+             repo_page('repositories', ['r%s' % n], 'c%s' % (n + 1)))
+            for n in range(1500)
+        )
+        pages[('codesy', 'c1500')] = repo_page('repositories', ['last'])
+        mock_post.is_callable().calls(fake_github(pages))
+        repos = list(gh_gql.RepoList(type='repositories', login='codesy'))
+        self.assertEqual(1501, len(repos))
+        self.assertEqual('last', repos[-1]['node']['name'])
+
+
+class FetchRepoListsTest(TestCase):
+
+    def setUp(self):
+        gh_gql.scheduler.state = None
+
+    @fudge.patch('codesy.base.management.commands.gh_gql.http.post')
+    def test_repos_of_every_pair_are_fetched(self, mock_post):
+        mock_post.is_callable().calls(fake_github({
+            ('april', None): repo_page('repositories', ['a1'], 'next'),
+            ('april', 'next'): repo_page('repositories', ['a2']),
+            ('jgmize', None): repo_page('repositories', ['j1']),
+        }))
+        repos = gh_gql.fetch_repo_lists(
+            [('april', 'repositories'), ('jgmize', 'repositories')],
+            workers=2)
+        self.assertEqual(
+            [('april', 'repositories', 'a1'), ('april', 'repositories', 'a2'),
+             ('jgmize', 'repositories', 'j1')],
+            sorted((login, repo_type, repo['name'])
+                   for login, repo_type, repo in repos)
+        )
+
+    @fudge.patch('codesy.base.management.commands.gh_gql.http.post')
+    def test_failed_pair_is_dropped(self, mock_post):
+        mock_post.is_callable().calls(fake_github({
+            ('jgmize', None): repo_page('repositories', ['j1']),
+        }))
+        repos = gh_gql.fetch_repo_lists(
+            [('april', 'repositories'), ('jgmize', 'repositories')],
+            workers=2)
+        self.assertEqual(['j1'], [repo['name'] for _, _, repo in repos])
+
+    @fudge.patch('codesy.base.management.commands.gh_gql.RepoList.page')
+    def test_exhausted_quota_stops_the_fetch(self, mock_page):
+        mock_page.is_callable().raises(gh_gql.QuotaExhausted('0 left'))
+        repos = gh_gql.fetch_repo_lists([('april', 'repositories')])
+        self.assertRaises(gh_gql.QuotaExhausted, list, repos)
@@ -0,0 +1,84 @@
+from django.test import TestCase
+
+from ..base.management.commands import load_user_github_graph as graph
+
+
+class MemoryGraph(object):
+    """stands in for a neo4j session, applying the writer's statements"""
+    def __init__(self):
+        self.users = {}
+        self.repos = {}
+        self.edges = set()
+        self.transactions = []
+
+    def write_transaction(self, unit_of_work, *args):
+        self.transactions.append([])
+        return unit_of_work(self, *args)
+
+    def run(self, statement, parameters):
+        rows = parameters['rows']
+        self.transactions[-1].append(len(rows))
+        if statement == graph.MERGE_USERS:
+            self.users.update((row['id'], row) for row in rows)
+        elif statement == graph.MERGE_REPOS:
+            self.repos.update((row['id'], row) for row in rows)
+        else:
+            relationship = statement.split('[:')[1].split(']')[0]
+            self.edges.update(
+                (row['user_id'], relationship, row['repo_id'])
+                for row in rows
+                if row['user_id'] in self.users and
+                row['repo_id'] in self.repos
+            )
+
+
+class GraphWriterTest(TestCase):
+
+    def setUp(self):
+        self.store = MemoryGraph()
+        self.writer = graph.GraphWriter(self.store, batch_size=5)
+
+    def add_repos(self, user_id, count, relationship='STARRED'):
+        for n in range(count):
+            self.writer.add_repo({
+                'id': 'repo%s' % n, 'name': "o'reilly-%s" % n,
+                'owner': 'codesy', 'primaryLanguage': {'name': 'Python'},
+            })
+            self.writer.add_relationship(user_id, 'repo%s' % n, relationship)
+
+    def test_rows_are_written_in_batches(self):
+        self.writer.add_user({'id': 'u1', 'login': 'april', 'name': None,
+                              'email': 'april@codesy.io'})
+        self.add_repos('u1', 4)
+        self.writer.flush()
+
+        # nine rows in batches of five: the user and two repos with their
+        # stars, then the last two repos with theirs
+        self.assertEqual([[1, 2, 2], [2, 2]], self.store.transactions)
+        self.assertEqual(2, self.writer.transactions)
+        self.assertEqual('', self.store.users['u1']['name'])
+        self.assertEqual(4, len(self.store.edges))
+        self.assertIn(('u1', 'STARRED', 'repo3'), self.store.edges)
+
+    def test_names_are_parameters_not_cypher(self):
+        self.writer.add_user({'id': 'u1', 'login': 'april',
+                              'name': 'April "Chomp" O\'Neil'})
+        self.writer.flush()
+        self.assertEqual('April "Chomp" O\'Neil',
+                         self.store.users['u1']['name'])
+
+    def test_repos_are_written_once_per_batch(self):
+        writer = graph.GraphWriter(self.store, batch_size=100)
+        writer.add_user({'id': 'u1', 'login': 'april'})
+        writer.add_user({'id': 'u2', 'login': 'jgmize'})
+        for user_id in ('u1', 'u2'):
+            writer.add_repo({'id': 'repo1', 'name': 'codesy',
+                             'owner': 'codesy', 'primaryLanguage': None})
+            writer.add_relationship(user_id, 'repo1', 'STARRED')
+        writer.flush()
+        self.assertEqual([[2, 1, 2]], self.store.transactions)
+        self.assertEqual('', self.store.repos['repo1']['primaryLanguage'])
+
+    def test_flush_without_rows_writes_nothing(self):
+        self.writer.flush()
+        self.assertEqual([], self.store.transactions)
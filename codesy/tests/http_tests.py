@@ -0,0 +1,73 @@
+import fudge
+import requests
+
+from django.test import TestCase, override_settings
+
+from ..base import http
+
+
+def response(status_code, headers=None, url='https://api.github.com/x'):
+    return (fudge.Fake().has_attr(status_code=status_code,
+                                  headers=headers or {}, url=url)
+                        .provides('close'))
+
+
+@override_settings(HTTP_RETRIES=2)
+class RequestTest(TestCase):
+
+    @fudge.patch('codesy.base.http.session', 'codesy.base.http.time')
+    def test_get_retries_server_errors(self, mock_session, mock_time):
+        (mock_session.expects('request')
+                     .with_args('GET', 'https://x.test/', timeout=10)
+                     .returns(response(503))
+                     .next_call()
+                     .returns(response(200)))
+        mock_time.expects('sleep').times_called(1)
+        self.assertEqual(200, http.get('https://x.test/').status_code)
+
+    @fudge.patch('codesy.base.http.session', 'codesy.base.http.time')
+    def test_gives_up_after_retries(self, mock_session, mock_time):
+        mock_session.expects('request').returns(response(502))
+        mock_time.expects('sleep').times_called(2)
+        self.assertEqual(502, http.get('https://x.test/').status_code)
+
+    @fudge.patch('codesy.base.http.session', 'codesy.base.http.time')
+    def test_post_is_only_retried_when_safe(self, mock_session, mock_time):
+        (mock_session.expects('request')
+                     .raises(requests.ConnectionError())
+                     .next_call()
+                     .raises(requests.ConnectionError())
+                     .next_call()
+                     .returns(response(200)))
+        mock_time.expects('sleep').times_called(1)
+        with self.assertRaises(requests.ConnectionError):
+            http.post('https://x.test/')
+        self.assertEqual(
+            200, http.post('https://x.test/', retry_post=True).status_code)
+
+    @fudge.patch('codesy.base.http.session', 'codesy.base.http.time')
+    def test_waits_for_retry_after(self, mock_session, mock_time):
+        (mock_session.expects('request')
+                     .returns(response(429, {'Retry-After': '7'}))
+                     .next_call()
+                     .returns(response(200)))
+        mock_time.expects('sleep').with_args(7)
+        http.get('https://x.test/')
+
+    def test_retry_delay_is_jittered_and_capped(self):
+        for attempt in range(1, 20):
+            delay = http.retry_delay(attempt)
+            self.assertTrue(0 <= delay <= 30)
+
+    @fudge.patch('codesy.base.http.session')
+    def test_records_rate_limits(self, mock_session):
+        mock_session.expects('request').returns(response(200, {
+            'X-RateLimit-Limit': '5000',
+            'X-RateLimit-Remaining': '4999',
+            'X-RateLimit-Reset': '1500000000',
+        }))
+        http.get('https://api.github.com/x')
+        self.assertEqual(
+            {'limit': 5000, 'remaining': 4999, 'reset': 1500000000},
+            http.rate_limits['api.github.com']
+        )
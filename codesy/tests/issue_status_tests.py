@@ -0,0 +1,143 @@
+import time
+from datetime import timedelta
+
+import fudge
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from model_mommy import mommy
+
+from auctions.models import Issue
+
+from ..base.management.commands import check_issue_status, gh_gql
+
+
+class GetIssueStatesTest(TestCase):
+
+    def test_issue_states_query_aliases_each_url(self):
+        query = gh_gql.issue_states_query(2)
+        self.assertIn('$u0: URI!, $u1: URI!', query)
+        self.assertIn('i1: resource(url: $u1)', query)
+
+    @fudge.patch('codesy.base.management.commands.gh_gql.http.post')
+    def test_missing_issues_do_not_fail_the_batch(self, mock_post):
+        urls = ['https://github.com/codesy/codesy/issues/1',
+                'https://github.com/codesy/codesy/issues/2']
+        (mock_post.expects_call()
+                  .returns_fake()
+                  .has_attr(status_code=200)
+                  .provides('json').returns({
+                      'data': {'i0': {'state': 'CLOSED'}, 'i1': None},
+                      'errors': [{'type': 'NOT_FOUND'}],
+                  }))
+        self.assertEqual({urls[0]: 'CLOSED', urls[1]: None},
+                         gh_gql.get_issue_states(urls))
+
+
+@override_settings(GITHUB_GRAPH_RESERVE=100, GITHUB_MAX_QUOTA_WAIT=60)
+class QuerySchedulerTest(TestCase):
+
+    def setUp(self):
+        gh_gql.scheduler.state = None
+        self.scheduler = gh_gql.QueryScheduler()
+
+    def test_with_rate_limit_asks_for_the_rate_limit(self):
+        query = gh_gql.with_rate_limit(gh_gql.issue_states_query(1))
+        self.assertTrue(query.endswith(
+            '  rateLimit { cost remaining resetAt }\n}'))
+
+    def test_record_counts_usage_per_command(self):
+        with self.scheduler.running('refresh', gh_gql.ISSUE_REFRESH) as usage:
+            self.scheduler.record({'cost': 3, 'remaining': 4997,
+                                   'resetAt': '2030-01-01T00:00:00Z'})
+        self.assertEqual({'queries': 1, 'cost': 3}, usage)
+        self.assertEqual((4997, 1893456000), self.scheduler.state)
+
+    @fudge.patch('codesy.base.management.commands.gh_gql.time')
+    def test_graph_loads_pause_for_the_reserve(self, mock_time):
+        self.scheduler.state = (100, 1030)
+        mock_time.provides('time').returns(1000)
+        mock_time.expects('sleep').with_args(30)
+        # issue refreshes may spend the reserve
+        with self.scheduler.running('refresh', gh_gql.ISSUE_REFRESH):
+            self.scheduler.wait(1)
+        with self.scheduler.running('graph', gh_gql.GRAPH_LOAD) as usage:
+            self.scheduler.wait(1)
+        self.assertEqual(30, usage['waited'])
+
+    def test_long_wait_raises_quota_exhausted(self):
+        self.scheduler.state = (0, time.time() + 3600)
+        self.assertRaises(gh_gql.QuotaExhausted, self.scheduler.wait, 1)
+
+    @fudge.patch('codesy.base.management.commands.gh_gql.http.post')
+    def test_query_records_its_cost(self, mock_post):
+        (mock_post.expects_call()
+                  .returns_fake()
+                  .has_attr(status_code=200)
+                  .provides('json').returns({'data': {
+                      'user': {'login': 'codesy'},
+                      'rateLimit': {'cost': 2, 'remaining': 4000,
+                                    'resetAt': '2030-01-01T00:00:00Z'},
+                  }}))
+        query = gh_gql.ghQuery(gh_gql.user_query)
+        query.get(login='codesy')
+        self.assertEqual(2, query.cost)
+        self.assertEqual(4000, gh_gql.scheduler.state[0])
+
+
+class RefreshIssueStatesTest(TestCase):
+
+    def setUp(self):
+        self.since = timezone.now() - timedelta(hours=1)
+        self.issues = [
+            mommy.make(Issue, url='https://github.com/codesy/codesy/issues/%s'
+                       % n, state='OPEN')
+            for n in range(3)
+        ]
+        Issue.objects.update(last_fetched=self.since - timedelta(hours=1))
+
+    @fudge.patch('codesy.base.management.commands.check_issue_status.'
+                 'get_issue_states')
+    def test_only_changed_states_are_written(self, mock_states):
+        mock_states.expects_call().returns({
+            self.issues[0].url: 'OPEN',
+            self.issues[1].url: 'CLOSED',
+            self.issues[2].url: None,
+        })
+        stats = check_issue_status.refresh_issue_states(Issue.objects.all())
+        self.assertEqual(
+            {'api_calls': 1, 'checked': 3, 'changed': 1, 'failed': 0}, stats
+        )
+        self.assertEqual(['OPEN', 'CLOSED', 'OPEN'],
+                         list(Issue.objects.order_by('id')
+                                           .values_list('state', flat=True)))
+        self.assertFalse(Issue.objects.filter(last_fetched__lt=self.since))
+
+    @fudge.patch('codesy.base.management.commands.check_issue_status.'
+                 'get_issue_states')
+    def test_failed_batch_is_left_for_next_run(self, mock_states):
+        (mock_states.expects_call().raises(Exception('rate limited'))
+                    .next_call().returns({self.issues[2].url: 'CLOSED'}))
+        stats = check_issue_status.refresh_issue_states(
+            Issue.objects.order_by('id'), batch_size=2)
+        self.assertEqual(
+            {'api_calls': 2, 'checked': 1, 'changed': 1, 'failed': 2}, stats
+        )
+        self.assertEqual(
+            2, Issue.objects.filter(last_fetched__lt=self.since).count()
+        )
+
+    @fudge.patch('codesy.base.management.commands.check_issue_status.'
+                 'get_issue_states')
+    def test_exhausted_quota_stops_the_run(self, mock_states):
+        (mock_states.expects_call().returns({self.issues[0].url: 'CLOSED'})
+                    .next_call().raises(gh_gql.QuotaExhausted('0 left')))
+        stats = check_issue_status.refresh_issue_states(
+            Issue.objects.order_by('id'), batch_size=1)
+        self.assertEqual(
+            {'api_calls': 1, 'checked': 1, 'changed': 1, 'failed': 0}, stats
+        )
+        self.assertEqual(
+            2, Issue.objects.filter(last_fetched__lt=self.since).count()
+        )
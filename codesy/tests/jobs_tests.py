@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ..base import jobs
+from ..base.models import Job
+
+calls = []
+
+
+@jobs.handler('test-flaky')
+def flaky(job, fail_times):
+    calls.append(job.attempts)
+    if job.attempts <= fail_times:
+        raise Exception('try again')
+    job.set_progress('all done')
+
+
+@jobs.handler('test-slow')
+def slow(job):
+    # another worker decides this attempt is abandoned and takes over
+    # while it's still writing its results
+    Job.objects.filter(id=job.id).update(
+        started=timezone.now() - timedelta(days=1))
+    calls.append(jobs.claim_next(key=job.key))
+    job.set_progress('first attempt done')
+
+
+class JobsTest(TestCase):
+
+    def setUp(self):
+        del calls[:]
+
+    def test_enqueue_skips_duplicate_keys(self):
+        first = jobs.enqueue('test-flaky', 'a', fail_times=0)
+        second = jobs.enqueue('test-flaky', 'a', fail_times=0)
+        self.assertEqual(first, second)
+        self.assertEqual(1, Job.objects.count())
+
+    def test_job_runs_once(self):
+        jobs.enqueue('test-flaky', 'a', fail_times=0)
+        self.assertEqual(1, jobs.run_pending())
+        job = Job.objects.get()
+        self.assertEqual(Job.DONE, job.status)
+        self.assertEqual('all done', job.progress)
+        self.assertEqual(0, jobs.run_pending())
+
+    def test_failed_job_is_retried_later(self):
+        jobs.enqueue('test-flaky', 'a', fail_times=1)
+        self.assertEqual(1, jobs.run_pending())
+        job = Job.objects.get()
+        self.assertEqual(Job.QUEUED, job.status)
+        self.assertEqual('try again', job.error)
+        self.assertGreater(job.run_after, timezone.now())
+
+        Job.objects.update(run_after=timezone.now())
+        jobs.run_pending()
+        self.assertEqual(Job.DONE, Job.objects.get().status)
+        self.assertEqual([1, 2], calls)
+
+    def test_job_fails_after_max_attempts_and_can_be_requeued(self):
+        jobs.enqueue('test-flaky', 'a', max_attempts=1, fail_times=1)
+        jobs.run_pending()
+        self.assertEqual(Job.FAILED, Job.objects.get().status)
+
+        job = jobs.enqueue('test-flaky', 'a', fail_times=1)
+        self.assertEqual(Job.QUEUED, job.status)
+        self.assertEqual(0, job.attempts)
+
+    def test_abandoned_job_is_run_again(self):
+        jobs.enqueue('test-flaky', 'a', fail_times=0)
+        jobs.claim_next()
+        self.assertEqual(0, jobs.run_pending())
+
+        Job.objects.update(started=timezone.now() - timedelta(days=1))
+        self.assertEqual(1, jobs.run_pending())
+        self.assertEqual(Job.DONE, Job.objects.get().status)
+
+    def test_renewed_lease_keeps_job_from_being_run_again(self):
+        jobs.enqueue('test-flaky', 'a', fail_times=0)
+        job = jobs.claim_next()
+        Job.objects.update(started=timezone.now() - timedelta(days=1))
+        self.assertTrue(jobs.renew_lease(job))
+        self.assertIsNone(jobs.claim_next())
+
+    def test_taken_over_attempt_does_not_save_its_outcome(self):
+        jobs.enqueue('test-slow', 'a')
+        first = jobs.claim_next()
+        jobs.run(first)
+        second = calls[0]
+        self.assertEqual(2, second.attempts)
+
+        job = Job.objects.get()
+        self.assertEqual(Job.RUNNING, job.status)
+        self.assertEqual(2, job.attempts)
+        self.assertFalse(jobs.renew_lease(first))
+        self.assertTrue(jobs.renew_lease(second))
@@ -43,9 +43,9 @@ class SignUpReceiverTest(TestCase):
                      .has_attr(email=None)
                      .expects('save'))
         self.kwargs = {'sociallogin': self.sociallogin}
-        self.fake_get = fudge.Fake('requests.get')
+        self.fake_get = fudge.Fake('http.get')
 
-    @fudge.patch('requests.get')
+    @fudge.patch('codesy.base.models.http.get')
     def test_verified_primary_email_from_github_api(self, fake_get):
         (fake_get.expects_call()
                  .with_args(EMAIL_URL, params=self.params)
@@ -60,7 +60,7 @@ class SignUpReceiverTest(TestCase):
                                             **self.kwargs)
         self.assertEquals(VERIFIED_PRIMARY_EMAIL, self.user.email)
 
-    @fudge.patch('requests.get')
+    @fudge.patch('codesy.base.models.http.get')
     def test_verified_email_from_github_api(self, fake_get):
         (fake_get.expects_call()
                  .with_args(EMAIL_URL, params=self.params)
@@ -75,7 +75,7 @@ class SignUpReceiverTest(TestCase):
                                             **self.kwargs)
         self.assertEquals(VERIFIED_EMAIL, self.user.email)
 
-    @fudge.patch('requests.get')
+    @fudge.patch('codesy.base.models.http.get')
     def test_unverified_email_from_github_api(self, fake_get):
         (fake_get.expects_call()
                  .with_args(EMAIL_URL, params=self.params)
@@ -90,7 +90,7 @@ class SignUpReceiverTest(TestCase):
                                             **self.kwargs)
         self.assertEquals(None, self.user.email)
 
-    @fudge.patch('requests.get')
+    @fudge.patch('codesy.base.models.http.get')
     def test_many_emails_from_github_api(self, fake_get):
         (fake_get.expects_call()
                  .with_args(EMAIL_URL, params=self.params)
@@ -0,0 +1,70 @@
+import fudge
+from fudge.inspector import arg
+
+from django.test import TestCase
+
+from ..base import outbox
+from ..base.models import Notification
+
+
+class OutboxTest(TestCase):
+
+    def ask_met(self, key='ask-met-1'):
+        return outbox.notification(
+            key,
+            'email/ask_met.html',
+            "[codesy] There's $50 waiting for you!",
+            'user1@test.com',
+            ask='50.00',
+            url='https://github.com/codesy/codesy/issues/1',
+        )
+
+    def test_queue_saves_in_order(self):
+        outbox.queue([self.ask_met('a'), self.ask_met('b')])
+        self.assertEqual(
+            ['a', 'b'],
+            list(Notification.objects.order_by('id')
+                                     .values_list('key', flat=True))
+        )
+
+    def test_queue_skips_duplicate_keys(self):
+        outbox.queue([self.ask_met()])
+        queued = outbox.queue([self.ask_met(), self.ask_met()])
+        self.assertEqual([], queued)
+        self.assertEqual(1, Notification.objects.count())
+
+    @fudge.patch('codesy.base.outbox.send_mail')
+    def test_send_pending_renders_and_marks_sent(self, mock_send_mail):
+        mock_send_mail.expects_call().with_args(
+            "[codesy] There's $50 waiting for you!",
+            arg.contains('https://github.com/codesy/codesy/issues/1'),
+            arg.any(),
+            ['user1@test.com']
+        )
+        outbox.queue([self.ask_met()])
+        self.assertEqual(1, outbox.send_pending())
+        self.assertEqual(0, Notification.objects.filter(sent=None).count())
+        self.assertEqual(0, outbox.send_pending())
+
+    @fudge.patch('codesy.base.outbox.send_mail')
+    def test_send_pending_in_batches(self, mock_send_mail):
+        mock_send_mail.is_callable().times_called(3)
+        outbox.queue([self.ask_met(key) for key in 'abc'])
+        self.assertEqual(3, outbox.send_pending(batch_size=2))
+
+    @fudge.patch('codesy.base.outbox.send_mail')
+    def test_notification_that_fails_to_render_is_kept(self, mock_send_mail):
+        mock_send_mail.is_callable().times_called(2)
+        broken = self.ask_met('broken')
+        broken.template = 'email/missing.html'
+        outbox.queue([self.ask_met('a'), broken, self.ask_met('b')])
+
+        self.assertEqual(2, outbox.send_pending(batch_size=2))
+        broken = Notification.objects.get(key='broken')
+        self.assertIsNone(broken.sent)
+        self.assertEqual(1, broken.attempts)
+        self.assertIn('missing.html', broken.error)
+
+        Notification.objects.filter(key='broken').update(
+            attempts=outbox.MAX_ATTEMPTS)
+        self.assertEqual(0, outbox.send_pending())
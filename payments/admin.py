@@ -1,3 +1,5 @@
+import json
+
 from django.contrib import admin
 from .models import StripeAccount, StripeEvent
 
@@ -12,12 +14,19 @@ class StripeAccountAdmin(admin.ModelAdmin):
 
 class StripeEventAdmin(admin.ModelAdmin):
     list_display = (
-        'event_id', 'type', 'created', 'verified', 'processed', 'user_id')
-    search_fields = ['message_text']
+        'event_id', 'type', 'created', 'verified', 'processed', 'user_id',
+        'attempts')
+    list_filter = ('type', 'verified', 'processed')
+    search_fields = ['event_id', 'user_id', 'object_id']
+    exclude = ('message_text',)
 
     readonly_fields = (
-        'user_id', 'type', 'created', 'event_id', 'verified',
-        'processed', 'message_text',)
+        'user_id', 'type', 'object_id', 'created', 'event_id', 'verified',
+        'processed', 'message_json', 'attempts', 'retry_after',)
+
+    def message_json(self, obj):
+        return json.dumps(obj.message, indent=4, sort_keys=True)
+    message_json.short_description = 'message'
 
 
 admin.site.register(StripeAccount, StripeAccountAdmin)
@@ -0,0 +1,174 @@
+"""
+Stripe webhook ingestion.
+
+StripeHookView only records each event with ingest(), one idempotent insert,
+so Stripe gets its 200 straight away even during a burst (e.g.
+balance.available for every connected account). The process_stripe_events
+worker claims unverified events in batches, retrieves them from Stripe
+concurrently to verify them, and runs their webhooks in the order they were
+received. An event that can't be retrieved or processed is tried again
+with exponential backoff, up to MAX_ATTEMPTS times.
+
+Events are stored as minified (by default compressed) JSON, and once they
+are finished with the archive_stripe_events command moves them out of the
+database into gzipped JSON lines files.
+"""
+import gzip
+import logging
+import os
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import StripeEvent, minify
+from . import utils as payments
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+ARCHIVE_BATCH_SIZE = 1000
+MAX_ATTEMPTS = 5
+
+# seconds a claimed event is left to its worker before it can be claimed
+# again; doubled for each attempt after the first
+RETRY_DELAY = 60
+
+
+def ingest(message):
+    """
+    Record a webhook message, unless its event was received before.
+    Returns the new StripeEvent, or None for a repeat.
+    """
+    event = StripeEvent(event_id=message['id'])
+    event.set_message(message)
+    try:
+        with transaction.atomic():
+            event.save(force_insert=True)
+    except IntegrityError:
+        return None
+    return event
+
+
+def claim_batch(batch_size=BATCH_SIZE, now=None):
+    """
+    The next batch_size events that are due to be verified, oldest first,
+    marked so that other workers leave them alone until their retry_after.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        batch = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+                               .filter(verified=False,
+                                       attempts__lt=MAX_ATTEMPTS,
+                                       retry_after__lte=now)
+                               .order_by('created', 'event_id')[:batch_size]
+        )
+        by_attempts = defaultdict(list)
+        for event in batch:
+            event.attempts += 1
+            event.retry_after = now + timedelta(
+                seconds=RETRY_DELAY * 2 ** (event.attempts - 1))
+            by_attempts[event.attempts].append(event)
+        for attempts, events in by_attempts.items():
+            StripeEvent.objects.filter(
+                event_id__in=[event.event_id for event in events]
+            ).update(
+                attempts=F('attempts') + 1,
+                retry_after=events[0].retry_after,
+            )
+    return batch
+
+
+def process_pending(batch_size=BATCH_SIZE, workers=None):
+    """
+    Verify and process due events until there are none left. Returns the
+    number of events that were processed.
+    """
+    processed = 0
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return processed
+        retrieved = dict(
+            (job.key, job) for job in payments.run_stripe_jobs(
+                [payments.EventRetrieveJob(event.event_id, event.user_id)
+                 for event in batch],
+                workers
+            )
+        )
+        for event in batch:
+            job = retrieved[event.event_id]
+            if not job.event:
+                logger.error("Stripe event %s not verified: %s" %
+                             (event.event_id, job.error_message))
+                continue
+            try:
+                with transaction.atomic():
+                    event.process(job.event)
+            except Exception:
+                logger.exception("Stripe event %s failed" % event.event_id)
+                continue
+            processed += 1
+
+
+def archivable(before):
+    """
+    Events received before before that are verified or out of attempts.
+    """
+    return StripeEvent.objects.filter(created__lt=before).filter(
+        Q(verified=True) | Q(attempts__gte=MAX_ATTEMPTS)
+    )
+
+
+def archive_record(event):
+    return minify({
+        'event_id': event.event_id,
+        'user_id': event.user_id,
+        'type': event.type,
+        'object_id': event.object_id,
+        'verified': event.verified,
+        'processed': event.processed,
+        'attempts': event.attempts,
+        'created': event.created.isoformat() if event.created else None,
+        'message': event.message,
+    })
+
+
+def archive(before, directory, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move archivable events into a new gzipped JSON lines file in directory,
+    batch_size at a time. Each batch is flushed to the file before it is
+    deleted, so an interrupted run loses nothing (at worst a batch is in
+    two archives). Returns the file's path, or None if there was nothing
+    to archive, and the number of events archived.
+    """
+    events = archivable(before).order_by('created', 'event_id')
+    path = None
+    archived = 0
+    archive_file = None
+    try:
+        while True:
+            batch = list(events[:batch_size])
+            if not batch:
+                break
+            if archive_file is None:
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                path = os.path.join(directory, 'stripe-events-%s.jsonl.gz' %
+                                    timezone.now().strftime('%Y%m%dT%H%M%S'))
+                archive_file = gzip.open(path, 'ab')
+            for event in batch:
+                archive_file.write(archive_record(event) + '\n')
+            archive_file.flush()
+            os.fsync(archive_file.fileobj.fileno())
+            StripeEvent.objects.filter(
+                event_id__in=[event.event_id for event in batch]
+            ).delete()
+            archived += len(batch)
+    finally:
+        if archive_file is not None:
+            archive_file.close()
+    return path, archived
@@ -0,0 +1,74 @@
+"""
+Precomputed charge and payout for every bid amount.
+
+Bid amounts have at most 6 digits, so there are only a million of them.
+The build_fee_table command solves each one once and writes the results to
+a flat file of little-endian unsigned shorts. At run time the file is
+memory-mapped and a lookup is one unpack at a fixed offset.
+
+Each row holds (charge - amount, amount - payout) in cents. Both are at
+most about half of the total fee, so they fit in 16 bits, and the file
+for every amount is 4MB.
+"""
+import array
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'CODESYFT'
+VERSION = 1
+
+HEADER = struct.Struct('<8sII')
+ROW = struct.Struct('<HH')
+
+
+class FeeTable(object):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %s fee table" %
+                             (path, VERSION))
+        if len(self._map) != HEADER.size + ROW.size * self.size:
+            raise ValueError("%s is truncated" % path)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, cents):
+        return 0 <= cents < self.size
+
+    def lookup(self, cents):
+        """
+        Returns (charge, payout) in cents.
+        """
+        charge_delta, payout_delta = ROW.unpack_from(
+            self._map, HEADER.size + ROW.size * cents
+        )
+        return cents + charge_delta, cents - payout_delta
+
+    def close(self):
+        self._map.close()
+
+
+def write(path, rows):
+    """
+    Write a table of (charge, payout) rows, one per cent from 0 up.
+
+    The file is written next to path and renamed into place, so processes
+    that already have the old table mapped keep a consistent copy.
+    """
+    deltas = array.array('H')
+    for cents, (charge, payout) in enumerate(rows):
+        deltas.append(charge - cents)
+        deltas.append(cents - payout)
+    if sys.byteorder != 'little':
+        deltas.byteswap()
+
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(deltas) // 2))
+        deltas.tofile(f)
+    os.rename(tmp_path, path)
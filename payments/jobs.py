@@ -0,0 +1,11 @@
+"""
+Background jobs for payments, run by the run_jobs worker.
+"""
+from codesy.base import jobs
+
+from . import reauthorize as reauthorize_offers
+
+
+@jobs.handler('reauthorize')
+def reauthorize(job, **args):
+    reauthorize_offers.run(job, **args)
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...events import ARCHIVE_BATCH_SIZE, archive
+
+
+class Command(BaseCommand):
+    help = ("Move Stripe events that are done with out of the database "
+            "into gzipped JSON lines files")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.STRIPE_EVENT_RETENTION_DAYS,
+            help="Keep events received in the last this many days"
+        )
+        parser.add_argument(
+            '--dir', default=settings.STRIPE_EVENT_ARCHIVE_DIR,
+            help="Directory on persistent storage to write archives to "
+                 "(default STRIPE_EVENT_ARCHIVE_DIR)"
+        )
+        parser.add_argument('--batch-size', type=int,
+                            default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not options['dir']:
+            raise CommandError(
+                "Archived events are deleted from the database, so give a "
+                "--dir (or STRIPE_EVENT_ARCHIVE_DIR) on persistent storage"
+            )
+        before = timezone.now() - timedelta(days=options['days'])
+        path, archived = archive(before, options['dir'],
+                                 options['batch_size'])
+        if archived:
+            self.stdout.write('Archived %s Stripe events to %s' %
+                              (archived, path))
+        else:
+            self.stdout.write('No Stripe events to archive')
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ... import fee_table, utils
+
+
+class Command(BaseCommand):
+    help = "Precompute the charge and payout for every bid amount"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.FEE_TABLE_PATH)
+        parser.add_argument('--max-cents', type=int, default=utils.MAX_CENTS)
+
+    def handle(self, *args, **options):
+        rows = (
+            utils.solve_cents(cents)
+            for cents in range(0, options['max_cents'] + 1)
+        )
+        fee_table.write(options['path'], rows)
+        self.stdout.write("Wrote fees for 0.00 to %.2f to %s" % (
+            options['max_cents'] / 100.0, options['path']))
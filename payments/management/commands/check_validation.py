@@ -1,45 +1,24 @@
 import logging
-import json
-import sys
 
 from django.core.management.base import BaseCommand
-from django.conf import settings
-from django.template.loader import get_template
-# from django.template import Context
 
-from mailer import send_mail
-
-import stripe
-
-from ...models import StripeAccount
+from ...verification import PAGE_SIZE, sync_verification
 
 logger = logging.getLogger(__name__)
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
-email_template = get_template('../templates/email/need_validation.html')
 
 
 class Command(BaseCommand):
+    help = ("Store the verification of connected accounts that changed on "
+            "Stripe and email the ones that need more information")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
 
     def handle(self, *args, **options):
-        accounts = StripeAccount.objects.all()
-        for account in accounts:
-            try:
-                stripe_account = stripe.Account.retrieve(account.account_id)
-                if account.verification != stripe_account.verification:
-                    account.verification = json.dumps(
-                        stripe_account.verification)
-                    account.save()
-                    if stripe_account.verification.fields_needed:
-                        email_context = (
-                            {'expiration': stripe_account.verification.due_by})
-                        message = email_template.render(email_context)
-                        send_mail(
-                            '[codesy] Account validation needed',
-                            message,
-                            settings.DEFAULT_FROM_EMAIL,
-                            [account.user.email]
-                        )
-            except:
-                e = sys.exc_info()[0]
-                logger.error("Error during check_validation: %s" % e)
+        stats = sync_verification(page_size=options['page_size'])
+        message = (
+            "check_validation: %(listed)s accounts listed, %(changed)s "
+            "changed, %(emailed)s emailed" % stats
+        )
+        logger.info(message)
+        self.stdout.write(message)
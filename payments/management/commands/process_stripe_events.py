@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...events import BATCH_SIZE, process_pending
+
+
+class Command(BaseCommand):
+    help = "Verify and process received Stripe webhook events"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once there are no events due instead of polling"
+        )
+        parser.add_argument('--sleep', type=float, default=5,
+                            help="Seconds to wait between polls")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending(batch_size=options['batch_size'])
+            if processed:
+                self.stdout.write('Processed %s Stripe events' % processed)
+            if options['once']:
+                return
+            # don't hold a connection open while idle
+            connection.close()
+            time.sleep(options['sleep'])
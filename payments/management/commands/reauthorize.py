@@ -1,43 +1,57 @@
-from django.core.management.base import BaseCommand
-from django.conf import settings
 from datetime import timedelta
-from django.utils import timezone
 
-import stripe
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
 
-from auctions.models import Offer
-from ... import utils as payments
+from codesy.base import jobs
+from codesy.base.models import Job
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from ... import reauthorize
 
 
 class Command(BaseCommand):
+    help = ("Refund offers older than day_limit days and authorize them "
+            "again, resuming today's run if it was interrupted")
 
     def add_arguments(self, parser):
         parser.add_argument('day_limit', nargs='+', type=int)
+        parser.add_argument('--chunk-size', type=int,
+                            default=reauthorize.CHUNK_SIZE)
+        parser.add_argument('--workers', type=int,
+                            default=settings.PAYOUT_WORKERS)
+        parser.add_argument(
+            '--rate-limit', type=float, default=settings.STRIPE_RATE_LIMIT,
+            help="Most Stripe requests to make per second"
+        )
+        parser.add_argument(
+            '--queue', action='store_true',
+            help="Leave the run to the run_jobs worker"
+        )
 
     def handle(self, *args, **options):
+        jobs.autodiscover()
         day_limit = int(options['day_limit'][0])
-        expires = timezone.now() - timedelta(days=day_limit)
-        offers = Offer.objects.filter(
-            refund_id=u'', created__lt=expires
-        ).exclude(
-            charge_id=u''
+        now = timezone.now()
+        key = 'reauthorize-%s' % now.date().isoformat()
+        job = jobs.enqueue(
+            'reauthorize', key,
+            expires=(now - timedelta(days=day_limit)).isoformat(),
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            rate_limit=options['rate_limit'],
         )
-
-        for offer in offers:
-            attempt_refund = payments.refund(offer)
-            if attempt_refund:
-                new_offer = Offer(
-                    user=offer.user,
-                    amount=offer.amount,
-                    bid=offer.bid,
-                )
-                new_offer.save()
-
-                payments.authorize(new_offer)
-
-                print (
-                    '%s was refunded. New authorized charge is %s' %
-                    (offer.charge_id, new_offer.charge_id)
-                )
+        if options['queue']:
+            self.stdout.write('Queued %s' % job.key)
+            return
+
+        job = jobs.claim_next(key=key)
+        if job is None:
+            self.stdout.write('%s is already running or done' % key)
+            return
+        jobs.run(job)
+        if job.status == Job.DONE:
+            self.stdout.write(job.progress)
+        else:
+            self.stderr.write('%s stopped at "%s": %s' %
+                              (key, job.progress, job.error))
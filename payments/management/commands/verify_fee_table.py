@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import fee_table, utils
+
+
+def mismatches(table, every=1):
+    """
+    Yield (amount, field, expected, actual) wherever the fees from table
+    differ from transaction_amounts, checking every nth amount.
+    """
+    for cents in range(0, len(table), every):
+        amount = Decimal(cents).scaleb(-2)
+        expected = utils.transaction_amounts(amount)
+        actual = utils.cents_to_amounts(
+            amount, utils.cents_details(cents, *table.lookup(cents))
+        )
+        for field, value in sorted(actual.items()):
+            if expected[field] != value:
+                yield amount, field, expected[field], value
+
+
+class Command(BaseCommand):
+    help = "Check the fee table against transaction_amounts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.FEE_TABLE_PATH)
+        parser.add_argument(
+            '--every', type=int, default=1,
+            help="Only check every nth amount (checking all takes a while)"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            table = fee_table.FeeTable(options['path'])
+        except (IOError, OSError, ValueError) as e:
+            raise CommandError(e)
+        errors = 0
+        for amount, field, expected, actual in mismatches(
+                table, options['every']):
+            errors += 1
+            self.stderr.write("%s: %s is %s, should be %s" % (
+                amount, field, actual, expected))
+        if errors:
+            raise CommandError("%s fees differ" % errors)
+        self.stdout.write("Fee table matches transaction_amounts")
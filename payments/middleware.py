@@ -1,22 +1,19 @@
-import stripe
-
 from django.contrib import messages
 
+from .models import cached_identity_verified
+
 
 class IdentityVerificationMiddleware(object):
     """
     Middleware that checks user verification.
+
+    It only reads the cached verification state, so page views never call
+    Stripe or write to the database; pages that need an up to date answer
+    use UserIdentityVerifiedMixin.
     """
 
     def process_request(self, request):
         if request.method == 'GET':
             if hasattr(request.user, 'account'):
-                user_account = request.user.account()
-                try:
-                    identity_verified = user_account.identity_verified()
-                except stripe.error.StripeError as e:
-                    if "that account does not exist" in e.message:
-                        messages.warning(request, 'stripe_account_error')
-                    return None
-                if not identity_verified:
+                if not cached_identity_verified(request.user):
                     messages.warning(request, 'stripe_info_verify')
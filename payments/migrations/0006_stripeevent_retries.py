@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.12 on 2026-10-18 19:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def retire_unverified_events(apps, schema_editor):
+    # events saved before the process_stripe_events worker were retrieved
+    # when they arrived; don't replay the ones that failed then
+    StripeEvent = apps.get_model('payments', 'StripeEvent')
+    StripeEvent.objects.filter(verified=False).update(attempts=5)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_auto_20160822_1210'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='stripeevent',
+            name='retry_after',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(retire_unverified_events,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.12 on 2026-10-18 19:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_stripeevent_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeevent',
+            name='object_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='stripeevent',
+            name='payload',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='stripeevent',
+            name='message_text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='stripeevent',
+            name='type',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='stripeevent',
+            name='user_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+    ]
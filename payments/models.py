@@ -2,15 +2,22 @@ from decimal import Decimal
 import logging
 import json
 import sys
+import zlib
 
 import stripe
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
+from codesy.base import http
+
 logger = logging.getLogger(__name__)
 stripe.api_key = settings.STRIPE_SECRET_KEY
+stripe.default_http_client = http.stripe_client()
 
 
 def get_customer_token(user):
@@ -39,9 +46,18 @@ class StripeAccount(models.Model):
         # and check on verification
         if self.account_id:
             stripe_account = stripe.Account.retrieve(self.account_id)
-            self.verification = json.dumps(stripe_account.verification)
-            self.save()
-        else:
+            verification = json.dumps(stripe_account.verification)
+            if verification != self.verification:
+                self.verification = verification
+                self.save()
+        return self.stored_identity_verified()
+
+    def stored_identity_verified(self):
+        """
+        identity_verified as of the last time verification was stored,
+        without asking Stripe.
+        """
+        if not self.account_id:
             # returning True will allow the bank account_id to be assigned
             return True
         if not self.verification:
@@ -83,48 +99,107 @@ class StripeAccount(models.Model):
             stripe_account.save()
 
 
+def identity_verified_cache_key(user_id):
+    return 'payments-identity-verified-%s' % user_id
+
+
+def cached_identity_verified(user):
+    """
+    Whether user's identity is verified, going by the verification stored
+    from account.updated webhooks and check_validation, cached for
+    IDENTITY_VERIFIED_CACHE_TIMEOUT or until the account is saved. Users
+    without an account count as verified, as in identity_verified.
+    """
+    key = identity_verified_cache_key(user.id)
+    verified = cache.get(key)
+    if verified is None:
+        account = StripeAccount.objects.filter(user=user).first()
+        verified = account is None or account.stored_identity_verified()
+        cache.set(key, verified, settings.IDENTITY_VERIFIED_CACHE_TIMEOUT)
+    return verified
+
+
+@receiver(post_save, sender=StripeAccount)
+def expire_identity_verified_cache(sender, instance, **kwargs):
+    cache.delete(identity_verified_cache_key(instance.user_id))
+
+
+def minify(message):
+    # sort_keys, like indent, keeps json off its C encoder, which has a bug
+    # with stripe's objects
+    return json.dumps(message, separators=(',', ':'), sort_keys=True)
+
+
 class StripeEvent(models.Model):
     event_id = models.CharField(primary_key=True, max_length=100, blank=True)
-    user_id = models.CharField(max_length=100, blank=True)
-    type = models.CharField(max_length=100, blank=True)
-    message_text = models.TextField()
+    # the connected account the event happened on
+    user_id = models.CharField(max_length=100, blank=True, db_index=True)
+    type = models.CharField(max_length=100, blank=True, db_index=True)
+    # id of the event's data.object, e.g. the account or charge
+    object_id = models.CharField(max_length=100, blank=True, db_index=True)
+    # uncompressed messages are in message_text, compressed ones in payload
+    message_text = models.TextField(blank=True)
+    payload = models.BinaryField(null=True, blank=True)
     verified = models.BooleanField(default=False)
     processed = models.BooleanField(default=False)
     created = models.DateTimeField(null=True, blank=True)
+    # tries at retrieving the event from Stripe; see payments.events
+    attempts = models.PositiveIntegerField(default=0)
+    retry_after = models.DateTimeField(default=timezone.now, db_index=True)
 
     @property
     def message(self):
-        return json.loads(self.message_text)
+        raw = self.payload or self.message_text
+        if getattr(self, '_raw_message', None) is not raw:
+            if self.payload:
+                self._message = json.loads(
+                    zlib.decompress(bytes(self.payload)))
+            else:
+                self._message = json.loads(self.message_text)
+            self._raw_message = raw
+        return self._message
+
+    def set_message(self, message):
+        """
+        Store message as minified JSON, zlib compressed if
+        STRIPE_EVENT_COMPRESS is on, and copy the fields processors look
+        up into their own columns.
+        """
+        text = minify(message)
+        if settings.STRIPE_EVENT_COMPRESS:
+            self.payload = zlib.compress(text.encode('utf-8'))
+            self.message_text = u''
+        else:
+            self.payload = None
+            self.message_text = text
+        self.type = message.get('type') or u''
+        # events retrieved from the API may not carry the webhook's
+        # connected account, so keep the one saved at ingest
+        self.user_id = message.get('user_id') or self.user_id or u''
+        data = message.get('data') or {}
+        self.object_id = (data.get('object') or {}).get('id') or u''
 
     def save(self, *args, **kwargs):
-        self.created = timezone.now()
+        if self.created is None:
+            self.created = timezone.now()
         super(StripeEvent, self).save(*args, **kwargs)
 
+    def process(self, retrieved_event):
+        """
+        Save the event as retrieved from Stripe, which verifies it, and run
+        the webhook for its type, if there is one.
+        """
+        self.verified = True
+        self.set_message(retrieved_event)
         try:
-            self.user_id = self.message_text['user_id']
-            retrieved_event = stripe.Event.retrieve(
-                id=self.event_id, stripe_account=self.user_id)
-        except KeyError:
-            retrieved_event = stripe.Event.retrieve(id=self.event_id)
-
-        if retrieved_event:
-            self.verified = True
-            self.type = retrieved_event['type']
-            # indent used to avoid c encoder bug
-            self.message_text = json.dumps(retrieved_event, indent=4)
-            super(StripeEvent, self).save(*args, **kwargs)
-        else:
-            # TODO: log this somewhere
-            return
-
-        # attempt to process a webhook for the event type
-        try:
-            webhooks[self.type](event=self).process()
-            self.processed = True
+            webhook = webhooks[self.type]
         except KeyError:
             # TODO: Add something like papertrail to log this
             pass
-        super(StripeEvent, self).save(*args, **kwargs)
+        else:
+            webhook(event=self).process()
+            self.processed = True
+        self.save()
 
 
 webhooks = {}
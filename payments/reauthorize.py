@@ -0,0 +1,132 @@
+"""
+Renewing offer authorizations before Stripe lets them lapse.
+
+An authorization only holds for a week, so every night the reauthorize job
+refunds each offer older than the day limit and authorizes a replacement
+offer for the same amount. Offers are taken a chunk at a time in id order:
+the chunk's Stripe calls run on a thread pool within STRIPE_RATE_LIMIT,
+then its results are written in one transaction and the job's args are
+checkpointed past it. Every Stripe call has an idempotency key derived from
+the offer, so a run that dies mid-chunk repeats that chunk without
+refunding or authorizing anything twice.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from auctions.models import Offer
+
+from . import utils as payments
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 200
+
+
+def expiring_offers(expires):
+    """
+    Authorized offers made before expires that haven't been refunded.
+    """
+    return Offer.objects.filter(
+        refund_id=u'', created__lt=expires
+    ).exclude(
+        charge_id=u''
+    )
+
+
+def replacement_key(offer):
+    return 'reauthorize-%s' % offer.id
+
+
+def reauthorize_offers(offers, workers=None, rate_limit=None):
+    """
+    Refund offers and authorize a replacement for each one that was
+    refunded. Returns counts of reauthorized offers and of failed refunds
+    and authorizations; failures are left in the offers' error_message.
+    """
+    by_key = dict((replacement_key(offer), offer) for offer in offers)
+    jobs = [
+        payments.ReauthorizeJob(
+            replacement_key(offer),
+            customer=offer.bid.user.stripe_customer,
+            authorization_id=offer.charge_id,
+            amount=offer.amount,
+            description="Offer for: " + offer.bid.url,
+            metadata={'bid_id': offer.bid_id},
+        )
+        for offer in offers
+    ]
+    stats = Counter()
+    results = sorted(payments.run_stripe_jobs(jobs, workers, rate_limit),
+                     key=lambda job: by_key[job.key].id)
+    replacements = []
+    with transaction.atomic():
+        for job in results:
+            offer = by_key[job.key]
+            error_message = job.error_message[:255]
+            if not job.refund_id:
+                Offer.objects.filter(id=offer.id).update(
+                    error_message=error_message)
+                stats['refund_failed'] += 1
+                continue
+            Offer.objects.filter(id=offer.id).update(refund_id=job.refund_id)
+            replacements.append(Offer(
+                user_id=offer.user_id,
+                bid_id=offer.bid_id,
+                amount=offer.amount,
+                transaction_key=job.key,
+                charge_id=job.charge_id,
+                api_success=bool(job.charge_id),
+                error_message=error_message,
+            ))
+            if job.charge_id:
+                stats['reauthorized'] += 1
+            else:
+                stats['authorize_failed'] += 1
+        Offer.bulk_create_with_fees(replacements)
+    return stats
+
+
+def summary(stats, seconds):
+    return (
+        "reauthorize: %s offers in %.1fs (%.1f/s), %s reauthorized, "
+        "%s refunds failed, %s authorizations failed" % (
+            stats['offers'], seconds, stats['offers'] / (seconds or 1),
+            stats['reauthorized'], stats['refund_failed'],
+            stats['authorize_failed'],
+        )
+    )
+
+
+def run(job, expires, after_id=0, chunk_size=CHUNK_SIZE, workers=None,
+        rate_limit=None):
+    """
+    Reauthorize the offers made before expires (an ISO 8601 string) with
+    ids after after_id, checkpointing after_id in job's args after each
+    chunk. Returns the run's summary.
+    """
+    offers = (
+        expiring_offers(parse_datetime(expires))
+        .select_related('bid__user')
+        .order_by('id')
+    )
+    total = offers.filter(id__gt=after_id).count()
+    stats = Counter()
+    started = time.time()
+    while True:
+        chunk = list(offers.filter(id__gt=after_id)[:chunk_size])
+        if not chunk:
+            break
+        stats.update(reauthorize_offers(chunk, workers, rate_limit))
+        stats['offers'] += len(chunk)
+        after_id = chunk[-1].id
+        job.save_args(after_id=after_id)
+        job.set_progress('%s of %s offers reauthorized' %
+                         (stats['offers'], total))
+    message = summary(stats, time.time() - started)
+    logger.info(message)
+    job.set_progress(message)
+    return message
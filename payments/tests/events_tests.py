@@ -0,0 +1,145 @@
+import gzip
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+
+import fudge
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from model_mommy import mommy
+
+from .. import events
+from ..models import StripeAccount, StripeEvent
+
+from . import account_updated, application_fee_created, payment_created
+
+
+class EventsTest(TestCase):
+
+    def test_ingest_is_idempotent(self):
+        message = json.loads(payment_created)
+        event = events.ingest(message)
+        self.assertEqual('evt_18lHxJFizJPFF3oAo6XPXCMA', event.event_id)
+        self.assertEqual('acct_18ec5MFizJPFF3oA', event.user_id)
+        self.assertFalse(event.verified)
+        self.assertIsNone(events.ingest(message))
+        self.assertEqual(1, StripeEvent.objects.count())
+
+    def test_ingest_stores_compact_message(self):
+        events.ingest(json.loads(payment_created))
+        event = StripeEvent.objects.get()
+        self.assertEqual('', event.message_text)
+        self.assertEqual(json.loads(payment_created), event.message)
+        self.assertEqual('payment.created', event.type)
+        self.assertEqual('py_18lHxIFizJPFF3oAIA4pDgRh', event.object_id)
+
+    @override_settings(STRIPE_EVENT_COMPRESS=False)
+    def test_ingest_uncompressed(self):
+        events.ingest(json.loads(payment_created))
+        event = StripeEvent.objects.get()
+        self.assertIsNone(event.payload)
+        self.assertNotIn('\n', event.message_text)
+        self.assertEqual(json.loads(payment_created), event.message)
+
+    def test_process_pending(self):
+        # the package's Event.retrieve mock returns payment_created
+        events.ingest(json.loads(payment_created))
+        events.ingest(json.loads(application_fee_created))
+        self.assertEqual(2, events.process_pending(workers=1))
+        for event in StripeEvent.objects.all():
+            self.assertTrue(event.verified)
+            self.assertTrue(event.processed)
+            self.assertEqual(1, event.attempts)
+        self.assertEqual(0, events.process_pending())
+
+    @fudge.patch('payments.utils.stripe.Event')
+    def test_process_pending_uses_connected_account(self, mock_event):
+        account = mommy.make(StripeAccount, account_id='acct_00000000000000')
+        message = json.loads(account_updated)
+        message['user_id'] = account.account_id
+        mock_event.expects('retrieve').with_args(
+            id=message['id'], stripe_account=account.account_id
+        ).returns(message)
+        events.ingest(message)
+        self.assertEqual(1, events.process_pending(workers=1))
+        account = StripeAccount.objects.get(id=account.id)
+        self.assertEqual(['legal_entity.verification.document'],
+                         account.fields_needed)
+
+    @fudge.patch('payments.utils.stripe.Event')
+    def test_processing_keeps_connected_account(self, mock_event):
+        message = json.loads(payment_created)
+        retrieved = dict(message)
+        del retrieved['user_id']
+        mock_event.expects('retrieve').returns(retrieved)
+        events.ingest(message)
+        self.assertEqual(1, events.process_pending(workers=1))
+        event = StripeEvent.objects.get()
+        self.assertTrue(event.verified)
+        self.assertEqual('acct_18ec5MFizJPFF3oA', event.user_id)
+
+    @fudge.patch('payments.utils.stripe.Event')
+    def test_unverified_event_is_retried_later(self, mock_event):
+        mock_event.expects('retrieve').raises(Exception('No such event'))
+        events.ingest(json.loads(payment_created))
+        self.assertEqual(0, events.process_pending(workers=1))
+
+        event = StripeEvent.objects.get()
+        self.assertFalse(event.verified)
+        self.assertEqual(1, event.attempts)
+        self.assertGreater(event.retry_after, timezone.now())
+        self.assertEqual([], events.claim_batch())
+        self.assertEqual(
+            [event], events.claim_batch(
+                now=event.retry_after + timedelta(seconds=1))
+        )
+
+
+class ArchiveTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        events.ingest(json.loads(payment_created))
+        events.ingest(json.loads(application_fee_created))
+        events.process_pending(workers=1)
+        StripeEvent.objects.update(
+            created=timezone.now() - timedelta(days=100))
+        # not verified yet, so it stays however old it is
+        events.ingest(dict(json.loads(payment_created), id='evt_new'))
+        StripeEvent.objects.filter(event_id='evt_new').update(
+            created=timezone.now() - timedelta(days=100))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_archive(self):
+        path, archived = events.archive(
+            timezone.now() - timedelta(days=90), self.directory,
+            batch_size=1
+        )
+        self.assertEqual(2, archived)
+        records = [json.loads(line) for line in gzip.open(path)]
+        self.assertEqual(
+            ['evt_00000000000000', 'evt_18lHxJFizJPFF3oAo6XPXCMA'],
+            [record['event_id'] for record in records]
+        )
+        # the package's Event.retrieve mock verified both as payment_created
+        self.assertEqual(json.loads(payment_created), records[1]['message'])
+        self.assertEqual(
+            ['evt_new'],
+            list(StripeEvent.objects.values_list('event_id', flat=True))
+        )
+
+    def test_archive_command_keeps_recent_events(self):
+        call_command('archive_stripe_events', '--days', '101',
+                     '--dir', self.directory)
+        self.assertEqual(3, StripeEvent.objects.count())
+
+    @override_settings(STRIPE_EVENT_ARCHIVE_DIR='')
+    def test_archive_command_needs_a_directory(self):
+        self.assertRaises(CommandError, call_command, 'archive_stripe_events',
+                          '--days', '0')
+        self.assertEqual(3, StripeEvent.objects.count())
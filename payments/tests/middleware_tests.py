@@ -0,0 +1,46 @@
+import fudge
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory
+from model_mommy import mommy
+
+from codesy.base.models import User
+from ..middleware import IdentityVerificationMiddleware
+from ..models import StripeAccount, identity_verified_cache_key
+
+from . import account_not_verified
+
+
+class IdentityVerificationMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(User)
+        cache.delete(identity_verified_cache_key(self.user.id))
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+        self.middleware = IdentityVerificationMiddleware()
+
+    @fudge.patch('payments.middleware.messages')
+    def test_unverified_user_is_warned_without_calling_stripe(
+            self, mock_messages):
+        mommy.make(StripeAccount, user=self.user, account_id='acct_1',
+                   verification=account_not_verified)
+        mock_messages.expects('warning').with_args(
+            self.request, 'stripe_info_verify')
+        with fudge.patch('payments.models.stripe.Account') as mock_account:
+            mock_account.provides('retrieve').times_called(0)
+            self.middleware.process_request(self.request)
+
+    @fudge.patch('payments.middleware.messages')
+    def test_user_without_account_is_not_warned(self, mock_messages):
+        mock_messages.provides('warning').times_called(0)
+        self.middleware.process_request(self.request)
+        self.assertFalse(StripeAccount.objects.exists())
+
+    @fudge.patch('payments.middleware.messages')
+    def test_anonymous_user_is_not_checked(self, mock_messages):
+        mock_messages.provides('warning').times_called(0)
+        self.request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            self.middleware.process_request(self.request)
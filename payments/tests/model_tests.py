@@ -1,16 +1,18 @@
 import json
 
 
+from django.core.cache import cache
 from django.test import TestCase
 from model_mommy import mommy
 
 from ..models import (StripeAccount, StripeEvent, WebHookProcessor,
-                      AccountUpdatedProcessor)
+                      AccountUpdatedProcessor, cached_identity_verified,
+                      identity_verified_cache_key)
 from codesy.base.models import User
 
 
 from . import (
-    application_fee_created, balance_available, account_verified,
+    balance_available, account_verified,
     account_not_verified, payment_created, account_updated, setup_mock_account
 )
 
@@ -48,6 +50,23 @@ class StripeAccountTest(TestCase):
         setup_mock_account(verification=account_not_verified)
         self.assertFalse(account.identity_verified())
 
+    def test_cached_identity_verified(self):
+        user = mommy.make(User)
+        cache.delete(identity_verified_cache_key(user.id))
+        self.assertTrue(cached_identity_verified(user))
+
+        account = mommy.make(StripeAccount, user=user, account_id='acct_1',
+                             verification=account_not_verified)
+        # saving the account expires the cached answer
+        with self.assertNumQueries(1):
+            self.assertFalse(cached_identity_verified(user))
+        with self.assertNumQueries(0):
+            self.assertFalse(cached_identity_verified(user))
+
+        account.verification = account_verified
+        account.save()
+        self.assertTrue(cached_identity_verified(user))
+
     def test_fields_needed(self):
         account = mommy.make(StripeAccount)
         account.verification = account_not_verified
@@ -72,24 +91,26 @@ class StripeAccountTest(TestCase):
 
 class StripeEventTest(TestCase):
 
-    def test_event_with_userid(self):
-        event = mommy.make(
-            StripeEvent, message_text=json.loads(payment_created)
-        )
-        self.assertTrue(event.verified)
-        self.assertEqual(event.type, 'payment.created')
-        self.assertTrue(event.processed)
+    def test_save_does_not_call_stripe(self):
+        event = mommy.make(StripeEvent, message_text=payment_created)
+        self.assertFalse(event.verified)
+        self.assertIsNotNone(event.created)
 
-    def test_event_without_userid(self):
-        event = mommy.make(
-            StripeEvent, message_text=json.loads(application_fee_created)
-        )
+    def test_process(self):
+        event = mommy.make(StripeEvent, message_text='{}')
+        event.process(json.loads(payment_created))
+        event = StripeEvent.objects.get(event_id=event.event_id)
         self.assertTrue(event.verified)
         self.assertEqual(event.type, 'payment.created')
         self.assertTrue(event.processed)
 
-    def test_processed_failed(self):
-        pass
+    def test_process_unknown_type(self):
+        event = mommy.make(StripeEvent, message_text='{}')
+        message = json.loads(payment_created)
+        message['type'] = 'customer.created'
+        event.process(message)
+        self.assertTrue(event.verified)
+        self.assertFalse(event.processed)
 
 
 class WebhookTest(TestCase):
@@ -97,16 +118,13 @@ class WebhookTest(TestCase):
     def test_process_not_implemented(self):
         class test_hook(WebHookProcessor):
             pass
-        event = mommy.make(
-            StripeEvent, message_text=json.loads(balance_available)
-        )
+        event = mommy.make(StripeEvent, message_text=balance_available)
         with self.assertRaises(NotImplementedError):
             test_hook(event=event).process()
 
     def test_account_updated(self):
         account = mommy.make(StripeAccount, account_id='acct_00000000000000')
-        event = mommy.make(StripeEvent,
-                           message_text=json.loads('{"id": "evt_1"}'))
+        event = mommy.make(StripeEvent, message_text='{"id": "evt_1"}')
         # replace fake retrieved message
         event.message_text = account_updated
         AccountUpdatedProcessor(event=event).process()
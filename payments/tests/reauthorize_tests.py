@@ -0,0 +1,117 @@
+from datetime import timedelta
+from StringIO import StringIO
+
+import fudge
+from fudge.inspector import arg
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from model_mommy import mommy
+
+from auctions.models import Bid, Issue, Offer, OfferFee
+from codesy.base import jobs
+from codesy.base.models import Job, User
+
+from .. import reauthorize
+
+
+class ReauthorizeTest(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(User, stripe_customer='cus_1')
+        self.url = 'http://test.com/bug/123'
+        issue = mommy.make(Issue, url=self.url)
+        self.bid = mommy.make(Bid, user=self.user, url=self.url, issue=issue)
+        self.old_offers = [
+            mommy.make(Offer, user=self.user, bid=self.bid, amount=amount,
+                       charge_id='ch_%s' % amount)
+            for amount in (10, 20)
+        ]
+        Offer.objects.update(created=timezone.now() - timedelta(days=7))
+        self.new_offer = mommy.make(Offer, user=self.user, bid=self.bid,
+                                    amount=30, charge_id='ch_30')
+
+    def reauthorize(self, *args):
+        out = StringIO()
+        call_command('reauthorize', '6', *args, stdout=out, stderr=out)
+        return out.getvalue()
+
+    def test_reauthorize_replaces_expiring_offers(self):
+        with fudge.patch('payments.utils.stripe.Refund',
+                         'payments.utils.stripe.Charge') as (mock_refund,
+                                                             mock_charge):
+            (mock_refund.expects('create')
+                        .with_args(charge='ch_10',
+                                   idempotency_key=arg.any())
+                        .returns(fudge.Fake().has_attr(id='re_10'))
+                        .next_call()
+                        .with_args(charge='ch_20',
+                                   idempotency_key=arg.any())
+                        .returns(fudge.Fake().has_attr(id='re_20')))
+            (mock_charge.expects('create')
+                        .with_matching_args(capture=False,
+                                            customer='cus_1')
+                        .returns(fudge.Fake().has_attr(id='ch_new'))
+                        .times_called(2))
+            output = self.reauthorize('--workers', '1', '--rate-limit', '0')
+
+        self.assertIn('2 reauthorized', output)
+        for refund_id, old_offer in zip(['re_10', 're_20'], self.old_offers):
+            old_offer.refresh_from_db()
+            self.assertEqual(refund_id, old_offer.refund_id)
+            replacement = Offer.objects.get(
+                transaction_key=reauthorize.replacement_key(old_offer))
+            self.assertEqual(old_offer.amount, replacement.amount)
+            self.assertEqual('ch_new', replacement.charge_id)
+            self.assertTrue(replacement.api_success)
+            self.assertEqual(
+                2, OfferFee.objects.filter(offer=replacement).count())
+        self.new_offer.refresh_from_db()
+        self.assertEqual('', self.new_offer.refund_id)
+
+        job = Job.objects.get()
+        self.assertEqual(Job.DONE, job.status)
+        self.assertIn('"after_id": %s' % self.old_offers[1].id, job.args)
+        self.assertIn('already running or done', self.reauthorize())
+
+    def test_reauthorize_resumes_from_checkpoint(self):
+        expires = timezone.now() - timedelta(days=6)
+        job = jobs.enqueue('reauthorize', 'reauthorize-test',
+                           expires=expires.isoformat(),
+                           after_id=self.old_offers[0].id, workers=1)
+        with fudge.patch('payments.utils.stripe.Refund',
+                         'payments.utils.stripe.Charge') as (mock_refund,
+                                                             mock_charge):
+            (mock_refund.expects('create')
+                        .with_args(charge='ch_20',
+                                   idempotency_key='reauthorize-refund-%s' %
+                                   reauthorize.replacement_key(
+                                       self.old_offers[1]))
+                        .returns(fudge.Fake().has_attr(id='re_20')))
+            (mock_charge.expects('create')
+                        .with_matching_args(capture=False)
+                        .returns(fudge.Fake().has_attr(id='ch_new')))
+            jobs.run(jobs.claim_next(key=job.key))
+
+        self.assertEqual(
+            ['', 're_20'],
+            [Offer.objects.get(id=offer.id).refund_id
+             for offer in self.old_offers]
+        )
+
+    def test_failed_refund_keeps_offer(self):
+        with fudge.patch('payments.utils.stripe.Refund',
+                         'payments.utils.stripe.Charge') as (mock_refund,
+                                                             mock_charge):
+            (mock_refund.expects('create')
+                        .raises(Exception('No such charge')))
+            mock_charge.provides('create').times_called(0)
+            output = self.reauthorize('--workers', '1', '--rate-limit', '0')
+
+        self.assertIn('2 refunds failed', output)
+        for old_offer in self.old_offers:
+            old_offer.refresh_from_db()
+            self.assertEqual('', old_offer.refund_id)
+            self.assertEqual('No such charge', old_offer.error_message)
+        self.assertEqual(3, Offer.objects.count())
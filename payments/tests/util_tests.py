@@ -1,8 +1,16 @@
+import os
+import shutil
+import tempfile
 from decimal import Decimal
+from StringIO import StringIO
 
+import fudge
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
 
-from .. import utils
+from .. import fee_table, utils
 
 
 class PaymentAmountTest(TestCase):
@@ -116,3 +124,76 @@ class PaymentAmountTest(TestCase):
             self.assertEqual(values['payout_amount'], Decimal('47.72'))
             self.assertEqual(values['payout_stripe_fee'], Decimal('1.03'))
             self.assertEqual(values['actual_transfer_fee'], Decimal('0.24'))
+
+
+class FeeEngineTest(TestCase):
+
+    def assertMatchesTransactionAmounts(self, amount):
+        expected = utils.transaction_amounts(amount)
+        del expected['iterations']
+        self.assertEqual(expected, utils.fee_amounts(amount))
+
+    def test_fee_amounts_match_transaction_amounts(self):
+        for cents in range(0, 3000):
+            self.assertMatchesTransactionAmounts(Decimal(cents) / 100)
+
+    def test_fee_amounts_match_where_the_loop_does_not_settle(self):
+        # two solutions where the loop takes the lower (0.68) or the upper
+        # (5.31), or no solution at all (3.28, 9993.99)
+        for amount in ['0.68', '5.31', '3.28', '9993.99', '9999.99']:
+            self.assertMatchesTransactionAmounts(Decimal(amount))
+
+    def test_fee_amounts_for_int_and_fractional_cents(self):
+        self.assertMatchesTransactionAmounts(50)
+        self.assertMatchesTransactionAmounts(Decimal('10.005'))
+
+    def test_batch_transaction_cents(self):
+        columns = utils.batch_transaction_cents([1000, 5000])
+        self.assertEqual([1058, 5228], columns['charge_amount'])
+        self.assertEqual([942, 4772], columns['payout_amount'])
+        self.assertEqual([116, 456], columns['application_fee'])
+
+
+class FeeTableTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'fee_table.bin')
+        call_command('build_fee_table', path=self.path, max_cents=1200,
+                     stdout=StringIO())
+        self.table = fee_table.FeeTable(self.path)
+
+    def tearDown(self):
+        self.table.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_table_holds_every_amount(self):
+        self.assertEqual(1201, len(self.table))
+        for cents in range(0, 1201):
+            self.assertEqual(utils.solve_cents(cents),
+                             self.table.lookup(cents))
+
+    @fudge.patch('payments.utils.get_fee_table')
+    def test_transaction_cents_looks_up_the_table(self, mock_get_table):
+        mock_get_table.expects_call().returns(self.table)
+        self.assertEqual(
+            utils.transaction_cents(1000, table=False),
+            utils.transaction_cents(1000)
+        )
+        # amounts past the end of the table are solved
+        self.assertEqual(
+            utils.transaction_cents(5000, table=False),
+            utils.transaction_cents(5000)
+        )
+
+    def test_verify_fee_table(self):
+        call_command('verify_fee_table', path=self.path, every=7,
+                     stdout=StringIO())
+
+    def test_verify_fee_table_finds_bad_rows(self):
+        with open(self.path, 'r+b') as f:
+            f.seek(fee_table.HEADER.size + fee_table.ROW.size * 1000)
+            f.write(fee_table.ROW.pack(0, 0))
+        with self.assertRaises(CommandError):
+            call_command('verify_fee_table', path=self.path, every=10,
+                         stdout=StringIO(), stderr=StringIO())
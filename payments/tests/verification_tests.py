@@ -0,0 +1,70 @@
+import json
+
+import fudge
+
+from django.core.cache import cache
+from django.test import TestCase
+from model_mommy import mommy
+
+from codesy.base.models import Notification, User
+from ..models import (StripeAccount, cached_identity_verified,
+                      identity_verified_cache_key)
+from .. import verification
+
+from . import account_not_verified, account_verified
+
+
+def stripe_account(account_id, verification_json):
+    return fudge.Fake().has_attr(
+        id=account_id, verification=json.loads(verification_json))
+
+
+def page(accounts, has_more=False):
+    return fudge.Fake().has_attr(data=accounts, has_more=has_more)
+
+
+class SyncVerificationTest(TestCase):
+
+    def setUp(self):
+        self.unchanged = mommy.make(
+            StripeAccount, account_id='acct_1', verification=account_verified,
+            user=mommy.make(User, email='one@test.com'))
+        self.changed = mommy.make(
+            StripeAccount, account_id='acct_2', verification=account_verified,
+            user=mommy.make(User, email='two@test.com'))
+        mommy.make(StripeAccount, account_id='')
+        cache.delete(identity_verified_cache_key(self.changed.user_id))
+        self.assertTrue(cached_identity_verified(self.changed.user))
+
+    @fudge.patch('payments.verification.stripe.Account')
+    def test_sync_writes_and_emails_only_changed_accounts(self, mock_account):
+        first_page = page([
+            stripe_account('acct_1', account_verified),
+            stripe_account('acct_9', account_not_verified),
+        ], has_more=True)
+        last_page = page([stripe_account('acct_2', account_not_verified)])
+        (mock_account.expects('list')
+                     .with_args(limit=2)
+                     .returns(first_page)
+                     .next_call()
+                     .with_args(limit=2, starting_after='acct_9')
+                     .returns(last_page))
+        stats = verification.sync_verification(page_size=2)
+
+        self.assertEqual({'listed': 3, 'changed': 1, 'emailed': 1}, stats)
+        changed = StripeAccount.objects.get(id=self.changed.id)
+        self.assertEqual(json.loads(account_not_verified),
+                         json.loads(changed.verification))
+        unchanged = StripeAccount.objects.get(id=self.unchanged.id)
+        self.assertEqual(account_verified, unchanged.verification)
+        self.assertFalse(cached_identity_verified(self.changed.user))
+
+        email = Notification.objects.get()
+        self.assertEqual('two@test.com', email.recipient)
+        self.assertEqual('123', json.loads(email.context)['expiration'])
+
+        # the same verification again is neither written nor emailed
+        mock_account.expects('list').returns(
+            page([stripe_account('acct_2', account_not_verified)]))
+        self.assertEqual({'listed': 1, 'changed': 0, 'emailed': 0},
+                         verification.sync_verification())
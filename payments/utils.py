@@ -1,7 +1,15 @@
+import logging
+import threading
+import time
 from decimal import Decimal, ROUND_HALF_UP
+from multiprocessing.pool import ThreadPool
 from django.conf import settings
 
 import stripe
+
+from . import fee_table as fee_table_file
+
+logger = logging.getLogger(__name__)
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 # codesy fee of 2.5% charged to offer and payout
@@ -147,6 +155,208 @@ def transaction_amounts(amount):
     }
 
 
+# The same fees as whole numbers: rates in thousandths, flat fee in cents.
+CODESY_RATE = int(codesy_pct * 1000)
+STRIPE_RATE = int(stripe_pct * 1000)
+STRIPE_FLAT = int(stripe_transaction * 100)
+STRIPE_TRANSFER_RATE = int(stripe_transfer_pct * 1000)
+
+# largest amount a bid can hold (max_digits=6, decimal_places=2), in cents;
+# the engine has been checked against transaction_amounts up to here
+MAX_CENTS = 999999
+
+# fee components computed by transaction_cents, all in integer cents
+CENT_FIELDS = (
+    'charge_amount', 'payout_amount', 'codesy_fee', 'total_stripe_fee',
+    'offer_stripe_fee', 'payout_stripe_fee', 'charge_stripe_fee',
+    'gross_transfer_fee', 'actual_transfer_fee', 'offer_fee', 'payout_fee',
+    'application_fee', 'payout_alt_calc', 'payout_overage',
+    'miscalculation_of_total_stripe_fee',
+)
+
+
+def round_thousandths(n):
+    # n / 1000 rounded like round_penny: halves away from zero
+    if n < 0:
+        return -((500 - n) // 1000)
+    return (n + 500) // 1000
+
+
+def charge_stripe_cents(charge):
+    return round_thousandths(charge * STRIPE_RATE + STRIPE_FLAT * 1000)
+
+
+def transfer_stripe_cents(payout):
+    return round_thousandths(payout * STRIPE_TRANSFER_RATE)
+
+
+def _fees_for(cents, half_codesy, fee):
+    # the total fee transaction_amounts gets from the charge and payout
+    # that split `fee` around `cents`
+    return (2 * half_codesy +
+            charge_stripe_cents(cents + (fee + 1) // 2) +
+            transfer_stripe_cents(cents - fee // 2))
+
+
+def _iterate_cents(cents, half_codesy):
+    # transaction_amounts' loop, in integer cents
+    calc_charge = calc_payout = 0
+    for iteration in range(0, 11):
+        charge_guess, payout_guess = calc_charge, calc_payout
+        fee = (2 * half_codesy + charge_stripe_cents(charge_guess) +
+               transfer_stripe_cents(payout_guess))
+        calc_charge = cents + (fee + 1) // 2
+        calc_payout = calc_charge - fee
+        if (charge_guess, payout_guess) == (calc_charge, calc_payout):
+            break
+    return charge_guess, payout_guess
+
+
+def _solve_cents(cents, half_codesy):
+    """
+    The charge and payout for cents, solved directly.
+
+    transaction_amounts converges on a total fee F with
+    F == _fees_for(F), i.e. F = 2h + rp(C * 2.9% + 30c) + rp(T * 0.5%)
+    where C = A + F/2 and T = A - F/2. Ignoring the penny rounding that
+    gives F ~= (2h + 30c + 3.4% A) / 98.8%; from there F - _fees_for(F)
+    never decreases, so we walk to where it is zero. When exactly one F
+    solves it, that is where the loop ends up. When the rounding leaves
+    two solutions, or none (and the loop gives up after 11 rounds), the
+    answer depends on the loop's path, so we replay it.
+    """
+    fee = (2000 * half_codesy + (STRIPE_RATE + STRIPE_TRANSFER_RATE) *
+           cents + STRIPE_FLAT * 1000) * 2 // (
+        2000 - STRIPE_RATE + STRIPE_TRANSFER_RATE)
+    diff = fee - _fees_for(cents, half_codesy, fee)
+    step = -1 if diff > 0 else 1
+    while diff != 0:
+        fee += step
+        diff = fee - _fees_for(cents, half_codesy, fee)
+        if diff * step > 0:
+            # jumped over zero: no fixed point
+            return _iterate_cents(cents, half_codesy)
+    if (_fees_for(cents, half_codesy, fee - 1) == fee - 1 or
+            _fees_for(cents, half_codesy, fee + 1) == fee + 1):
+        return _iterate_cents(cents, half_codesy)
+    return cents + (fee + 1) // 2, cents - fee // 2
+
+
+def solve_cents(cents):
+    """
+    The (charge, payout) for cents, without the fee table.
+    """
+    return _solve_cents(cents, round_thousandths(cents * CODESY_RATE))
+
+
+_fee_table = None
+_fee_table_loaded = False
+_fee_table_lock = threading.Lock()
+
+
+def get_fee_table():
+    """
+    The table built by build_fee_table, mapped on first use; None if it
+    hasn't been built.
+    """
+    global _fee_table, _fee_table_loaded
+    if not _fee_table_loaded:
+        with _fee_table_lock:
+            if not _fee_table_loaded:
+                try:
+                    _fee_table = fee_table_file.FeeTable(
+                        settings.FEE_TABLE_PATH)
+                except (IOError, OSError, ValueError) as e:
+                    logger.info("No fee table, solving fees instead: %s" % e)
+                _fee_table_loaded = True
+    return _fee_table
+
+
+def transaction_cents(cents, table=True):
+    """
+    transaction_amounts for a whole number of cents from 0 to MAX_CENTS, as
+    a dict of CENT_FIELDS in integer cents.
+
+    The charge and payout come from the fee table when there is one (and
+    table isn't False), so this is a lookup plus a few integer operations.
+    """
+    fees = get_fee_table() if table else None
+    if fees is not None and cents in fees:
+        return cents_details(cents, *fees.lookup(cents))
+    return cents_details(cents, *solve_cents(cents))
+
+
+def cents_details(cents, charge_amount, payout_amount):
+    """
+    All of the CENT_FIELDS for an amount, given its charge and payout.
+    """
+    half_codesy = round_thousandths(cents * CODESY_RATE)
+    charge_stripe_fee = charge_stripe_cents(charge_amount)
+    transfer_stripe_fee = transfer_stripe_cents(payout_amount)
+    application_fee = (2 * half_codesy + charge_stripe_fee +
+                       transfer_stripe_fee)
+    offer_fee = (application_fee + 1) // 2
+    payout_fee = application_fee - offer_fee
+    payout_alt_calc = charge_amount - application_fee
+    return {
+        'charge_amount': charge_amount,
+        'payout_amount': payout_amount,
+        'codesy_fee': half_codesy,
+        'total_stripe_fee': charge_stripe_fee + transfer_stripe_fee,
+        'offer_stripe_fee': offer_fee - half_codesy,
+        'payout_stripe_fee': payout_fee - half_codesy,
+        'charge_stripe_fee': charge_stripe_fee,
+        'gross_transfer_fee': transfer_stripe_cents(payout_alt_calc),
+        'actual_transfer_fee': transfer_stripe_fee,
+        'offer_fee': offer_fee,
+        'payout_fee': payout_fee,
+        'application_fee': application_fee,
+        'payout_alt_calc': payout_alt_calc,
+        'payout_overage': payout_alt_calc - payout_amount,
+        'miscalculation_of_total_stripe_fee': 0,
+    }
+
+
+def batch_transaction_cents(amounts):
+    """
+    transaction_cents for many amounts at once. amounts is any iterable of
+    whole cents (a list, an array.array, a numpy array...); returns a dict
+    of CENT_FIELDS, each a list of integer cents in the same order.
+    """
+    columns = dict((field, []) for field in CENT_FIELDS)
+    for cents in amounts:
+        details = transaction_cents(int(cents))
+        for field in CENT_FIELDS:
+            columns[field].append(details[field])
+    return columns
+
+
+def fee_amounts(amount):
+    """
+    transaction_amounts without the Decimal iteration: the same dict, minus
+    the 'iterations' count. Amounts that aren't a whole number of cents
+    between 0 and MAX_CENTS go through transaction_amounts.
+    """
+    cents = Decimal(amount) * 100
+    if (not 0 <= cents <= MAX_CENTS or
+            cents != cents.to_integral_value()):
+        details = transaction_amounts(amount)
+        del details['iterations']
+        return details
+    return cents_to_amounts(amount, transaction_cents(int(cents)))
+
+
+def cents_to_amounts(amount, details):
+    """
+    A transaction_cents dict in dollars, like transaction_amounts.
+    """
+    amounts = dict(
+        (field, Decimal(value).scaleb(-2)) for field, value in details.items()
+    )
+    amounts['amount'] = amount
+    return amounts
+
+
 def refund(offer):
     try:
         refund = stripe.Refund.create(
@@ -182,34 +392,172 @@ def authorize(offer):
     offer.save()
 
 
-def charge(offer, payout):
-    details = transaction_amounts(payout.amount)
-
+class PayoutJob(object):
+    """
+    The Stripe calls that pay one offer out to a claimant: refund the
+    offer's authorization (unless refund_id says that's done), then charge
+    the offerer's share with the application fee going to codesy.
+
+    Both calls carry idempotency keys derived from key, so running a job
+    again after a timeout or crash returns the original result instead of
+    refunding or charging twice. run() makes no database queries, so jobs
+    can run on any thread.
+    """
+    calls = 2
+
+    def __init__(self, key, customer, destination, amount, description,
+                 metadata, authorization_id=u'', refund_id=u''):
+        details = fee_amounts(amount)
+        self.key = key
+        self.customer = customer
+        self.destination = destination
+        self.charge_amount = int(details['charge_amount'] * 100)
+        self.application_fee = int(details['application_fee'] * 100)
+        self.description = description
+        self.metadata = metadata
+        self.authorization_id = authorization_id
+        self.refund_id = refund_id
+        self.charge_id = u''
+        self.error_message = u''
+
+    def run(self):
+        try:
+            if not self.refund_id:
+                refund = stripe.Refund.create(
+                    charge=self.authorization_id,
+                    idempotency_key='refund-%s' % self.key,
+                )
+                self.refund_id = refund.id
+            charge = stripe.Charge.create(
+                customer=self.customer,
+                destination=self.destination,
+                amount=self.charge_amount,
+                currency="usd",
+                description=self.description,
+                metadata=self.metadata,
+                application_fee=self.application_fee,
+                idempotency_key='charge-%s' % self.key,
+            )
+            self.charge_id = charge.id
+        except Exception as e:
+            self.error_message = unicode(e)
+        return self
+
+
+class ReauthorizeJob(object):
+    """
+    The Stripe calls that renew an offer's authorization before it
+    expires: refund the old authorization, then authorize the same charge
+    again. Like PayoutJob, both calls carry idempotency keys derived from
+    key and run() makes no database queries.
+    """
+    calls = 2
+
+    def __init__(self, key, customer, authorization_id, amount, description,
+                 metadata):
+        self.key = key
+        self.customer = customer
+        self.authorization_id = authorization_id
+        self.charge_amount = int(fee_amounts(amount)['charge_amount'] * 100)
+        self.description = description
+        self.metadata = metadata
+        self.refund_id = u''
+        self.charge_id = u''
+        self.error_message = u''
+
+    def run(self):
+        try:
+            refund = stripe.Refund.create(
+                charge=self.authorization_id,
+                idempotency_key='reauthorize-refund-%s' % self.key,
+            )
+            self.refund_id = refund.id
+        except Exception as e:
+            self.error_message = unicode(e)
+            return self
+        try:
+            # setting 'capture' to false makes this an Authorization request
+            authorize = stripe.Charge.create(
+                amount=self.charge_amount,
+                currency="usd",
+                customer=self.customer,
+                description=self.description,
+                metadata=self.metadata,
+                capture=False,
+                idempotency_key='reauthorize-charge-%s' % self.key,
+            )
+            self.charge_id = authorize.id
+        except Exception as e:
+            self.error_message = unicode(e)
+        return self
+
+
+class EventRetrieveJob(object):
+    """
+    Retrieves a webhook's event from Stripe, which is how events are
+    verified. run() makes no database queries.
+    """
+    calls = 1
+
+    def __init__(self, event_id, account=u''):
+        self.key = event_id
+        self.account = account
+        self.event = None
+        self.error_message = u''
+
+    def run(self):
+        kwargs = {'id': self.key}
+        if self.account:
+            kwargs['stripe_account'] = self.account
+        try:
+            self.event = stripe.Event.retrieve(**kwargs)
+        except Exception as e:
+            self.error_message = unicode(e)
+        return self
+
+
+class RateLimit(object):
+    """
+    Spaces calls out across threads so there are at most per_second of
+    them; a falsy per_second means no limit.
+    """
+    def __init__(self, per_second=None):
+        self.interval = 1.0 / per_second if per_second else 0
+        self.lock = threading.Lock()
+        self.next_at = 0
+
+    def wait(self, calls=1):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval * calls
+        if at > now:
+            time.sleep(at - now)
+
+
+def run_stripe_jobs(jobs, workers=None, rate_limit=None):
+    """
+    Run PayoutJobs, ReauthorizeJobs or EventRetrieveJobs on at most workers
+    (PAYOUT_WORKERS) threads, making at most rate_limit Stripe calls per
+    second, and yield each job as it finishes.
+    """
+    workers = min(workers or settings.PAYOUT_WORKERS, len(jobs))
+    limit = RateLimit(rate_limit)
+
+    def run(job):
+        limit.wait(job.calls)
+        return job.run()
+
+    if workers <= 1:
+        for job in jobs:
+            yield run(job)
+        return
+    pool = ThreadPool(processes=workers)
     try:
-        charge = stripe.Charge.create(
-            customer=offer.user.stripe_customer,
-            destination=payout.claim.user.account().account_id,
-            amount=int(details['charge_amount'] * 100),
-            currency="usd",
-            description="Payout for: " + offer.bid.url,
-            metadata={'bid_id': offer.bid.id},
-            application_fee=int(details['application_fee'] * 100)
-        )
-        if charge:
-            payout.charge_amount = details['payout_amount']
-            payout.charge_id = charge.id
-            payout.api_success = True
-            payout.save()
-
-            offer.api_success = True
-            offer.charge_id = charge.id
-            offer.save()
-
-            payout.claim.status = 'Paid'
-            payout.claim.save()
-        else:
-            offer.error_message = "Authorization failed, please try later"
-    except Exception as e:
-        print 'charge error: %s' % e.message
-        offer.error_message = e.message
-    offer.save()
+        for job in pool.imap_unordered(run, jobs):
+            yield job
+    finally:
+        pool.close()
+        pool.join()
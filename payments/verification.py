@@ -0,0 +1,112 @@
+"""
+Keeping StripeAccount.verification in step with Stripe.
+
+sync_verification() lists the connected accounts a page at a time and
+compares each one's verification with the stored copy as data, not as
+text. Only the accounts that changed are written, with one UPDATE per page,
+and the validation emails for them are queued in the outbox together.
+"""
+import hashlib
+import json
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, TextField, Value, When
+
+import stripe
+
+from codesy.base import outbox
+
+from .models import StripeAccount, identity_verified_cache_key
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+
+def account_pages(page_size=PAGE_SIZE):
+    """
+    Yield the connected accounts, page_size at a time.
+    """
+    page = stripe.Account.list(limit=page_size)
+    while True:
+        yield page.data
+        if not page.has_more or not page.data:
+            return
+        page = stripe.Account.list(limit=page_size,
+                                   starting_after=page.data[-1].id)
+
+
+def stored_verification(text):
+    try:
+        return json.loads(text) if text else None
+    except ValueError:
+        return None
+
+
+def validation_email(account_id, email, verification, text):
+    return outbox.notification(
+        'need-validation-%s-%s' % (
+            account_id, hashlib.md5(text.encode('utf-8')).hexdigest()),
+        'email/need_validation.html',
+        '[codesy] Account validation needed',
+        email,
+        expiration=verification.get('due_by'),
+    )
+
+
+def save_verifications(changed):
+    """
+    Write (id, user_id, text) verifications in one UPDATE.
+    """
+    StripeAccount.objects.filter(
+        id__in=[account_id for account_id, _, _ in changed]
+    ).update(verification=Case(
+        *[When(id=account_id, then=Value(text))
+          for account_id, _, text in changed],
+        output_field=TextField()
+    ))
+    cache.delete_many([
+        identity_verified_cache_key(user_id) for _, user_id, _ in changed
+    ])
+
+
+def sync_verification(page_size=PAGE_SIZE):
+    """
+    Store the verification of every connected account whose verification
+    changed, and email the ones that need more information. Returns counts
+    of listed, changed and emailed accounts.
+    """
+    ours = dict(
+        (account_id, (pk, user_id, verification, email))
+        for account_id, pk, user_id, verification, email in
+        StripeAccount.objects.exclude(account_id=u'').values_list(
+            'account_id', 'id', 'user_id', 'verification', 'user__email')
+    )
+    stats = {'listed': 0, 'changed': 0, 'emailed': 0}
+    for page in account_pages(page_size):
+        stats['listed'] += len(page)
+        changed = []
+        emails = []
+        for stripe_account in page:
+            if stripe_account.id not in ours:
+                continue
+            pk, user_id, stored, email = ours[stripe_account.id]
+            # round trip through json to compare plain data with plain data
+            text = json.dumps(stripe_account.verification)
+            verification = json.loads(text)
+            if verification == stored_verification(stored):
+                continue
+            changed.append((pk, user_id, text))
+            if verification and verification.get('fields_needed'):
+                emails.append(validation_email(
+                    stripe_account.id, email, verification, text))
+        if not changed:
+            continue
+        with transaction.atomic():
+            save_verifications(changed)
+            queued = outbox.queue(emails)
+        stats['changed'] += len(changed)
+        stats['emailed'] += len(queued)
+    return stats
@@ -11,7 +11,7 @@ from django.utils import timezone
 
 # stripe related:
 from codesy.base.models import User
-from .models import StripeEvent
+from . import events
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 import json
@@ -195,11 +195,6 @@ class VerifyIdentityView(CodesyRedirectView):
 class StripeHookView(CSRFExemptMixin, View):
 
     def post(self, *args, **kwargs):
-        message = json.loads(self.request.body)
-        event_id = message['id']
-
-        if not StripeEvent.objects.filter(event_id=event_id).exists():
-            new_event = StripeEvent(event_id=event_id, message_text=message)
-            new_event.save()
-
+        # verified and processed later by the process_stripe_events worker
+        events.ingest(json.loads(self.request.body))
         return HttpResponse()